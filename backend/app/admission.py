@@ -0,0 +1,205 @@
+"""
+Admission control for /predict.
+
+At most `max_concurrent` readings are processed at once; the rest wait in
+bounded per-level queues and are admitted highest escalation level first
+(FIFO within a level). Under overload, low-level readings are shed first.
+Each level has a latency budget, checked against two signals:
+
+- event-loop lag, sampled by `monitor_lag()`: scoring runs inline on the
+  loop, so requests waiting for the loop are the real queue. While the
+  lag exceeds a level's budget, readings at that level are rejected
+- the admission queue: a reading whose estimated queueing delay already
+  exceeds its budget is rejected immediately, one still queued at its
+  deadline is rejected then, and when the queues are full a new reading
+  displaces the newest queued reading of a lower level, or is rejected
+
+Rejections raise Overloaded carrying a Retry-After hint, so clients back
+off instead of piling onto the threadpool.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+# Levels above this (custom policies) share its queue
+MAX_LEVEL = 4
+
+# Queueing budget per escalation level (seconds)
+LEVEL_DEADLINE_SECONDS = {0: 0.25, 1: 0.5, 2: 1.0, 3: 2.0, 4: 2.0}
+MAX_QUEUED = 512
+
+# EWMA weight for the per-reading service time estimate
+SERVICE_TIME_ALPHA = 0.05
+
+# Event-loop lag sampling; a rise counts at once, a fall is smoothed
+LAG_SAMPLE_SECONDS = 0.05
+LAG_DECAY_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def concurrency_from_env() -> int:
+    raw = os.environ.get("NEURODRIVE_PREDICT_CONCURRENCY")
+    try:
+        return max(1, int(raw)) if raw else 8
+    except ValueError:
+        return 8
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = 8, max_queued: int = MAX_QUEUED):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.running = 0
+        # level -> FIFO of (future, deadline)
+        self.queues: Dict[int, Deque[Tuple[asyncio.Future, float]]] = {
+            level: deque() for level in range(MAX_LEVEL + 1)
+        }
+        self.queued = 0
+        self.service_time = 0.005
+        self.admitted = 0
+        self.shed: Dict[int, int] = {level: 0 for level in range(MAX_LEVEL + 1)}
+        self.loop_lag = 0.0
+        self._monitor: Optional[asyncio.Task] = None
+
+    def _ahead_of(self, level: int) -> int:
+        return sum(len(self.queues[l]) for l in range(level, MAX_LEVEL + 1))
+
+    def estimated_wait(self, level: int) -> float:
+        """Queueing delay for a new reading at `level`."""
+        if self.running < self.max_concurrent and not self._ahead_of(level):
+            return 0.0
+        return (self._ahead_of(level) + 1) * self.service_time / self.max_concurrent
+
+    def _retry_after(self) -> int:
+        wait = self.loop_lag + self.queued * self.service_time / self.max_concurrent
+        return max(1, math.ceil(wait))
+
+    def record_lag(self, lag: float):
+        if lag >= self.loop_lag:
+            self.loop_lag = lag
+        else:
+            self.loop_lag += LAG_DECAY_ALPHA * (lag - self.loop_lag)
+
+    async def monitor_lag(self, interval: float = LAG_SAMPLE_SECONDS):
+        """Samples how late the loop wakes a sleeping task, until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.record_lag(max(0.0, loop.time() - start - interval))
+
+    def start(self):
+        """Starts the lag monitor on the running loop (startup handler)."""
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.get_running_loop().create_task(self.monitor_lag())
+
+    def stop(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+
+    def _reject(self, level: int, reason: str) -> Overloaded:
+        self.shed[level] += 1
+        return Overloaded(self._retry_after(), reason)
+
+    def _displace(self, level: int) -> bool:
+        """Rejects the newest queued reading below `level`; False if none."""
+        for lower in range(0, level):
+            queue = self.queues[lower]
+            while queue:
+                fut, _ = queue.pop()
+                self.queued -= 1
+                if not fut.done():
+                    fut.set_exception(self._reject(lower, "Shed for a higher-risk driver"))
+                    return True
+        return False
+
+    def _wake_next(self):
+        now = time.monotonic()
+        for level in range(MAX_LEVEL, -1, -1):
+            queue = self.queues[level]
+            while queue:
+                fut, deadline = queue.popleft()
+                self.queued -= 1
+                if fut.done():
+                    continue
+                if now > deadline:
+                    fut.set_exception(self._reject(level, "Queue deadline exceeded"))
+                    continue
+                self.running += 1
+                fut.set_result(None)
+                return
+
+    async def _acquire(self, level: int):
+        level = max(0, min(MAX_LEVEL, level))
+        budget = LEVEL_DEADLINE_SECONDS[level]
+        if self.loop_lag > budget:
+            raise self._reject(level, "Event loop lag exceeds the latency budget")
+        if self.running < self.max_concurrent and not self._ahead_of(level):
+            self.running += 1
+            return
+        if self.estimated_wait(level) > budget:
+            raise self._reject(level, "Estimated wait exceeds the latency budget")
+        if self.queued >= self.max_queued and not self._displace(level):
+            raise self._reject(level, "Admission queue full")
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (fut, time.monotonic() + budget)
+        self.queues[level].append(entry)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), budget)
+        except BaseException as e:
+            admitted = fut.done() and not fut.cancelled() and fut.exception() is None
+            if not fut.done():
+                fut.cancel()
+                self.queues[level].remove(entry)
+                self.queued -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                if admitted:
+                    return   # woken just as the deadline passed
+                if fut.done() and not fut.cancelled():
+                    raise fut.exception()   # shed while we timed out
+                raise self._reject(level, "Queue deadline exceeded")
+            if admitted:
+                # Caller went away after being handed a slot
+                self._release(0.0)
+            raise
+
+    def _release(self, elapsed: float):
+        self.running -= 1
+        if elapsed:
+            self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+        self._wake_next()
+
+    @asynccontextmanager
+    async def slot(self, level: int):
+        """Holds one processing slot; raises Overloaded if shed."""
+        await self._acquire(level)
+        self.admitted += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "queued": {level: len(q) for level, q in self.queues.items()},
+            "service_time_ms": round(self.service_time * 1000, 2),
+            "loop_lag_ms": round(self.loop_lag * 1000, 2),
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+        }
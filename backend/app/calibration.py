@@ -0,0 +1,131 @@
+"""
+Robust EAR calibration.
+
+numpy is imported on first use so it does not count against worker
+start-up time.
+"""
+from typing import Optional
+
+MAX_CALIBRATION_SAMPLES = 1_000_000   # per phase (open / closed)
+MIN_CALIBRATION_SAMPLES = 5
+MAX_JSON_BYTES_PER_SAMPLE = 32        # "0.30000001192092896, " plus slack
+
+# Plausible EAR range; anything outside is a landmark failure
+EAR_VALID_MIN = 0.0
+EAR_VALID_MAX = 1.0
+
+# Samples further than this many robust sigmas (1.4826 * MAD) from the
+# median are dropped (looking at a mirror, missed landmarks, ...)
+OUTLIER_SIGMAS = 3.5
+TRIM_FRACTION = 0.1
+
+
+class CalibrationError(ValueError):
+    pass
+
+
+def _np():
+    import numpy
+    return numpy
+
+
+def as_samples(values) -> "numpy.ndarray":
+    np = _np()
+    arr = np.asarray(values, dtype=np.float64).ravel()
+    if arr.size > MAX_CALIBRATION_SAMPLES:
+        raise CalibrationError(
+            f"Too many samples ({arr.size}), max {MAX_CALIBRATION_SAMPLES}"
+        )
+    return arr
+
+
+def max_body_bytes(channels: int = 1) -> int:
+    """Largest raw float32 body decode_float32 accepts."""
+    return MAX_CALIBRATION_SAMPLES * 4 * max(channels, 1)
+
+
+def max_json_body_bytes() -> int:
+    """Largest JSON /calibrate body read before parsing (both phases)."""
+    return 2 * MAX_CALIBRATION_SAMPLES * MAX_JSON_BYTES_PER_SAMPLE
+
+
+def decode_float32(raw: bytes, channels: int = 1) -> "numpy.ndarray":
+    """
+    Little-endian float32 samples, `channels` values per frame
+    (1 = EAR, 2 = left/right EAR). Returns shape (frames, channels).
+    """
+    np = _np()
+    if channels not in (1, 2):
+        raise CalibrationError("channels must be 1 or 2")
+    if len(raw) % (4 * channels):
+        raise CalibrationError("Body is not a whole number of float32 frames")
+    arr = np.frombuffer(raw, dtype="<f4")
+    if arr.size // channels > MAX_CALIBRATION_SAMPLES:
+        raise CalibrationError(
+            f"Too many samples ({arr.size // channels}), max {MAX_CALIBRATION_SAMPLES}"
+        )
+    return arr.reshape(-1, channels)
+
+
+def robust_stats(samples) -> dict:
+    """
+    Baseline EAR for one phase: invalid values and MAD outliers are
+    rejected, then a trimmed mean is taken over what is left.
+    """
+    np = _np()
+    x = samples[np.isfinite(samples)]
+    x = x[(x > EAR_VALID_MIN) & (x < EAR_VALID_MAX)]
+    if x.size < MIN_CALIBRATION_SAMPLES:
+        raise CalibrationError(
+            f"Need at least {MIN_CALIBRATION_SAMPLES} valid samples, got {x.size}"
+        )
+
+    med = float(np.median(x))
+    mad = float(np.median(np.abs(x - med)))
+    if mad > 0:
+        x = x[np.abs(x - med) <= OUTLIER_SIGMAS * 1.4826 * mad]
+
+    x.sort()
+    k = int(x.size * TRIM_FRACTION)
+    trimmed = x[k:x.size - k] if x.size - 2 * k > 0 else x
+    p5, p50, p95 = np.percentile(x, [5, 50, 95])
+
+    return {
+        "baseline": float(trimmed.mean()),
+        "median": float(p50),
+        "p5": float(p5),
+        "p95": float(p95),
+        "std": float(x.std()),
+        "used": int(x.size),
+        "rejected": int(samples.size - x.size),
+    }
+
+
+def build_profile(open_samples, closed_samples,
+                  per_eye: Optional[dict] = None) -> dict:
+    """
+    Profile in the shape /predict expects, plus the stats behind it.
+    `per_eye` maps e.g. "open_left" -> samples for per-eye reporting.
+    """
+    open_stats = robust_stats(open_samples)
+    closed_stats = robust_stats(closed_samples)
+
+    open_avg = open_stats["baseline"]
+    closed_avg = closed_stats["baseline"]
+    if open_avg <= closed_avg:
+        raise CalibrationError("Open-eye EAR must be higher than closed-eye EAR")
+
+    stats = {"open": open_stats, "closed": closed_stats}
+    for name, samples in (per_eye or {}).items():
+        stats[name] = robust_stats(samples)
+
+    return {
+        "open_ear": open_avg,
+        "closed_ear": closed_avg,
+        "blink_low": closed_avg + 0.1 * (open_avg - closed_avg),
+        "blink_high": open_avg - 0.1 * (open_avg - closed_avg),
+        "ema_open": open_avg,
+        "ema_closed": closed_avg,
+        "source": "calibration",
+        "stats": stats,
+    }
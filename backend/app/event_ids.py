@@ -0,0 +1,211 @@
+"""
+Time-ordered compact event IDs.
+
+An ID is a 64-bit snowflake written as 16 lowercase hex digits:
+
+    42 bits  milliseconds since EPOCH_MS  (about 139 years)
+    10 bits  worker id                    (leased, see WorkerIdLease)
+    12 bits  sequence within the millisecond
+
+so IDs sort the same as strings and as numbers, by creation time. Making
+one takes a single clock read; the millisecond never goes backwards
+within a process, and a 4097th ID in one millisecond borrows the next.
+Older events carry uuid4 IDs, which have no time and are looked up the
+slow way.
+
+Worker ids must be unique among the workers sharing a snippet directory,
+or two workers can mint the same event ID and overwrite each other's
+snippets. Each worker leases its id in a SQLite table there: an explicit
+NEURODRIVE_WORKER_ID is checked against the live leases (a clash fails
+startup), otherwise the lowest free id is taken. Leases are renewed every
+LEASE_RENEW_SECONDS and lapse after WORKER_LEASE_SECONDS, so ids of dead
+workers are reused. Workers on different hosts with separate snippet
+directories must set NEURODRIVE_WORKER_ID themselves.
+"""
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+EPOCH_MS = 1_704_067_200_000    # 2024-01-01T00:00:00Z
+
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+ID_LENGTH = 16
+
+WORKER_LEASE_SECONDS = 60
+LEASE_RENEW_SECONDS = 15
+
+_WORKER_MASK = (1 << WORKER_BITS) - 1
+_SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+_TIME_SHIFT = WORKER_BITS + SEQUENCE_BITS
+_HEX = frozenset("0123456789abcdef")
+
+
+LEASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS worker_ids (
+    worker_id  INTEGER PRIMARY KEY,
+    owner      TEXT NOT NULL,
+    renewed_at REAL NOT NULL
+);
+"""
+
+
+class WorkerIdError(RuntimeError):
+    pass
+
+
+def worker_id_from_env() -> Optional[int]:
+    """NEURODRIVE_WORKER_ID, or None if unset; a bad value is an error."""
+    raw = os.environ.get("NEURODRIVE_WORKER_ID")
+    if not raw:
+        return None
+    try:
+        worker_id = int(raw)
+    except ValueError:
+        raise WorkerIdError(f"NEURODRIVE_WORKER_ID must be an integer, got {raw!r}")
+    if not 0 <= worker_id <= _WORKER_MASK:
+        raise WorkerIdError(f"NEURODRIVE_WORKER_ID must be between 0 and {_WORKER_MASK}")
+    return worker_id
+
+
+class WorkerIdLease:
+    def __init__(self, db_path: str, ttl: float = WORKER_LEASE_SECONDS,
+                 on_lost: Optional[Callable[[], None]] = None):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.on_lost = on_lost
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.worker_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        db.executescript(LEASE_SCHEMA)
+        return db
+
+    def claim(self, requested: Optional[int] = None) -> int:
+        """
+        Leases `requested`, or the lowest free id. Raises WorkerIdError if
+        another live worker holds `requested`, or every id is taken.
+        """
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            live = dict(db.execute(
+                "SELECT worker_id, owner FROM worker_ids WHERE renewed_at > ?",
+                (now - self.ttl,),
+            ))
+            if requested is not None:
+                if live.get(requested, self.owner) != self.owner:
+                    raise WorkerIdError(
+                        f"Worker id {requested} is already leased by {live[requested]}"
+                    )
+                worker_id = requested
+            else:
+                worker_id = next((i for i in range(_WORKER_MASK + 1) if i not in live), None)
+                if worker_id is None:
+                    raise WorkerIdError(f"All {_WORKER_MASK + 1} worker ids are leased")
+            db.execute(
+                "INSERT OR REPLACE INTO worker_ids (worker_id, owner, renewed_at) VALUES (?, ?, ?)",
+                (worker_id, self.owner, now),
+            )
+            db.execute("COMMIT")
+        finally:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            db.close()
+        self.worker_id = worker_id
+        return worker_id
+
+    def renew(self):
+        """Extends the lease; raises WorkerIdError if it was lost."""
+        db = self._connect()
+        try:
+            renewed = db.execute(
+                "UPDATE worker_ids SET renewed_at = ? WHERE worker_id = ? AND owner = ?",
+                (time.time(), self.worker_id, self.owner),
+            ).rowcount
+        finally:
+            db.close()
+        if not renewed:
+            raise WorkerIdError(f"Lease on worker id {self.worker_id} was lost")
+
+    def release(self):
+        db = self._connect()
+        try:
+            db.execute("DELETE FROM worker_ids WHERE owner = ?", (self.owner,))
+        finally:
+            db.close()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._loop, name="worker-id-lease", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.release()
+
+    def _loop(self):
+        while not self._stop.wait(LEASE_RENEW_SECONDS):
+            try:
+                self.renew()
+            except sqlite3.Error:
+                pass   # locked or busy: the lease outlasts a few misses
+            except WorkerIdError:
+                # Another worker took the id after renewals kept failing;
+                # stop minting IDs with it
+                self.worker_id = None
+                if self.on_lost is not None:
+                    self.on_lost()
+                return
+
+
+def is_compact_id(event_id: str) -> bool:
+    return len(event_id) == ID_LENGTH and _HEX.issuperset(event_id)
+
+
+def id_time(event_id: str) -> Optional[float]:
+    """Unix time (seconds) encoded in a compact ID, or None for other IDs."""
+    if not is_compact_id(event_id):
+        return None
+    return ((int(event_id, 16) >> _TIME_SHIFT) + EPOCH_MS) / 1000.0
+
+
+class EventIdGenerator:
+    def __init__(self, worker_id: Optional[int] = None,
+                 assign: Optional[Callable[[], int]] = None):
+        """`assign` supplies the worker id on first use if none is given."""
+        self.worker_id = worker_id
+        self.assign = assign
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> Tuple[str, float]:
+        """(event_id, unix time in seconds the ID encodes)."""
+        worker_id = self.worker_id
+        if worker_id is None:
+            if self.assign is None:
+                raise WorkerIdError("No worker id assigned")
+            worker_id = self.worker_id = self.assign()
+        now_ms = time.time_ns() // 1_000_000 - EPOCH_MS
+        with self._lock:
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                self._sequence = (self._sequence + 1) & _SEQUENCE_MASK
+                if self._sequence == 0:
+                    self._last_ms += 1
+            ms = self._last_ms
+            value = ms << _TIME_SHIFT | worker_id << SEQUENCE_BITS | self._sequence
+        return format(value, "016x"), (ms + EPOCH_MS) / 1000.0
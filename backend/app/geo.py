@@ -0,0 +1,122 @@
+"""
+Fatigue hotspot index on Web-Mercator (slippy map) tiles.
+
+Each located reading updates one tile per zoom level in [MIN_ZOOM, MAX_ZOOM],
+so a heatmap query at any of those zooms reads pre-aggregated tiles and
+never touches raw events.
+"""
+import math
+from typing import Dict, List, Tuple
+
+EARTH_RADIUS_M = 6371008.8
+
+MIN_ZOOM = 3
+MAX_ZOOM = 16          # ~600 m tiles at the equator
+MAX_TILES_PER_QUERY = 10000
+
+# Per-tile stats, stored as a flat list to keep tiles small
+COUNT, SCORE_SUM, SCORE_MAX, ALERTS, SAFE_STOPS = range(5)
+
+# zoom -> (x, y) -> stats
+tiles: Dict[int, Dict[Tuple[int, int], List[int]]] = {
+    z: {} for z in range(MIN_ZOOM, MAX_ZOOM + 1)
+}
+
+
+def tile_xy(lat: float, lng: float, zoom: int) -> Tuple[int, int]:
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    n = 1 << zoom
+    x = int((lng + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_center(x: int, y: int, zoom: int) -> Tuple[float, float]:
+    n = 1 << zoom
+    lng = (x + 0.5) / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) / n))))
+    return lat, lng
+
+
+def great_circle_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Haversine distance in metres."""
+    la1, la2 = math.radians(lat1), math.radians(lat2)
+    dla, dlo = la2 - la1, math.radians(lng2 - lng1)
+    h = math.sin(dla / 2) ** 2 + math.cos(la1) * math.cos(la2) * math.sin(dlo / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(math.sqrt(h), 1.0))
+
+
+def _record(lat: float, lng: float, score: int, alert: bool, safe_stop: bool):
+    # Compute the max-zoom tile once; coarser tiles are bit shifts of it
+    x, y = tile_xy(lat, lng, MAX_ZOOM)
+    for zoom in range(MAX_ZOOM, MIN_ZOOM - 1, -1):
+        shift = MAX_ZOOM - zoom
+        key = (x >> shift, y >> shift)
+        level = tiles[zoom]
+        stats = level.get(key)
+        if stats is None:
+            stats = [0, 0, 0, 0, 0]
+            level[key] = stats
+        if safe_stop:
+            stats[SAFE_STOPS] += 1
+            continue
+        stats[COUNT] += 1
+        stats[SCORE_SUM] += score
+        if score > stats[SCORE_MAX]:
+            stats[SCORE_MAX] = score
+        if alert:
+            stats[ALERTS] += 1
+
+
+def record_reading(lat: float, lng: float, score: int, alert: bool):
+    _record(lat, lng, score, alert, safe_stop=False)
+
+
+def record_safe_stop(lat: float, lng: float):
+    _record(lat, lng, 0, False, safe_stop=True)
+
+
+def heatmap(min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+            zoom: int) -> dict:
+    """
+    Tiles intersecting the bounding box at `zoom` (clamped to the indexed
+    range). Enumerates the box when it is small, otherwise filters the
+    populated tiles at that zoom, whichever touches fewer entries.
+    """
+    zoom = max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+    level = tiles[zoom]
+
+    x0, y0 = tile_xy(max_lat, min_lng, zoom)   # top-left
+    x1, y1 = tile_xy(min_lat, max_lng, zoom)   # bottom-right
+    box_size = (x1 - x0 + 1) * (y1 - y0 + 1)
+
+    if box_size <= len(level):
+        keys = (
+            (x, y)
+            for x in range(x0, x1 + 1)
+            for y in range(y0, y1 + 1)
+            if (x, y) in level
+        )
+    else:
+        keys = (k for k in level if x0 <= k[0] <= x1 and y0 <= k[1] <= y1)
+
+    out = []
+    for key in keys:
+        stats = level[key]
+        lat, lng = tile_center(key[0], key[1], zoom)
+        out.append({
+            "x": key[0],
+            "y": key[1],
+            "lat": round(lat, 6),
+            "lng": round(lng, 6),
+            "count": stats[COUNT],
+            "mean_score": round(stats[SCORE_SUM] / stats[COUNT], 2) if stats[COUNT] else None,
+            "max_score": stats[SCORE_MAX],
+            "alerts": stats[ALERTS],
+            "safe_stops": stats[SAFE_STOPS],
+        })
+        if len(out) >= MAX_TILES_PER_QUERY:
+            break
+
+    return {"zoom": zoom, "truncated": len(out) >= MAX_TILES_PER_QUERY, "tiles": out}
@@ -1,6 +1,8 @@
 
 import time
 
+from policy import DEFAULT_POLICY, EscalationPolicy
+
 # keep short-term memory of how long eyes stay closed
 _last_closed_time = 0.0
 _closed_duration = 0.0
@@ -41,13 +43,10 @@ def compute_fatigue_personalized(
     CLOSED_EAR = user_profile["ema_closed"]
 
     span = OPEN_EAR - CLOSED_EAR
+    if span <= 0:
+        return compute_fatigue_instant(eye_ratio, blink_count, head_tilt, yawn_ratio)
     eye_ratio = max(min(eye_ratio, OPEN_EAR), CLOSED_EAR)
 
-    # EWMA online adaptation
-    alpha = 0.02
-    user_profile["ema_open"] = (1 - alpha) * OPEN_EAR + alpha * eye_ratio
-    user_profile["ema_closed"] = (1 - alpha) * CLOSED_EAR + alpha * eye_ratio
-
     eye_closure = (OPEN_EAR - eye_ratio) / span
 
     score = int(eye_closure * 70)
@@ -64,6 +63,26 @@ def compute_fatigue_personalized(
     return min(score, 100)
 
 
+def adapt_profile_ema(user_profile: dict, eye_ratio: float) -> dict:
+    """
+    EWMA online adaptation of the profile's baselines. Returns an updated
+    copy and leaves `user_profile` as it was, for readers still using it.
+    """
+    OPEN_EAR = user_profile["ema_open"]
+    CLOSED_EAR = user_profile["ema_closed"]
+
+    span = OPEN_EAR - CLOSED_EAR
+    if span <= 0:
+        return user_profile
+    eye_ratio = max(min(eye_ratio, OPEN_EAR), CLOSED_EAR)
+
+    # Only pull the baseline on the reading's side of the midpoint,
+    # otherwise both converge and the span collapses
+    alpha = 0.02
+    if eye_ratio >= CLOSED_EAR + span / 2:
+        return {**user_profile, "ema_open": (1 - alpha) * OPEN_EAR + alpha * eye_ratio}
+    return {**user_profile, "ema_closed": (1 - alpha) * CLOSED_EAR + alpha * eye_ratio}
+
 
 def forecast_next_scores(recent_scores: list[int], steps: int = 5) -> list[float]:
     """
@@ -87,46 +106,21 @@ def forecast_next_scores(recent_scores: list[int], steps: int = 5) -> list[float
 
     return predictions
 
-def decide_escalation(level: int, score: int, forecast: list[float]):
+def decide_escalation(level: int, score: int, forecast: list[float], policy: EscalationPolicy = DEFAULT_POLICY):
     """
     Correct priority-based adaptive escalation:
     - Highest risk is checked first
     - Allows instant jump to critical levels
+    Thresholds come from the (precompiled) escalation policy.
     """
     predicted_risk = max(forecast) if forecast else score
-
-    # 🔴 EMERGENCY — immediate jump
-    if score >= 90 or predicted_risk >= 90:
-        return 4
-
-    # 🟠 CRITICAL — pull over immediately
-    if score >= 80 or predicted_risk >= 80:
-        return 3
-
-    # 🟡 HIGH — vibration
-    if score >= 65 or predicted_risk >= 70:
-        return 2
-
-    # 🔵 MODERATE — gentle alert
-    if score >= 50 or predicted_risk >= 60:
-        return 1
-
-    # 🟢 SAFE — reset
-    return 0
+    return policy.level_for(score, predicted_risk)
 
 
 
-def escalation_action(level: int):
+def escalation_action(level: int, policy: EscalationPolicy = DEFAULT_POLICY):
     """
-    Maps escalation level to physical/logical action.
+    Maps escalation level to physical/logical action (levels above the
+    policy's highest get its last action).
     """
-    if level == 0:
-        return "✅ Normal monitoring"
-    elif level == 1:
-        return "🔊 Gentle audio alert"
-    elif level == 2:
-        return "📳 Trigger vibration"
-    elif level == 3:
-        return "🚨 Strong alert + instruct to pull over"
-    elif level == 4:
-        return "📞 Notify emergency contact"
+    return policy.action(level)
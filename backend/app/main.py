@@ -1,89 +1,335 @@
-
-
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from models import DriverData, TimelineEvent, SnippetMeta, EmergencyContact
+from fastapi import (
+    APIRouter, BackgroundTasks, Depends, FastAPI, UploadFile, File, HTTPException, Header, Query,
+    Request,
+)
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
 from datetime import datetime
-from typing import List, Dict
-import uuid
+from typing import Deque, List, Dict, Optional
+from collections import deque
+import asyncio
 import time
 import os
-import secrets
-from cryptography.fernet import Fernet
-from twilio.rest import Client 
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from logic import (
     compute_fatigue_instant,
     compute_fatigue_personalized,
     forecast_next_scores,
     decide_escalation,
-    escalation_action
+    escalation_action,
+    adapt_profile_ema,
 )
-from dotenv import load_dotenv
-load_dotenv()
-
-
-from cryptography.fernet import Fernet
-import requests
-
-from datetime import datetime
+from policy import get_policy, reload_policies, start_policy_reloader
+from sketch import EarSketch
+from sessions import DriverSession, SessionRegistry
+from risk_index import MAX_TOP_K, AtRiskIndex
+import poi
+from prefetch import SafeStopCache, should_prefetch
+from geo import great_circle_m, heatmap, record_reading, record_safe_stop
+from calibration import (
+    CalibrationError, as_samples, build_profile, decode_float32, max_body_bytes,
+    max_json_body_bytes,
+)
+from snippet_store import CHUNK_SIZE, SnippetStore
+from retention import RetentionManager, snippet_priority
+from uploads import UploadError, UploadManager
+from share_tokens import (
+    DEFAULT_TTL_SECONDS, MAX_TTL_SECONDS, SCOPE_CONTENT, SCOPE_META, SCOPES,
+    ShareTokenError, ShareTokens,
+)
+from admission import AdmissionController, Overloaded, concurrency_from_env
+from sequencing import ReadingSequencer, SequenceError
+from timer_wheel import DeadlineScheduler
+from event_ids import EventIdGenerator, WorkerIdLease, worker_id_from_env
+from profiling import MAX_PROFILE_SECONDS, AllocationTracer, CpuSampler, ProfilerBusy
+from serialization import events_response, json_response, rows_response, invalidate_event
 from models import (
     DriverData,
+    CalibrationSamples,
     TimelineEvent,
     SnippetMeta,
+    SnippetUploadRequest,
     EmergencyContact,
     SafeStopRequest,
     SafeStopPlace,
 )
 
+# Heavy clients (cryptography, twilio, requests) are imported and built on
+# first use via the get_* helpers below, so worker start-up only pays for
+# FastAPI itself.
 
+router = APIRouter()
 
-# --- ADAPTIVE ESCALATION STATE (per user) ---
-driver_escalation_state: Dict[str, dict] = {}
-
-# --- PERSONALIZED PROFILES (in-memory for now) ---
-user_profiles: Dict[str, dict] = {}
-
-app = FastAPI(title="NeuroDrive Backend")
-# --- EMERGENCY CONTACTS (per user) ---
-emergency_contacts: Dict[str, List[dict]] = {}   # user_id -> list of {phone_number, name}
-last_emergency_sms: Dict[str, float] = {}        # user_id -> last-sent timestamp
 EMERGENCY_COOLDOWN_SECONDS = 5                 # 5 minutes cooldown between SMS for same user
 
 # In-memory stores
-alerts: List[dict] = []
-fatigue_history: List[dict] = []           # legacy / simple list
-driver_timeline: Dict[str, List[dict]] = {}  # user_id -> list of events
+ALERTS_SIZE = 1000
+alerts: Deque[dict] = deque(maxlen=ALERTS_SIZE)
 incident_snippets: Dict[str, dict] = {}      # event_id -> snippet meta
 
 
-# --- SNIPPET STORAGE / ENCRYPTION ---
-SNIPPETS_DIR = "snippets"
-os.makedirs(SNIPPETS_DIR, exist_ok=True)
+# Live top-K of at-risk drivers, updated on every reading
+at_risk_index = AtRiskIndex()
+
+
+# --- FLEET-WIDE HISTORY ---
+# The driver timelines own the events. /history only needs the newest
+# HISTORY_SIZE of them (the same dicts the timelines hold) and /summary
+# only running totals, so packing an idle driver frees its events.
+HISTORY_SIZE = 50
+fatigue_history: Deque[dict] = deque(maxlen=HISTORY_SIZE)
+history_totals = {"records": 0, "score_sum": 0, "max_score": 0, "alerts": 0}
+_history_lock = threading.Lock()
+
+
+def record_history(event_record: dict):
+    with _history_lock:
+        fatigue_history.append(event_record)
+        history_totals["records"] += 1
+        history_totals["score_sum"] += event_record["fatigue_score"]
+        history_totals["max_score"] = max(history_totals["max_score"], event_record["fatigue_score"])
+        if event_record["status"] == "alert":
+            history_totals["alerts"] += 1
+
+
+def _session_evicted(session: DriverSession):
+    at_risk_index.remove(session.user_id)
+    unwatch_driver(session.user_id)
+    for e in session.events():
+        invalidate_event(e["event_id"])
+
+
+def _session_rehydrated(session: DriverSession):
+    """
+    Unpacking copies the driver's events. Points the timeline back at the
+    dicts /history still holds, so both keep showing one object, and
+    re-syncs snippet flags with clips deleted while the driver was packed.
+    """
+    index = session.timeline
+    if index is None:
+        return
+    with _history_lock:
+        recent = [e for e in fatigue_history if e["user_id"] == session.user_id]
+    for e in recent:
+        index.replace(e)
+    for e in index.events:
+        if e["has_snippet"] and e["event_id"] not in incident_snippets:
+            e["has_snippet"] = False
 
-# NOTE: in production, read key from env instead of generating each run
-ENCRYPTION_KEY = os.environ.get("NEURODRIVE_SNIPPET_KEY") or Fernet.generate_key()
-fernet = Fernet(ENCRYPTION_KEY)
+
+# --- PER-DRIVER STATE ---
+# Escalation state, profile, emergency contacts, timeline, EAR sketch,
+# rollups and last position, one session per driver. Idle drivers are
+# packed away by a background thread and unpacked on their next request.
+driver_sessions = SessionRegistry(on_evict=_session_evicted, on_rehydrate=_session_rehydrated)
+
+
+def driver_events(user_id: str) -> List[dict]:
+    session = driver_sessions.get(user_id)
+    return session.events() if session is not None else []
+
+
+def driver_event(user_id: str, event_id: str) -> Optional[dict]:
+    session = driver_sessions.get(user_id)
+    if session is None or session.timeline is None:
+        return None
+    return session.timeline.get(event_id)
+
+
+_init_lock = threading.Lock()
 
 # --- SNIPPET STORAGE / ENCRYPTION ---
 SNIPPETS_DIR = "snippets"
-os.makedirs(SNIPPETS_DIR, exist_ok=True)
+_snippet_store: Optional[SnippetStore] = None
+
+
+def get_snippet_store() -> SnippetStore:
+    """
+    Encrypted, deduplicating snippet store, created on first use.
+    NOTE: in production, set NEURODRIVE_SNIPPET_KEY instead of generating
+    a key each run.
+    """
+    global _snippet_store
+    if _snippet_store is None:
+        with _init_lock:
+            if _snippet_store is None:
+                env_key = os.environ.get("NEURODRIVE_SNIPPET_KEY")
+                master = env_key.encode() if env_key else os.urandom(32)
+                _snippet_store = SnippetStore(SNIPPETS_DIR, master)
+    return _snippet_store
+
+
+WORKER_IDS_DB = "workers.sqlite"
+_worker_lease: Optional[WorkerIdLease] = None
+
+
+def assign_worker_id() -> int:
+    """
+    Leases this worker's event-ID worker id among the workers sharing
+    SNIPPETS_DIR (startup handler; also runs on first use). Raises
+    WorkerIdError if NEURODRIVE_WORKER_ID is held by a live worker.
+    """
+    global _worker_lease
+    with _init_lock:
+        if _worker_lease is None or _worker_lease.worker_id is None:
+            os.makedirs(SNIPPETS_DIR, exist_ok=True)
+            lease = WorkerIdLease(
+                os.path.join(SNIPPETS_DIR, WORKER_IDS_DB),
+                on_lost=lambda: setattr(event_ids, "worker_id", None),
+            )
+            lease.claim(worker_id_from_env())
+            lease.start()
+            _worker_lease = lease
+        event_ids.worker_id = _worker_lease.worker_id
+    return _worker_lease.worker_id
+
+
+def release_worker_id():
+    global _worker_lease
+    with _init_lock:
+        if _worker_lease is not None:
+            _worker_lease.stop()
+            _worker_lease = None
+            event_ids.worker_id = None
+
+
+# Time-ordered event IDs; these also give the event's timeline time
+event_ids = EventIdGenerator(assign=assign_worker_id)
+
+
+_retention: Optional[RetentionManager] = None
+
+
+def get_retention() -> RetentionManager:
+    """Quota/age sweeper for the snippet store (NEURODRIVE_SNIPPET_QUOTA_BYTES)."""
+    global _retention
+    store = get_snippet_store()
+    if _retention is None:
+        with _init_lock:
+            if _retention is None:
+                _retention = RetentionManager(store, on_evict=forget_snippets)
+    return _retention
+
+
+_share_tokens: Optional[ShareTokens] = None
+
+
+def get_share_tokens() -> ShareTokens:
+    """Signs and verifies snippet share tokens (key derived from the snippet key)."""
+    global _share_tokens
+    store = get_snippet_store()
+    if _share_tokens is None:
+        with _init_lock:
+            if _share_tokens is None:
+                _share_tokens = ShareTokens(store.share_key, store)
+    return _share_tokens
+
+
+def forget_snippets(event_ids: List[str]):
+    """
+    Retention callback: drops metadata for clips that were deleted.
+    Packed drivers are left packed; their flags are fixed on rehydration.
+    """
+    for event_id in event_ids:
+        meta = incident_snippets.pop(event_id, None)
+        if meta is None:
+            continue
+        session = driver_sessions.peek(meta["user_id"])
+        if session is not None and session.timeline is not None:
+            e = session.timeline.get(event_id)
+        else:
+            with _history_lock:
+                e = next((r for r in fatigue_history if r["event_id"] == event_id), None)
+        if e is not None:
+            e["has_snippet"] = False
+            invalidate_event(event_id)
+
+
+def start_snippet_retention():
+    """
+    Restores snippet metadata from the store's index and starts the
+    retention thread. Runs in the background so start-up stays fast.
+    """
+    def run():
+        for event_id, meta in get_snippet_store().snippet_meta():
+            incident_snippets.setdefault(event_id, meta)
+        get_retention().start()
+
+    threading.Thread(target=run, name="snippet-retention-init", daemon=True).start()
 
-ENCRYPTION_KEY = os.environ.get("NEURODRIVE_SNIPPET_KEY") or Fernet.generate_key()
-fernet = Fernet(ENCRYPTION_KEY)
 
 # --- TWILIO CONFIG ---
-TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
-TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
-TWILIO_FROM_NUMBER = os.environ.get("TWILIO_FROM_NUMBER")
+_twilio_client = None
+_twilio_checked = False
+
+
+def get_twilio_client():
+    """
+    Twilio client from TWILIO_ACCOUNT_SID / TWILIO_AUTH_TOKEN, or None if
+    not configured. Built once, on the first SMS.
+    """
+    global _twilio_client, _twilio_checked
+    if not _twilio_checked:
+        with _init_lock:
+            if not _twilio_checked:
+                sid = os.environ.get("TWILIO_ACCOUNT_SID")
+                token = os.environ.get("TWILIO_AUTH_TOKEN")
+                if sid and token:
+                    try:
+                        from twilio.rest import Client
+                        _twilio_client = Client(sid, token)
+                    except Exception:
+                        _twilio_client = None  # Fail safe: app should still run without SMS
+                _twilio_checked = True
+    return _twilio_client
 
-twilio_client = None
-if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
-    try:
-        twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-    except Exception:
-        twilio_client = None  # Fail safe: app should still run without SMS
 
 # --- GOOGLE MAPS CONFIG ---
-GOOGLE_MAPS_API_KEY = os.environ.get("GOOGLE_MAPS_API_KEY")
+PLACES_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+_places_session = None
+
+
+def get_places_session():
+    """Shared HTTP session (connection pooling) for Places calls."""
+    global _places_session
+    if _places_session is None:
+        with _init_lock:
+            if _places_session is None:
+                import requests
+                _places_session = requests.Session()
+    return _places_session
+
+
+def _maps_url(lat, lng, place_id: Optional[str] = None) -> str:
+    url = f"https://www.google.com/maps/search/?api=1&query={lat},{lng}"
+    if place_id:
+        url += f"&query_place_id={place_id}"
+    return url
+
+
+def _merge_safe_stops(local: List[SafeStopPlace], remote: List[SafeStopPlace],
+                      max_results: int) -> List[SafeStopPlace]:
+    """
+    Local results first, topped up with remote places that aren't the same
+    spot (same place_id or within ~30 m).
+    """
+    merged = list(local)
+    for r in remote:
+        if len(merged) >= max_results:
+            break
+        duplicate = any(
+            (r.place_id and r.place_id == m.place_id)
+            or (abs(r.lat - m.lat) < 0.0003 and abs(r.lng - m.lng) < 0.0003)
+            for m in merged
+        )
+        if not duplicate:
+            merged.append(r)
+    return merged[:max_results]
 
 
 def find_safe_stops(
@@ -93,12 +339,28 @@ def find_safe_stops(
     max_results: int = 5,
 ) -> List[SafeStopPlace]:
     """
-    Uses Google Places Nearby Search to find safe pull-over locations
-    like parking lots, rest areas, or gas stations.
-    Falls back to dummy data if API key is missing or request fails.
+    Finds safe pull-over locations like parking lots, rest areas, or gas
+    stations. Answers from the offline POI index (NEURODRIVE_POI_FILE) when
+    one is configured, so it keeps working without connectivity; Google
+    Places is only used to top up a short local result, and what it
+    returns is learned into the local index for later lookups nearby.
+    Falls back to dummy data only if neither is configured (local dev).
     """
-    # If no API key, return dummy suggestions near given lat/lng (for local testing)
-    if not GOOGLE_MAPS_API_KEY:
+    api_key = os.environ.get("GOOGLE_MAPS_API_KEY")
+
+    local = [
+        SafeStopPlace(**rec, maps_url=_maps_url(rec["lat"], rec["lng"], rec["place_id"]))
+        for rec in poi.search(lat, lng, max_distance_m, max_results)
+    ]
+    if len(local) >= max_results or (local and not api_key):
+        return local
+
+    # With real POI data, an empty answer means there is no stop nearby
+    if not api_key and poi.configured():
+        return local
+
+    # If neither is set up, return dummy suggestions near given lat/lng (for local testing)
+    if not api_key:
         return [
             SafeStopPlace(
                 name="Demo Rest Stop",
@@ -122,17 +384,33 @@ def find_safe_stops(
             ),
         ]
 
+    remote = _places_safe_stops(lat, lng, api_key, max_distance_m, max_results)
+    poi.learn(s.dict() for s in remote)
+    return _merge_safe_stops(local, remote, max_results)
+
+
+def _places_safe_stops(
+    lat: float,
+    lng: float,
+    api_key: str,
+    max_distance_m: int,
+    max_results: int,
+) -> List[SafeStopPlace]:
+    """
+    Google Places Nearby Search: parking first, then rest areas / stops.
+    """
     # 1. Try to find parking areas first
-    url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+    url = PLACES_URL
+    session = get_places_session()
     params = {
         "location": f"{lat},{lng}",
         "radius": max_distance_m,
         "type": "parking",
-        "key": GOOGLE_MAPS_API_KEY,
+        "key": api_key,
     }
 
     try:
-        resp = requests.get(url, params=params, timeout=5)
+        resp = session.get(url, params=params, timeout=5)
         data = resp.json() if resp.status_code == 200 else {}
     except Exception:
         data = {}
@@ -145,10 +423,10 @@ def find_safe_stops(
             "location": f"{lat},{lng}",
             "radius": max_distance_m,
             "keyword": "rest area OR lay-by OR highway stop",
-            "key": GOOGLE_MAPS_API_KEY,
+            "key": api_key,
         }
         try:
-            resp = requests.get(url, params=alt_params, timeout=5)
+            resp = session.get(url, params=alt_params, timeout=5)
             data = resp.json() if resp.status_code == 200 else {}
         except Exception:
             data = {}
@@ -158,12 +436,7 @@ def find_safe_stops(
     for r in results[:max_results]:
         loc = r.get("geometry", {}).get("location", {})
         place_id = r.get("place_id")
-        maps_url = (
-            f"https://www.google.com/maps/search/?api=1"
-            f"&query={loc.get('lat')},{loc.get('lng')}"
-        )
-        if place_id:
-            maps_url += f"&query_place_id={place_id}"
+        maps_url = _maps_url(loc.get("lat"), loc.get("lng"), place_id)
 
         safe_stops.append(
             SafeStopPlace(
@@ -181,41 +454,85 @@ def find_safe_stops(
 
     return safe_stops
 
-def send_emergency_sms(user_id: str, score: int, event_id: str, timestamp: str):
+SAFE_STOP_RADIUS_M = 5000
+SAFE_STOP_RESULTS = 5
+SAFE_STOP_CANDIDATES = 10   # looked up per cache tile, then ranked per caller
+
+
+def safe_stops_near(places: List[SafeStopPlace], lat: float, lng: float,
+                    radius_m: int) -> List[SafeStopPlace]:
+    """
+    A cache tile's places as seen from (lat, lng): distance from the
+    caller, only those within radius_m, best SAFE_STOP_RESULTS first.
+    """
+    ranked = []
+    for p in places:
+        dist = great_circle_m(lat, lng, p.lat, p.lng)
+        if dist <= radius_m:
+            score = poi.rank_key(poi.type_code(p.type), p.rating, dist, radius_m)
+            ranked.append((score, p.model_copy(update={"distance_m": round(dist, 1)})))
+    ranked.sort(key=lambda t: t[0], reverse=True)
+    return [p for _, p in ranked[:SAFE_STOP_RESULTS]]
+
+
+safe_stop_cache = SafeStopCache(
+    lambda lat, lng, radius_m: find_safe_stops(
+        lat, lng, max_distance_m=radius_m, max_results=SAFE_STOP_CANDIDATES
+    ),
+    localize=safe_stops_near,
+)
+
+
+def sms_unavailable(session: Optional[DriverSession]) -> Optional[str]:
+    """Why an emergency SMS can't go out right now, or None if it can."""
+    from_number = os.environ.get("TWILIO_FROM_NUMBER")
+    if not from_number or get_twilio_client() is None:
+        return "Twilio not configured"
+    if session is None or not session.contacts:
+        return "No emergency contacts configured for this user"
+    if time.time() - (session.last_sms or 0) < EMERGENCY_COOLDOWN_SECONDS:
+        return "Cooldown active, not sending duplicate SMS"
+    return None
+
+
+def send_emergency_sms(user_id: str, score: int, event_id: str, timestamp: str,
+                       reason: str = "Critical driver fatigue detected"):
     """
     Sends SMS to all registered emergency contacts for the given user.
     Respects a per-user cooldown to avoid spamming.
     """
-    # 1. Check Twilio configuration
-    if twilio_client is None or not TWILIO_FROM_NUMBER:
-        return False, "Twilio not configured"
+    # 1. Check Twilio configuration, contacts and cooldown
+    session = driver_sessions.get(user_id)
+    blocked = sms_unavailable(session)
+    if blocked is not None:
+        return False, blocked
+    return deliver_sms(session, score, event_id, timestamp, reason)
 
-    contacts = emergency_contacts.get(user_id, [])
-    if not contacts:
-        return False, "No emergency contacts configured for this user"
 
-    now = time.time()
-    last = last_emergency_sms.get(user_id, 0)
-    if now - last < EMERGENCY_COOLDOWN_SECONDS:
-        return False, "Cooldown active, not sending duplicate SMS"
+def deliver_sms(session: DriverSession, score: int, event_id: str, timestamp: str,
+                reason: str = "Critical driver fatigue detected"):
+    """Sends the SMS once sms_unavailable() has passed."""
+    from_number = os.environ.get("TWILIO_FROM_NUMBER")
+    twilio_client = get_twilio_client()
+    user_id = session.user_id
 
     # 2. Build message
     msg_body = (
-        f"NeuroDrive ALERT: Critical driver fatigue detected for user '{user_id}' "
+        f"NeuroDrive ALERT: {reason} for user '{user_id}' "
         f"at {timestamp}. Score: {score}. Event ID: {event_id}. "
         "Please contact the driver and ensure they stop driving safely."
     )
 
     # 3. Send SMS to each contact
     any_sent = False
-    for contact in contacts:
+    for contact in session.contacts or []:
         to_number = contact.get("phone_number")
         if not to_number:
             continue
         try:
             twilio_client.messages.create(
                 body=msg_body,
-                from_=TWILIO_FROM_NUMBER,
+                from_=from_number,
                 to=to_number
             )
             any_sent = True
@@ -224,70 +541,433 @@ def send_emergency_sms(user_id: str, score: int, event_id: str, timestamp: str):
             continue
 
     if any_sent:
-        last_emergency_sms[user_id] = now
+        session.last_sms = time.time()
         return True, "SMS sent"
     else:
         return False, "Failed to send to all contacts"
 
-# In-memory store
+def append_timeline_event(session: DriverSession, event_record: dict, ts: float):
+    """Appends an event to the driver's timeline and its time/tag index."""
+    session.timeline_index().add(event_record, ts)
+
+
+# --- ESCALATION DEADLINES ---
+# While a driver is at WATCH_LEVEL or above, two timers run on a timer
+# wheel: one fires PERSISTENCE_SECONDS after the level last changed, the
+# other HEARTBEAT_TIMEOUT_SECONDS after the last reading. Each reading
+# reschedules them in O(1), so nothing scans all drivers.
+WATCH_LEVEL = 3
+PERSISTENCE_SECONDS = 60
+HEARTBEAT_TIMEOUT_SECONDS = 30
+
+_notify_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_notify_pool() -> ThreadPoolExecutor:
+    """Small pool for SMS sent from deadline handlers, off the wheel thread."""
+    global _notify_pool
+    if _notify_pool is None:
+        with _init_lock:
+            if _notify_pool is None:
+                _notify_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="notify")
+    return _notify_pool
+
+
+def watch_driver(user_id: str, state: dict, level_changed: bool, now_ts: float):
+    """Called after each reading with the driver's updated escalation state."""
+    if state["level"] < WATCH_LEVEL:
+        unwatch_driver(user_id)
+        return
+    if level_changed:
+        deadline_scheduler.schedule(
+            (user_id, "persistence"), state["last_change"] + PERSISTENCE_SECONDS,
+            state["last_change"],
+        )
+    deadline_scheduler.schedule(
+        (user_id, "heartbeat"), now_ts + HEARTBEAT_TIMEOUT_SECONDS, now_ts
+    )
+
+
+def unwatch_driver(user_id: str):
+    deadline_scheduler.cancel((user_id, "persistence"))
+    deadline_scheduler.cancel((user_id, "heartbeat"))
+
+
+def log_system_event(session: DriverSession, event_type: str, intervention: str) -> dict:
+    """Records a backend-generated event (no reading attached) on the driver's timeline."""
+    state = session.escalation
+    level = state["level"]
+    event_id, now_ts = event_ids.next()
+    event_record = {
+        "event_id": event_id,
+        "timestamp": datetime.fromtimestamp(now_ts).isoformat(),
+        "user_id": session.user_id,
+        "mode": "unknown",
+        "fatigue_score": state["recent_scores"][-1] if state["recent_scores"] else 0,
+        "status": "alert",
+        "event_type": event_type,
+        "tags": [event_type, f"escalation_level_{level}"],
+        "eye_ratio": None,
+        "blink_count": None,
+        "head_tilt": None,
+        "yawn_ratio": None,
+        "has_snippet": False,
+        "escalation_level": level,
+        "intervention": intervention,
+    }
+    record_history(event_record)
+    append_timeline_event(session, event_record, now_ts)
+    return event_record
+
+
+def on_deadline(key: tuple, payload: float):
+    """
+    Timer wheel callback. Timers are replaced on every reading, so a
+    timer that fires is current; the state checks only guard against a
+    reading that raced with the expiry.
+    """
+    user_id, kind = key
+    session = driver_sessions.get(user_id)
+    state = session.escalation if session is not None else None
+    if state is None or state["level"] < WATCH_LEVEL:
+        return
+
+    if kind == "persistence":
+        if state["last_change"] != payload:
+            return
+        event = log_system_event(
+            session, "persistent_high_fatigue",
+            f"Escalation level {state['level']} for over {PERSISTENCE_SECONDS} seconds",
+        )
+        reason = "Persistent high driver fatigue"
+    else:
+        # Only readings count; system events on the timeline don't
+        if state.get("last_reading", 0) > payload:
+            return
+        event = log_system_event(
+            session, "driver_silent",
+            f"No readings for {HEARTBEAT_TIMEOUT_SECONDS} seconds at escalation level {state['level']}",
+        )
+        reason = "Driver device went silent during high fatigue"
+
+    get_notify_pool().submit(
+        send_emergency_sms, user_id, event["fatigue_score"], event["event_id"],
+        event["timestamp"], reason,
+    )
+
+
+deadline_scheduler = DeadlineScheduler(on_deadline)
 
 
-@app.get("/")
+@router.get("/")
 def home():
     return {"message": "NeuroDrive backend running"}
-from typing import List
-
-@app.post("/calibrate/{user_id}")
-def calibrate(user_id: str, open_ears: List[float], closed_ears: List[float]):
-    open_avg = sum(open_ears) / len(open_ears)
-    closed_avg = sum(closed_ears) / len(closed_ears)
-
-    blink_low = closed_avg + 0.1 * (open_avg - closed_avg)
-    blink_high = open_avg - 0.1 * (open_avg - closed_avg)
-
-    user_profiles[user_id] = {
-        "open_ear": open_avg,
-        "closed_ear": closed_avg,
-        "blink_low": blink_low,
-        "blink_high": blink_high,
-        "ema_open": open_avg,
-        "ema_closed": closed_avg
-    }
 
+_profiles_lock = threading.Lock()
+
+
+def publish_profile(user_id: str, profile: dict, replaces: Optional[dict] = None,
+                    only_if_current: bool = False) -> bool:
+    """
+    Installs a new profile dict with the next version number. Installed
+    dicts are never edited (see adapt_profile), so a /predict already
+    holding the old dict keeps working on it. With `only_if_current`, the
+    swap only happens if `replaces` is still the installed profile.
+    """
+    session = driver_sessions.get_or_create(user_id)
+    with _profiles_lock:
+        current = session.profile
+        if only_if_current and current is not replaces:
+            return False
+        profile["version"] = (current.get("version", 0) if current else 0) + 1
+        session.profile = profile
+        return True
+
+
+def adapt_profile(session: DriverSession, profile: dict, eye_ratio: float):
+    """
+    Copy-on-write EMA update after a personalized reading: installs an
+    adapted copy (same version) unless a new profile was published since
+    `profile` was read.
+    """
+    adapted = adapt_profile_ema(profile, eye_ratio)
+    if adapted is profile:
+        return
+    with _profiles_lock:
+        if session.profile is profile:
+            session.profile = adapted
+
+
+def _calibration_response(user_id: str, profile: dict):
+    publish_profile(user_id, profile)
     return {
         "message": "Calibration complete",
-        "profile": user_profiles[user_id]
+        "profile": profile
     }
 
-@app.post("/users/{user_id}/emergency-contacts")
+
+async def read_body(request: Request, limit: int) -> bytes:
+    """The request body, or a 413 as soon as it is known to exceed `limit`."""
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise HTTPException(status_code=413, detail=f"Body larger than {limit} bytes")
+    raw = bytearray()
+    async for piece in request.stream():
+        raw += piece
+        if len(raw) > limit:
+            raise HTTPException(status_code=413, detail=f"Body larger than {limit} bytes")
+    return bytes(raw)
+
+
+def _json_calibration_profile(samples: CalibrationSamples) -> dict:
+    return build_profile(as_samples(samples.open_ears), as_samples(samples.closed_ears))
+
+
+@router.post(
+    "/calibrate/{user_id}",
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": CalibrationSamples.model_json_schema()}},
+    }},
+)
+async def calibrate(user_id: str, request: Request):
+    """
+    Calibrates from JSON lists of open-eye and closed-eye EAR samples.
+    Outlier frames are rejected before averaging. Bodies over
+    max_json_body_bytes() get a 413 before they are parsed.
+    """
+    raw = await read_body(request, max_json_body_bytes())
+    try:
+        samples = CalibrationSamples.model_validate_json(raw)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    try:
+        profile = await run_in_threadpool(_json_calibration_profile, samples)
+    except CalibrationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _calibration_response(user_id, profile)
+
+
+def _binary_calibration_profile(raw: bytes, open_frames: int, channels: int) -> dict:
+    frames = decode_float32(raw, channels)
+    if not 0 < open_frames < len(frames):
+        raise CalibrationError("open_frames must split the body into two non-empty phases")
+
+    open_part, closed_part = frames[:open_frames], frames[open_frames:]
+    per_eye = None
+    if channels == 2:
+        per_eye = {
+            "open_left": open_part[:, 0],
+            "open_right": open_part[:, 1],
+            "closed_left": closed_part[:, 0],
+            "closed_right": closed_part[:, 1],
+        }
+    return build_profile(
+        open_part.mean(axis=1, dtype="f8"),
+        closed_part.mean(axis=1, dtype="f8"),
+        per_eye,
+    )
+
+
+@router.post("/calibrate/{user_id}/binary")
+async def calibrate_binary(user_id: str, request: Request, open_frames: int, channels: int = 1):
+    """
+    Calibrates from a raw little-endian float32 body: `open_frames` open-eye
+    frames followed by the closed-eye frames. With channels=2 each frame is
+    (left EAR, right EAR) and per-eye stats are included.
+    Bodies over max_body_bytes(channels) get a 413 before they are buffered,
+    and the statistics run in the threadpool.
+    """
+    if channels not in (1, 2):
+        raise HTTPException(status_code=400, detail="channels must be 1 or 2")
+    raw = await read_body(request, max_body_bytes(channels))
+
+    try:
+        profile = await run_in_threadpool(
+            _binary_calibration_profile, raw, open_frames, channels
+        )
+    except CalibrationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _calibration_response(user_id, profile)
+
+AUTO_PROFILE_REFRESH_EVERY = 10   # readings between auto-baseline refreshes
+
+
+def personalized_profile(session: DriverSession, sketch: EarSketch) -> Optional[dict]:
+    """
+    Explicit /calibrate profile if there is one; otherwise a profile derived
+    from the driver's EAR sketch once it has warmed up (refreshed every few
+    readings). None if neither is available yet.
+    """
+    current = session.profile
+    if current is not None and current.get("source") != "auto":
+        return current
+
+    if current is not None and sketch.total % AUTO_PROFILE_REFRESH_EVERY:
+        return current
+
+    base = sketch.baselines()
+    if base is None:
+        return current
+
+    profile = {
+        **base,
+        "ema_open": base["open_ear"],
+        "ema_closed": base["closed_ear"],
+        "source": "auto",
+    }
+    # Don't clobber a /calibrate that landed while we were computing
+    if not publish_profile(session.user_id, profile, replaces=current, only_if_current=True):
+        return session.profile
+    return profile
+
+
+@router.post("/users/{user_id}/emergency-contacts")
 def set_emergency_contacts(user_id: str, contacts: List[EmergencyContact]):
     """
     Configure or replace emergency contacts for a user.
     """
-    emergency_contacts[user_id] = [c.dict() for c in contacts]
+    session = driver_sessions.get_or_create(user_id)
+    session.contacts = [c.dict() for c in contacts]
     return {
         "user_id": user_id,
-        "contacts": emergency_contacts[user_id]
+        "contacts": session.contacts
     }
 
 
-@app.get("/users/{user_id}/emergency-contacts")
+@router.get("/users/{user_id}/emergency-contacts")
 def get_emergency_contacts(user_id: str):
     """
     Fetch current emergency contacts for a user.
     """
+    session = driver_sessions.get(user_id)
     return {
         "user_id": user_id,
-        "contacts": emergency_contacts.get(user_id, [])
+        "contacts": (session.contacts if session is not None else None) or []
     }
 
-from logic import compute_fatigue_instant, compute_fatigue_personalized
+_admission: Optional[AdmissionController] = None
+
+
+def get_admission() -> AdmissionController:
+    """/predict admission control (NEURODRIVE_PREDICT_CONCURRENCY slots)."""
+    global _admission
+    if _admission is None:
+        with _init_lock:
+            if _admission is None:
+                _admission = AdmissionController(concurrency_from_env())
+    return _admission
+
+
+async def start_admission():
+    get_admission().start()
+
+
+def stop_admission():
+    get_admission().stop()
+
+
+reading_sequencer = ReadingSequencer()
+
+
+@router.post(
+    "/predict",
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": DriverData.model_json_schema()}},
+    }},
+)
+async def predict(request: Request, background_tasks: BackgroundTasks):
+    """
+    Scores one reading. Readings are admitted by the driver's current
+    escalation level, so escalated drivers keep low latency under load;
+    shed readings get a 503 with Retry-After.
+
+    With `seq` set, each reading is applied exactly once and in order:
+    retries get the original response, and a reading that arrives after
+    a later one was applied gets a 409. A shed reading may be retried
+    after Retry-After. Clients that restart their counter send a higher
+    `seq_epoch`.
+
+    The body is validated straight from the raw bytes and scored on the
+    event loop; emergency SMS goes out as a background task after the
+    response, so the hot path never hops to the threadpool.
+    """
+    try:
+        data = DriverData.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    return json_response(await handle_reading(data, background_tasks))
+
+
+MAX_BATCH_READINGS = 256
+_reading_batch = TypeAdapter(List[DriverData])
+
+
+@router.post(
+    "/predict/batch",
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": _reading_batch.json_schema()}},
+    }},
+)
+async def predict_batch(request: Request, background_tasks: BackgroundTasks):
+    """
+    Several readings in one request, e.g. every cabin camera of a depot
+    box. Each reading is handled exactly as by /predict; results come back
+    in request order, with {"error": status, "detail": ...} in place of a
+    reading that failed.
+    """
+    try:
+        readings = _reading_batch.validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    if len(readings) > MAX_BATCH_READINGS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_READINGS} readings per batch")
+
+    async def one(data: DriverData) -> dict:
+        try:
+            return await handle_reading(data, background_tasks)
+        except HTTPException as e:
+            return {"user_id": data.user_id, "error": e.status_code, "detail": e.detail}
 
-@app.post("/predict")
-def predict(data: DriverData):
+    return json_response(await asyncio.gather(*(one(d) for d in readings)))
+
+
+async def handle_reading(data: DriverData, background_tasks: BackgroundTasks) -> dict:
+    if data.seq is None:
+        return await admit_reading(data, background_tasks)
+    session = driver_sessions.get_or_create(data.user_id)
+    try:
+        return await reading_sequencer.submit(
+            session.reading_sequence(), data.seq,
+            lambda: admit_reading(data, background_tasks), data.seq_epoch,
+        )
+    except SequenceError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+async def admit_reading(data: DriverData, background_tasks: BackgroundTasks) -> dict:
+    session = driver_sessions.get(data.user_id)
+    level = session.escalation["level"] if session and session.escalation else 0
+    try:
+        async with get_admission().slot(level):
+            return process_reading(data, background_tasks)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+def process_reading(data: DriverData, background_tasks: BackgroundTasks):
+    session = driver_sessions.get_or_create(data.user_id)
 
     # 1. Compute fatigue score based on mode
+    # (every valid reading also feeds the driver's EAR sketch)
     if data.mode == "instant":
+        session.ear_sketch().add(data.eye_ratio)
         score = compute_fatigue_instant(
             data.eye_ratio,
             data.blink_count,
@@ -296,16 +976,20 @@ def predict(data: DriverData):
         )
 
     elif data.mode == "personalized":
-        if data.user_id not in user_profiles:
+        sketch = session.ear_sketch()
+        sketch.add(data.eye_ratio)
+        profile = personalized_profile(session, sketch)
+        if profile is None:
             raise HTTPException(status_code=400, detail="User not calibrated")
 
         score = compute_fatigue_personalized(
-            user_profiles[data.user_id],
+            profile,
             data.eye_ratio,
             data.blink_count,
             data.head_tilt,
             data.yawn_ratio
         )
+        adapt_profile(session, profile, data.eye_ratio)
 
     else:
         raise HTTPException(status_code=400, detail="Invalid mode")
@@ -334,8 +1018,8 @@ def predict(data: DriverData):
         tags.append("head_tilt")
 
     # 3. Build event record
-    event_id = str(uuid.uuid4())
-    ts = datetime.now().isoformat()
+    event_id, now_ts = event_ids.next()
+    ts = datetime.fromtimestamp(now_ts).isoformat()
 
     event_record = {
         "event_id": event_id,
@@ -352,32 +1036,19 @@ def predict(data: DriverData):
         "yawn_ratio": data.yawn_ratio,
         "has_snippet": False
     }
-    
-
-    # 4. Append to global histories
-    fatigue_history.append(event_record)
-
-    if data.user_id not in driver_timeline:
-        driver_timeline[data.user_id] = []
-    driver_timeline[data.user_id].append(event_record)
-   
-
-    # 5. Legacy alerts list (optional)
-    alerts.append({"score": score, "status": status})
 
     # ---------- ADAPTIVE ESCALATION SYSTEM ----------
 
-    now_ts = datetime.now().timestamp()
-
     # Initialize user state if new
-    if data.user_id not in driver_escalation_state:
-        driver_escalation_state[data.user_id] = {
+    if session.escalation is None:
+        session.escalation = {
             "level": 0,
             "last_change": now_ts,
             "recent_scores": []
         }
 
-    state = driver_escalation_state[data.user_id]
+    state = session.escalation
+    state["last_reading"] = now_ts
 
     # Maintain rolling window of last 10 scores
     state["recent_scores"].append(score)
@@ -387,14 +1058,16 @@ def predict(data: DriverData):
     forecast = forecast_next_scores(state["recent_scores"], steps=5)
 
     # Decide next escalation level
+    policy = get_policy(data.user_id, data.fleet_id)
     new_level = decide_escalation(
         level=state["level"],
         score=score,
-        forecast=forecast
+        forecast=forecast,
+        policy=policy
     )
 
     # Reset escalation if driver recovers
-    if score < 45:
+    if policy.reset_below is not None and score < policy.reset_below:
         new_level = 0
 
     old_level = state["level"]
@@ -403,25 +1076,58 @@ def predict(data: DriverData):
     if new_level != state["level"]:
         state["level"] = new_level
         state["last_change"] = now_ts
+    watch_driver(data.user_id, state, new_level != old_level, now_ts)
 
     # Get physical/system action
-    intervention = escalation_action(state["level"])
+    intervention = escalation_action(state["level"], policy)
     safe_stop_needed = state["level"] >= 3
 
+    # Warm the safe-stop cache before the driver reaches level 3
+    if should_prefetch(state["level"], forecast):
+        if data.lat is not None and data.lng is not None:
+            pos = (data.lat, data.lng)
+        else:
+            pos = session.position
+        if pos is not None:
+            safe_stop_cache.prefetch(pos[0], pos[1], SAFE_STOP_RADIUS_M)
+
     # Attach escalation info to event record
     event_record["escalation_level"] = state["level"]
     event_record["intervention"] = intervention
 
-    # 🔔 Trigger SMS if we just entered level 4
+    # 4. Append to global histories (record is complete from here on,
+    # so readers may cache its encoded form)
+    record_history(event_record)
+    append_timeline_event(session, event_record, now_ts)
+    session.score_rollups().add(now_ts, score, status == "alert")
+    at_risk_index.update(
+        data.user_id, state["level"], score, max(forecast) if forecast else score,
+        now_ts, data.fleet_id,
+    )
+    if data.lat is not None and data.lng is not None:
+        record_reading(data.lat, data.lng, score, status == "alert")
+        session.position = (data.lat, data.lng, now_ts)
+
+    # 5. Legacy alerts list (optional)
+    alerts.append({"score": score, "status": status})
+
+    # 🔔 Trigger SMS if we just entered level 4 (sent after the response).
+    # Preconditions are checked now so "queued" means it can go out; the
+    # cooldown starts at queueing so a burst of readings queues one SMS.
     sms_triggered = False
     sms_message = None
     if state["level"] == 4 and old_level < 4:
-        sms_triggered, sms_message = send_emergency_sms(
-            user_id=data.user_id,
-            score=score,
-            event_id=event_id,
-            timestamp=ts
-        )
+        sms_message = sms_unavailable(session)
+        if sms_message is None:
+            session.last_sms = time.time()
+            background_tasks.add_task(
+                deliver_sms,
+                session,
+                score=score,
+                event_id=event_id,
+                timestamp=ts
+            )
+            sms_triggered, sms_message = True, "SMS queued"
 
 
     return {
@@ -439,7 +1145,7 @@ def predict(data: DriverData):
         "sms_info": sms_message
     }
 
-@app.post("/safe-stop")
+@router.post("/safe-stop")
 def safe_stop(req: SafeStopRequest):
     """
     Safe-Stop Assistant:
@@ -449,7 +1155,8 @@ def safe_stop(req: SafeStopRequest):
     - Logs a 'safe_stop_suggestion' event into the driver's timeline
     """
     # 1. Make sure we have escalation data for this user
-    state = driver_escalation_state.get(req.user_id)
+    session = driver_sessions.get(req.user_id)
+    state = session.escalation if session is not None else None
     if state is None or not state.get("recent_scores"):
         raise HTTPException(status_code=400, detail="No escalation data available for this user yet")
 
@@ -463,14 +1170,12 @@ def safe_stop(req: SafeStopRequest):
     # We recommend safe stop for level 3 and 4
     safe_stop_recommended = level >= 3
 
-    # 2. Find safe stops via Google Maps / dummy fallback
+    # 2. Find safe stops (usually already prefetched while escalation was rising)
     safe_stops: List[SafeStopPlace] = []
+    safe_stops_cached = False
     if safe_stop_recommended:
-        safe_stops = find_safe_stops(
-            lat=req.lat,
-            lng=req.lng,
-            max_distance_m=req.max_distance_m or 5000,
-            max_results=5,
+        safe_stops, safe_stops_cached = safe_stop_cache.get_or_fetch(
+            req.lat, req.lng, req.max_distance_m or SAFE_STOP_RADIUS_M
         )
 
     # 3. Decide infotainment actions
@@ -488,8 +1193,8 @@ def safe_stop(req: SafeStopRequest):
 
     # 4. Log this as a timeline event
     last_score = state["recent_scores"][-1]
-    event_id = str(uuid.uuid4())
-    ts = datetime.now().isoformat()
+    event_id, event_ts = event_ids.next()
+    ts = datetime.fromtimestamp(event_ts).isoformat()
 
     event_record = {
         "event_id": event_id,
@@ -512,10 +1217,10 @@ def safe_stop(req: SafeStopRequest):
         "intervention": "Safe-stop assistant invoked",
     }
 
-    fatigue_history.append(event_record)
-    if req.user_id not in driver_timeline:
-        driver_timeline[req.user_id] = []
-    driver_timeline[req.user_id].append(event_record)
+    record_history(event_record)
+    append_timeline_event(session, event_record, event_ts)
+    record_safe_stop(req.lat, req.lng)
+    session.position = (req.lat, req.lng, event_ts)
 
     return {
         "user_id": req.user_id,
@@ -523,34 +1228,83 @@ def safe_stop(req: SafeStopRequest):
         "persistent_high_fatigue": persistent_high_fatigue,
         "safe_stop_recommended": safe_stop_recommended,
         "safe_stops": [s.dict() for s in safe_stops],
+        "safe_stops_cached": safe_stops_cached,
         "infotainment_actions": infotainment_actions,
         "event_id": event_id,
     }
 
 
-@app.get("/escalation/{user_id}")
+@router.get("/escalation/{user_id}")
 def get_escalation_state(user_id: str):
-    if user_id not in driver_escalation_state:
+    session = driver_sessions.get(user_id)
+    if session is None or session.escalation is None:
         return {"message": "No escalation state for this user yet"}
 
-    return driver_escalation_state[user_id]
+    return session.escalation
+
+
+@router.get("/fleet/at-risk")
+def get_at_risk_drivers(
+    k: int = Query(20, ge=1, le=MAX_TOP_K),
+    min_level: int = 0,
+    max_age_seconds: Optional[float] = None,
+):
+    """
+    The `k` most at-risk drivers right now, ranked by escalation level,
+    then score, then forecast peak. `min_level` keeps only drivers at that
+    level or above; `max_age_seconds` drops drivers whose last reading is
+    older than that.
+    """
+    return {"drivers": at_risk_index.top(k, min_level, max_age_seconds)}
+
+
+@router.get("/heatmap")
+def get_heatmap(min_lat: float, min_lng: float, max_lat: float, max_lng: float, zoom: int = 12):
+    """
+    Fatigue hotspot tiles (slippy-map x/y at `zoom`) inside a bounding box:
+    reading count, mean/max score, alert count and safe-stop requests.
+    """
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    return heatmap(min_lat, min_lng, max_lat, max_lng, zoom)
+
+
+@router.post("/policies/reload")
+def reload_escalation_policies():
+    """
+    Re-reads the escalation policy file now instead of waiting for the
+    periodic mtime check.
+    """
+    try:
+        registry = reload_policies(force=True)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Policy reload failed: {e}")
+    return {
+        "policies": sorted(registry.policies),
+        "users": len(registry.users),
+        "fleets": len(registry.fleets),
+    }
 
 
 # ---------- HISTORY ----------
-@app.get("/history")
-def get_history():
+@router.get("/history")
+def get_history(accept: Optional[str] = Header(None)):
     """
     Returns last 50 fatigue readings for visualization.
     """
-    return fatigue_history[-50:]
+    with _history_lock:
+        recent = list(fatigue_history)
+    return events_response(recent, accept)
 
 # ---------- SUMMARY ----------
-@app.get("/summary")
+@router.get("/summary")
 def summary():
     """
     Provides quick stats for dashboard cards.
     """
-    if not fatigue_history:
+    with _history_lock:
+        totals = dict(history_totals)
+    if not totals["records"]:
         return {
             "avg_score": 0,
             "max_score": 0,
@@ -558,46 +1312,160 @@ def summary():
             "total_records": 0
         }
 
-    scores = [r["fatigue_score"] for r in fatigue_history]
-    alerts_count = sum(1 for r in fatigue_history if r["status"] == "alert")
-
     return {
-        "avg_score": round(sum(scores) / len(scores), 2),
-        "max_score": max(scores),
-        "alert_events": alerts_count,
-        "total_records": len(scores)
+        "avg_score": round(totals["score_sum"] / totals["records"], 2),
+        "max_score": totals["max_score"],
+        "alert_events": totals["alerts"],
+        "total_records": totals["records"]
     }
 
 
 # ---------- OPTIONAL ----------
-@app.get("/alerts")
-def get_alerts():
-    return alerts
+@router.get("/alerts")
+def get_alerts(limit: int = 1000, accept: Optional[str] = Header(None)):
+    """
+    Returns the last `limit` legacy alert entries (at most ALERTS_SIZE are kept).
+    """
+    recent = list(alerts)
+    return rows_response(recent[-limit:] if limit > 0 else [], accept)
 
-@app.get("/timeline/{user_id}")
-def get_timeline(user_id: str, limit: int = 50):
+@router.get("/timeline/{user_id}")
+def get_timeline(
+    user_id: str,
+    limit: int = 50,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    tags: Optional[List[str]] = Query(None),
+    min_score: Optional[int] = None,
+    cursor: Optional[int] = None,
+    before_id: Optional[str] = None,
+    after_id: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+):
     """
     Returns last `limit` events for a given driver.
     This is your 'driver awareness log'.
+
+    Optional filters: `since`/`until` (ISO datetimes), `event_type`,
+    `tags` (repeatable, all must match) and `min_score`.
+    If older matches exist, the `X-Next-Cursor` header carries the value to
+    pass back as `cursor` for the previous page.
+    Event IDs work as cursors too: `before_id` pages back from an event,
+    `after_id` returns only events newer than it (for polling).
+    Send `Accept: application/msgpack` for a columnar MessagePack body.
     """
-    events = driver_timeline.get(user_id, [])
-    if not events:
-        return []
+    session = driver_sessions.get(user_id)
+    index = session.timeline if session is not None else None
+    if index is None:
+        return events_response([], accept)
+
+    after = None
+    for param, value in (("before_id", before_id), ("after_id", after_id)):
+        if value is None:
+            continue
+        pos = index.find(value)
+        if pos is None:
+            raise HTTPException(status_code=400, detail=f"Unknown event in {param}")
+        if param == "before_id":
+            cursor = pos if cursor is None else min(cursor, pos)
+        else:
+            after = pos
+
+    events, next_cursor = index.query(
+        since=since.timestamp() if since else None,
+        until=until.timestamp() if until else None,
+        event_type=event_type,
+        tags=tags,
+        min_score=min_score,
+        cursor=cursor,
+        after=after,
+        limit=limit,
+    )
     # return newest last
-    return events[-limit:]
+    resp = events_response(events, accept)
+    if next_cursor is not None:
+        resp.headers["X-Next-Cursor"] = str(next_cursor)
+    return resp
 
-@app.get("/timeline/{user_id}/{event_id}")
+@router.get("/trends/{user_id}")
+def get_trends(
+    user_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    points: int = 200,
+):
+    """
+    Downsampled fatigue score series for charts.
+    Picks the finest rollup resolution (10 s / 1 min / 15 min / 1 h) that
+    fits in `points` buckets for the requested range (default: last hour).
+    Bucket `start` values are unix seconds.
+    """
+    until_ts = until.timestamp() if until else time.time()
+    since_ts = since.timestamp() if since else until_ts - 3600
+
+    session = driver_sessions.get(user_id)
+    rollups = session.rollups if session is not None else None
+    if rollups is None:
+        return {"user_id": user_id, "resolution_seconds": None, "buckets": []}
+
+    series = rollups.pick(since_ts, until_ts, max(points, 1))
+    return {
+        "user_id": user_id,
+        "resolution_seconds": series.width,
+        "buckets": series.range(since_ts, until_ts),
+    }
+
+@router.get("/timeline/{user_id}/{event_id}")
 def get_event(user_id: str, event_id: str):
     """
     Returns a single event with full details, including snippet flag.
     """
-    events = driver_timeline.get(user_id, [])
-    for e in events:
-        if e["event_id"] == event_id:
-            return e
-    raise HTTPException(status_code=404, detail="Event not found")
+    e = driver_event(user_id, event_id)
+    if e is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return e
+
+def _user_event(user_id: str, event_id: str) -> dict:
+    e = driver_event(user_id, event_id)
+    if e is None:
+        raise HTTPException(status_code=404, detail="Event not found for user")
+    return e
+
+
+# Event fields a share token holder may see
+SHARED_EVENT_FIELDS = (
+    "event_id", "timestamp", "user_id", "mode", "fatigue_score", "status", "event_type", "tags",
+)
+
 
-@app.post("/timeline/{user_id}/{event_id}/snippet")
+def _new_snippet_meta(event: dict, blob_id: str, size: int, content_type: str) -> dict:
+    return {
+        "event_id": event["event_id"],
+        "user_id": event["user_id"],
+        "created_at": datetime.now().isoformat(),
+        "file_name": blob_id,
+        "size_bytes": size,
+        "content_type": content_type,
+        "duration_seconds": None,   # frontend/camera can fill later
+        # Stored with the snippet, so any worker can serve the shared view
+        "event": {k: event[k] for k in SHARED_EVENT_FIELDS},
+    }
+
+
+def _share_token_for(snippet_meta: dict) -> str:
+    token, _ = get_share_tokens().issue(snippet_meta["event_id"], snippet_meta["user_id"])
+    return token
+
+
+def _attach_snippet(target_event: dict, snippet_meta: dict):
+    target_event["has_snippet"] = True
+    invalidate_event(target_event["event_id"])
+    incident_snippets[target_event["event_id"]] = snippet_meta
+    get_retention().nudge()
+
+
+@router.post("/timeline/{user_id}/{event_id}/snippet")
 async def upload_snippet(
     user_id: str,
     event_id: str,
@@ -605,85 +1473,393 @@ async def upload_snippet(
 ):
     """
     Attach an encrypted video snippet to a specific event.
-    - Stores encrypted .enc file on disk
+    - Stores the clip once per distinct content (compressed where it
+      helps, AES-GCM encrypted) and references it from the event
     - Marks event.has_snippet = True
-    - Creates snippet metadata with share_token
+    - Returns a signed share_token (valid DEFAULT_TTL_SECONDS)
     """
     # 1. Verify event exists and belongs to this user
-    events = driver_timeline.get(user_id, [])
-    target_event = None
-    for e in events:
-        if e["event_id"] == event_id:
-            target_event = e
-            break
-
-    if target_event is None:
-        raise HTTPException(status_code=404, detail="Event not found for user")
+    target_event = _user_event(user_id, event_id)
 
     # 2. Read file contents
     contents = await file.read()
     if not contents:
         raise HTTPException(status_code=400, detail="Empty file")
 
-    # 3. Encrypt and store file
-    encrypted = fernet.encrypt(contents)
-    safe_name = f"{event_id}.enc"
-    file_path = os.path.join(SNIPPETS_DIR, safe_name)
-
-    with open(file_path, "wb") as f:
-        f.write(encrypted)
+    # 3. Encrypt and store (off the event loop; dedups identical clips).
+    # The meta is kept in the store's index so it survives restarts.
+    store = get_snippet_store()
+    blob_id = await run_in_threadpool(store.content_id, contents)
+    snippet_meta = _new_snippet_meta(
+        target_event, blob_id, len(contents), file.content_type or "application/octet-stream",
+    )
+    blob = await run_in_threadpool(
+        store.put, event_id, contents, snippet_meta,
+        snippet_priority(target_event.get("event_type")), blob_id,
+    )
 
-    # 4. Generate share token (for future controlled sharing)
-    share_token = secrets.token_urlsafe(16)
+    # 4. Update in-memory structures
+    _attach_snippet(target_event, snippet_meta)
+    share_token = _share_token_for(snippet_meta)
 
-    # 5. Update in-memory structures
-    target_event["has_snippet"] = True
-
-    snippet_meta = {
+    return {
+        "message": "Snippet uploaded and encrypted",
         "event_id": event_id,
-        "user_id": user_id,
-        "created_at": datetime.now().isoformat(),
-        "file_name": safe_name,
-        "duration_seconds": None,   # frontend/camera can fill later
-        "share_token": share_token
+        "share_token": share_token,
+        "deduplicated": blob["deduplicated"]
     }
-    incident_snippets[event_id] = snippet_meta
 
+def parse_range(header: Optional[str], size: int) -> Optional[tuple]:
+    """
+    (start, end) inclusive for a single `bytes=` range, None to send the
+    whole body. Raises 416 if the range can't be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None   # absent, other units or multi-range: full response
+    spec = header[len("bytes="):].strip()
+    first, _, last = spec.partition("-")
+    try:
+        if first == "":
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def stored_snippet_meta(event_id: str) -> Optional[dict]:
+    """
+    Snippet meta from the store's index, so a snippet uploaded through
+    another worker (or before a restart) is found too.
+    """
+    meta = incident_snippets.get(event_id)
+    return meta if meta is not None else get_snippet_store().meta(event_id)
+
+
+def snippet_response(meta: dict, range_header: Optional[str]) -> StreamingResponse:
+    """
+    Streams the decrypted snippet, or the requested byte range of it.
+    Only the chunks overlapping the range are read and decrypted.
+    """
+    reader = get_snippet_store().reader(meta["event_id"])
+    if reader is None:
+        raise HTTPException(status_code=404, detail="Snippet not found")
+
+    size = reader.plain_size
+    headers = {"Accept-Ranges": "bytes"}
+    media_type = meta.get("content_type", "application/octet-stream")
+    if size == 0:
+        headers["Content-Length"] = "0"
+        return StreamingResponse(iter(()), media_type=media_type, headers=headers)
+
+    byte_range = parse_range(range_header, size)
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        (start, end), status = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        reader.iter_range(start, end),
+        status_code=status,
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+@router.get("/timeline/{user_id}/{event_id}/snippet")
+def download_snippet(user_id: str, event_id: str, range: Optional[str] = Header(None)):
+    """
+    Downloads the event's snippet. Supports HTTP Range so players can seek.
+    """
+    meta = stored_snippet_meta(event_id)
+    if meta is None or meta["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Snippet not found")
+    return snippet_response(meta, range)
+
+
+def _snippet_for_token(share_token: str, scope: int) -> dict:
+    """Snippet meta for a live share token that grants `scope`."""
+    try:
+        claims = get_share_tokens().verify(share_token, scope)
+    except ShareTokenError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    meta = stored_snippet_meta(claims.event_id)
+    if meta is None or meta["user_id"] != claims.user_id:
+        raise HTTPException(status_code=404, detail="Invalid share token")
+    return meta
+
+
+@router.post("/timeline/{user_id}/{event_id}/snippet/share")
+def share_snippet(
+    user_id: str,
+    event_id: str,
+    ttl_seconds: int = Query(DEFAULT_TTL_SECONDS, ge=1, le=MAX_TTL_SECONDS),
+    scope: str = Query("all", pattern="^(meta|content|all)$"),
+):
+    """
+    Issues a new share token for an event's snippet. `scope` limits it to
+    the metadata view, the clip itself, or both.
+    """
+    meta = stored_snippet_meta(event_id)
+    if meta is None or meta["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="No snippet for this event")
+    token, claims = get_share_tokens().issue(event_id, user_id, ttl_seconds, SCOPES[scope])
     return {
-        "message": "Snippet uploaded and encrypted",
         "event_id": event_id,
-        "share_token": share_token
+        "share_token": token,
+        "scope": scope,
+        "expires_at": datetime.fromtimestamp(claims.expires_at).isoformat(),
     }
 
-@app.get("/snippet/share/{share_token}")
+
+@router.post("/snippet/share/{share_token}/revoke")
+def revoke_share_token(share_token: str):
+    """Revokes a share token on every worker."""
+    try:
+        get_share_tokens().revoke(share_token)
+    except ShareTokenError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {"revoked": True}
+
+
+@router.get("/snippet/share/{share_token}")
 def get_shared_snippet_meta(share_token: str):
     """
     Returns minimal info for a shared incident snippet, identified by share_token.
-    Does NOT expose file path (you can later add a secure download endpoint).
-    """
-    # Find snippet by token
-    for event_id, meta in incident_snippets.items():
-        if meta.get("share_token") == share_token:
-            # Find corresponding event
-            user_id = meta["user_id"]
-            events = driver_timeline.get(user_id, [])
-            event = next((e for e in events if e["event_id"] == event_id), None)
-            if not event:
-                raise HTTPException(status_code=404, detail="Associated event not found")
-
-            # Return sanitized view
-            return {
-                "event": {
-                    "event_id": event["event_id"],
-                    "timestamp": event["timestamp"],
-                    "user_id": event["user_id"],
-                    "mode": event["mode"],
-                    "fatigue_score": event["fatigue_score"],
-                    "status": event["status"],
-                    "event_type": event["event_type"],
-                    "tags": event["tags"],
-                },
-                "snippet_available": True
-            }
-
-    raise HTTPException(status_code=404, detail="Invalid share token")
+    Does NOT expose file path; the clip itself is served by
+    /snippet/share/{share_token}/content.
+    """
+    meta = _snippet_for_token(share_token, SCOPE_META)
+    return {"event": meta["event"], "snippet_available": True}
+
+
+@router.get("/snippet/share/{share_token}/content")
+def download_shared_snippet(share_token: str, range: Optional[str] = Header(None)):
+    """
+    Streams a shared snippet, with HTTP Range support.
+    """
+    meta = _snippet_for_token(share_token, SCOPE_CONTENT)
+    return snippet_response(meta, range)
+
+
+# --- RESUMABLE SNIPPET UPLOADS ---
+upload_manager = UploadManager()
+
+
+def _upload_session(upload_id: str, hold: bool = False):
+    try:
+        return upload_manager.get(upload_id, hold)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+def _require_open(session):
+    """404 if the session ended while this request waited for its lock."""
+    if not upload_manager.is_open(session):
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+
+
+@router.post("/timeline/{user_id}/{event_id}/snippet/uploads")
+def create_snippet_upload(user_id: str, event_id: str, req: SnippetUploadRequest):
+    """
+    Starts a resumable upload of `size` bytes for the event. Send the clip
+    with PUT /snippet/uploads/{upload_id}?offset=N (any chunk sizes), then
+    POST .../complete. After a dropped connection, GET the upload to find
+    where to resume.
+    """
+    _user_event(user_id, event_id)
+    try:
+        session = upload_manager.create(
+            get_snippet_store(), user_id, event_id, req.size,
+            req.content_type or "application/octet-stream",
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {**session.status(), "chunk_size": CHUNK_SIZE}
+
+
+@router.put("/snippet/uploads/{upload_id}")
+async def put_snippet_upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+):
+    """
+    Appends the body at `offset`. Bytes before the received offset are
+    skipped; an offset past it is a 409. The body is encrypted as it
+    streams in, and whatever arrived before a disconnect is kept.
+    """
+    session = _upload_session(upload_id, hold=True)
+    try:
+        async with session.lock:
+            _require_open(session)
+            if offset > session.received:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Offset {offset} is past the received offset {session.received}",
+                )
+            buf = bytearray()
+            try:
+                try:
+                    async for piece in request.stream():
+                        buf += piece
+                        if len(buf) >= CHUNK_SIZE:
+                            await run_in_threadpool(session.append, offset, bytes(buf))
+                            offset += len(buf)
+                            buf.clear()
+                except ClientDisconnect:
+                    pass
+                if buf:
+                    await run_in_threadpool(session.append, offset, bytes(buf))
+            except UploadError as e:
+                raise HTTPException(status_code=e.status_code, detail=e.detail)
+    finally:
+        upload_manager.release(session)
+    return session.status()
+
+
+@router.get("/snippet/uploads/{upload_id}")
+def get_snippet_upload(upload_id: str):
+    """Received byte range and the offset to resume from."""
+    return _upload_session(upload_id).status()
+
+
+@router.post("/snippet/uploads/{upload_id}/complete")
+async def complete_snippet_upload(upload_id: str):
+    """
+    Seals the blob and attaches it to the event, same as a one-shot
+    upload to /timeline/{user_id}/{event_id}/snippet.
+    """
+    session = _upload_session(upload_id, hold=True)
+    try:
+        async with session.lock:
+            _require_open(session)
+            target_event = _user_event(session.user_id, session.event_id)
+            try:
+                blob_id, tmp = await run_in_threadpool(session.finish)
+            except UploadError as e:
+                raise HTTPException(status_code=e.status_code, detail=e.detail)
+            upload_manager.discard(session, abort=False)
+    finally:
+        upload_manager.release(session)
+
+    snippet_meta = _new_snippet_meta(target_event, blob_id, session.size, session.content_type)
+    blob = await run_in_threadpool(
+        get_snippet_store().commit, session.event_id, blob_id, session.size, tmp,
+        snippet_meta, snippet_priority(target_event.get("event_type")),
+    )
+    _attach_snippet(target_event, snippet_meta)
+
+    return {
+        "message": "Snippet uploaded and encrypted",
+        "event_id": session.event_id,
+        "share_token": _share_token_for(snippet_meta),
+        "deduplicated": blob["deduplicated"]
+    }
+
+
+@router.delete("/snippet/uploads/{upload_id}")
+async def abort_snippet_upload(upload_id: str):
+    session = _upload_session(upload_id)
+    # Wait for a PUT in progress rather than closing its file under it
+    async with session.lock:
+        upload_manager.discard(session)
+    return {"message": "Upload aborted", "upload_id": upload_id}
+
+
+# ---------- ADMIN: PROFILING ----------
+cpu_sampler = CpuSampler()
+allocation_tracer = AllocationTracer()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Admin endpoints are enabled by setting NEURODRIVE_ADMIN_TOKEN and are
+    called with a matching X-Admin-Token header; otherwise they 404.
+    """
+    expected = os.environ.get("NEURODRIVE_ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.post("/admin/profile/cpu", dependencies=[Depends(require_admin)])
+async def profile_cpu(seconds: float = Query(10.0, gt=0, le=MAX_PROFILE_SECONDS)):
+    """
+    Samples every thread of this worker for `seconds` and returns collapsed
+    stacks (feed to flamegraph.pl or speedscope). The sampler runs on a
+    worker thread, so the event loop keeps serving while it runs.
+    """
+    try:
+        collapsed, samples = await run_in_threadpool(cpu_sampler.run, seconds)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(collapsed + "\n", headers={"X-Profile-Samples": str(samples)})
+
+
+@router.post("/admin/profile/memory", dependencies=[Depends(require_admin)])
+async def profile_memory(
+    seconds: float = Query(5.0, gt=0, le=MAX_PROFILE_SECONDS),
+    top: int = Query(10, ge=1, le=100),
+):
+    """
+    Traces allocations for `seconds` and returns the net growth per store
+    (fatigue_history, driver_timeline, incident_snippets, profiles, ...),
+    alongside the stores' current sizes. Tracing slows the worker while
+    it runs; it is switched off again when the window ends.
+    """
+    try:
+        report = await run_in_threadpool(allocation_tracer.run, seconds, top)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    report["store_sizes"] = {
+        "fatigue_history": len(fatigue_history),
+        "incident_snippets": len(incident_snippets),
+        "alerts": len(alerts),
+        "sessions": driver_sessions.stats(),
+        "at_risk_index": len(at_risk_index),
+        "deadline_timers": len(deadline_scheduler.wheel),
+    }
+    return report
+
+
+def create_app() -> FastAPI:
+    """
+    Application factory. Loads .env (if python-dotenv is installed) and
+    mounts the routes; external clients are still created lazily.
+    """
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+    application = FastAPI(title="NeuroDrive Backend")
+    application.include_router(router)
+    application.add_event_handler("startup", assign_worker_id)
+    application.add_event_handler("shutdown", release_worker_id)
+    application.add_event_handler("startup", start_snippet_retention)
+    application.add_event_handler("startup", start_policy_reloader)
+    application.add_event_handler("startup", deadline_scheduler.start)
+    application.add_event_handler("startup", driver_sessions.start)
+    application.add_event_handler("startup", start_admission)
+    application.add_event_handler("shutdown", stop_admission)
+    return application
+
+
+app = create_app()
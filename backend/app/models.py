@@ -8,6 +8,11 @@ class DriverData(BaseModel):
     blink_count: int
     head_tilt: float
     yawn_ratio: Optional[float] = None
+    fleet_id: Optional[str] = None   # selects fleet escalation policy
+    lat: Optional[float] = None      # driver position, if the client has GPS
+    lng: Optional[float] = None
+    seq: Optional[int] = None        # per-driver reading number, for retries
+    seq_epoch: int = 0               # raise when the client restarts its seq counter
 
 
 class TimelineEvent(BaseModel):
@@ -26,6 +31,11 @@ class TimelineEvent(BaseModel):
     has_snippet: bool = False
 
 
+class CalibrationSamples(BaseModel):
+    open_ears: List[float]     # EAR per frame, eyes open
+    closed_ears: List[float]   # EAR per frame, eyes closed
+
+
 class SnippetMeta(BaseModel):
     event_id: str
     user_id: str
@@ -34,6 +44,10 @@ class SnippetMeta(BaseModel):
     duration_seconds: Optional[float] = None
     share_token: Optional[str] = None
 
+class SnippetUploadRequest(BaseModel):
+    size: int                 # total clip size in bytes
+    content_type: Optional[str] = None
+
 class EmergencyContact(BaseModel):
     phone_number: str         # E.164 format recommended: +91xxxxxxxxxx
     name: Optional[str] = None
@@ -55,3 +69,4 @@ class SafeStopPlace(BaseModel):
     rating: Optional[float] = None
     user_ratings_total: Optional[int] = None
     maps_url: Optional[str] = None
+    distance_m: Optional[float] = None
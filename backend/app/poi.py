@@ -0,0 +1,423 @@
+"""
+Offline safe-stop POI index.
+
+Loads a CSV of parking / rest-area / fuel locations (e.g. exported from
+OSM) with columns:
+
+    name,lat,lng,type[,rating,user_ratings_total,address,place_id]
+
+On first load the CSV is compiled into cache files next to it:
+
+    <csv>.kd<LEAF_SIZE>.npy   structured array, memory-mapped on later
+                              loads, stored in implicit KD-tree order
+    <csv>.text.bin            UTF-8 name/address/place_id, decoded per result
+
+Points live on the unit sphere (x, y, z) so Euclidean chord distance is
+monotonic with great-circle distance and the tree needs no special casing
+near the poles or the antimeridian. Caches are rebuilt when the CSV is
+newer.
+
+Places that Google Places returns are learned into a small in-memory grid
+(LearnedPlaces) and searched alongside the CSV, so areas the CSV covers
+sparsely stop needing Places after the first lookup. Learned places are
+per worker and are not written back to the CSV.
+"""
+import csv
+import heapq
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from geo import EARTH_RADIUS_M, great_circle_m
+
+LEAF_SIZE = 128     # points per leaf, scanned vectorized
+
+TYPE_CODES = {"other": 0, "rest_area": 1, "parking": 2, "fuel": 3}
+TYPE_NAMES = {v: k for k, v in TYPE_CODES.items()}
+TYPE_ALIASES = {
+    "rest_stop": "rest_area", "services": "rest_area", "lay_by": "rest_area",
+    "parking_lot": "parking", "car_park": "parking",
+    "gas_station": "fuel", "petrol_station": "fuel", "fuel_station": "fuel",
+}
+# Ranking preference: a rest area beats a car park beats a fuel forecourt
+TYPE_WEIGHT = {1: 1.0, 2: 0.7, 3: 0.4, 0: 0.0}
+
+_SEP = "\x1f"
+
+LEARNED_CELL_DEG = 0.05        # ~5.5 km grid cells for learned places
+MAX_LEARNED_PLACES = 50_000
+SAME_SPOT_DEG = 0.0003         # ~30 m: two records for one place
+
+
+def _np():
+    import numpy
+    return numpy
+
+
+def _dtype():
+    np = _np()
+    return np.dtype([
+        ("x", "<f8"), ("y", "<f8"), ("z", "<f8"),
+        ("lat", "<f8"), ("lng", "<f8"),
+        ("kind", "u1"),
+        ("rating", "<f4"),            # NaN if unknown
+        ("ratings_total", "<i4"),     # -1 if unknown
+        ("text_off", "<i8"), ("text_len", "<i4"),
+    ])
+
+
+def _unit_vectors(lat, lng):
+    np = _np()
+    la = np.radians(lat)
+    lo = np.radians(lng)
+    c = np.cos(la)
+    return c * np.cos(lo), c * np.sin(lo), np.sin(la)
+
+
+def _chord(distance_m: float) -> float:
+    half_angle = min(distance_m / (2 * EARTH_RADIUS_M), math.pi / 2)
+    return 2 * math.sin(half_angle)
+
+
+def _distance_m(chord: float) -> float:
+    return 2 * EARTH_RADIUS_M * math.asin(min(chord / 2, 1.0))
+
+
+def type_code(raw: Optional[str]) -> int:
+    t = (raw or "").strip().lower().replace(" ", "_").replace("-", "_")
+    t = TYPE_ALIASES.get(t, t)
+    return TYPE_CODES.get(t, 0)
+
+
+def _rating(raw) -> float:
+    try:
+        rating = float(raw)
+    except (TypeError, ValueError):
+        return float("nan")
+    return rating if math.isfinite(rating) else float("nan")
+
+
+def _ratings_total(raw) -> int:
+    try:
+        total = int(raw)
+    except (TypeError, ValueError):
+        return -1
+    return total if 0 <= total < 2 ** 31 else -1
+
+
+def _kd_order(coords) -> "numpy.ndarray":
+    """
+    Permutation that lays points out as an implicit KD-tree: for a range
+    [lo, hi) longer than LEAF_SIZE, index mid = (lo + hi) // 2 is the split
+    point on axis depth % 3, smaller values to its left.
+    """
+    np = _np()
+    order = np.arange(len(coords))
+    stack = [(0, len(coords), 0)]
+    while stack:
+        lo, hi, depth = stack.pop()
+        if hi - lo <= LEAF_SIZE:
+            continue
+        axis = depth % 3
+        mid = (lo + hi) // 2
+        seg = order[lo:hi]
+        part = np.argpartition(coords[seg, axis], mid - lo)
+        order[lo:hi] = seg[part]
+        stack.append((lo, mid, depth + 1))
+        stack.append((mid + 1, hi, depth + 1))
+    return order
+
+
+def compile_csv(csv_path: str, points_path: str, text_path: str):
+    np = _np()
+    rows = []
+    text = bytearray()
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            try:
+                lat = float(r["lat"])
+                lng = float(r["lng"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            blob = _SEP.join([
+                r.get("name") or "Unknown",
+                r.get("address") or "",
+                r.get("place_id") or "",
+            ]).encode("utf-8")
+            rows.append((
+                lat, lng, type_code(r.get("type", "")),
+                _rating(r.get("rating")),
+                _ratings_total(r.get("user_ratings_total")),
+                len(text), len(blob),
+            ))
+            text += blob
+
+    pts = np.zeros(len(rows), dtype=_dtype())
+    if rows:
+        cols = list(zip(*rows))
+        pts["lat"], pts["lng"], pts["kind"] = cols[0], cols[1], cols[2]
+        pts["rating"], pts["ratings_total"] = cols[3], cols[4]
+        pts["text_off"], pts["text_len"] = cols[5], cols[6]
+        pts["x"], pts["y"], pts["z"] = _unit_vectors(pts["lat"], pts["lng"])
+        coords = np.stack([pts["x"], pts["y"], pts["z"]], axis=1)
+        pts = pts[_kd_order(coords)]
+
+    np.save(points_path, pts)
+    with open(text_path, "wb") as f:
+        f.write(text)
+
+
+class PoiIndex:
+    def __init__(self, csv_path: str):
+        np = _np()
+        # The layout depends on LEAF_SIZE, so it is part of the file name
+        points_path = f"{csv_path}.kd{LEAF_SIZE}.npy"
+        text_path = csv_path + ".text.bin"
+        stale = (
+            not os.path.exists(points_path)
+            or not os.path.exists(text_path)
+            or os.path.getmtime(points_path) < os.path.getmtime(csv_path)
+        )
+        if stale:
+            compile_csv(csv_path, points_path, text_path)
+
+        self.points = np.load(points_path, mmap_mode="r")
+        # Contiguous copy of the coordinates; the rest stays on disk
+        self.coords = np.stack(
+            [self.points["x"], self.points["y"], self.points["z"]], axis=1
+        )
+        self._text = None
+        if os.path.getsize(text_path):
+            self._text = np.memmap(text_path, dtype="u1", mode="r")
+
+    def __len__(self):
+        return len(self.coords)
+
+    def nearest(self, lat: float, lng: float, radius_m: float,
+                k: int) -> List[Tuple[float, int]]:
+        """
+        Up to k (distance_m, row) pairs within radius_m, nearest first.
+        """
+        np = _np()
+        n = len(self.coords)
+        if n == 0 or k <= 0:
+            return []
+
+        q = np.array(_unit_vectors(lat, lng))
+        bound = _chord(radius_m) ** 2
+        best: List[Tuple[float, int]] = []    # max-heap on -d2
+        coords = self.coords
+
+        def limit():
+            return min(bound, -best[0][0]) if len(best) == k else bound
+
+        def offer(d2, i):
+            if len(best) < k:
+                heapq.heappush(best, (-d2, i))
+            else:
+                heapq.heapreplace(best, (-d2, i))
+
+        # (lo, hi, depth, lower bound on squared distance to the range)
+        stack = [(0, n, 0, 0.0)]
+        while stack:
+            lo, hi, depth, min_d2 = stack.pop()
+            if min_d2 > limit():
+                continue
+            if hi - lo <= LEAF_SIZE:
+                d = coords[lo:hi] - q
+                d2 = np.einsum("ij,ij->i", d, d)
+                for j in np.flatnonzero(d2 <= limit()):
+                    if d2[j] <= limit():
+                        offer(float(d2[j]), lo + int(j))
+                continue
+
+            axis = depth % 3
+            mid = (lo + hi) // 2
+            p = coords[mid]
+            d = p - q
+            d2 = float(d @ d)
+            if d2 <= limit():
+                offer(d2, mid)
+
+            diff = q[axis] - p[axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            stack.append((far[0], far[1], depth + 1, max(min_d2, diff * diff)))
+            stack.append((near[0], near[1], depth + 1, min_d2))
+
+        return sorted((_distance_m(math.sqrt(-nd2)), i) for nd2, i in best)
+
+    def record(self, row: int) -> dict:
+        p = self.points[row]
+        name, address, place_id = "Unknown", "", ""
+        if self._text is not None:
+            off, length = int(p["text_off"]), int(p["text_len"])
+            parts = bytes(self._text[off:off + length]).decode("utf-8").split(_SEP)
+            name, address, place_id = (parts + ["", "", ""])[:3]
+        rating = float(p["rating"])
+        total = int(p["ratings_total"])
+        return {
+            "name": name,
+            "lat": float(p["lat"]),
+            "lng": float(p["lng"]),
+            "address": address or None,
+            "place_id": place_id or None,
+            "type": TYPE_NAMES[int(p["kind"])],
+            "rating": None if math.isnan(rating) else round(rating, 2),
+            "user_ratings_total": None if total < 0 else total,
+        }
+
+
+class LearnedPlaces:
+    """
+    Safe stops learned from Google Places answers, bucketed on a
+    LEARNED_CELL_DEG lat/lng grid. Holds at most `max_places`; the least
+    recently learned are dropped first.
+    """
+
+    def __init__(self, max_places: int = MAX_LEARNED_PLACES):
+        self.max_places = max_places
+        self.places: "OrderedDict[str, dict]" = OrderedDict()
+        self.cells: Dict[Tuple[int, int], Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cell(lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / LEARNED_CELL_DEG), math.floor(lng / LEARNED_CELL_DEG)
+
+    def __len__(self):
+        return len(self.places)
+
+    def add(self, rec: dict):
+        """Learns a record shaped like PoiIndex.record(); same place_id replaces."""
+        key = rec.get("place_id") or f"{rec['lat']:.5f},{rec['lng']:.5f}"
+        rec = {
+            "name": rec.get("name") or "Unknown",
+            "lat": float(rec["lat"]),
+            "lng": float(rec["lng"]),
+            "address": rec.get("address"),
+            "place_id": rec.get("place_id"),
+            "type": TYPE_NAMES[type_code(rec.get("type"))],
+            "rating": rec.get("rating"),
+            "user_ratings_total": rec.get("user_ratings_total"),
+        }
+        with self._lock:
+            self._discard(key)
+            self.places[key] = rec
+            self.cells.setdefault(self._cell(rec["lat"], rec["lng"]), set()).add(key)
+            while len(self.places) > self.max_places:
+                self._discard(next(iter(self.places)))
+
+    def _discard(self, key: str):
+        old = self.places.pop(key, None)
+        if old is None:
+            return
+        cell = self._cell(old["lat"], old["lng"])
+        keys = self.cells[cell]
+        keys.discard(key)
+        if not keys:
+            del self.cells[cell]
+
+    def nearest(self, lat: float, lng: float, radius_m: float,
+                k: int) -> List[Tuple[float, dict]]:
+        """Up to k (distance_m, record) pairs within radius_m, nearest first."""
+        dlat = radius_m / (EARTH_RADIUS_M * math.pi / 180)
+        dlng = dlat / max(math.cos(math.radians(lat)), 0.01)
+        (y0, x0), (y1, x1) = self._cell(lat - dlat, lng - dlng), self._cell(lat + dlat, lng + dlng)
+        found = []
+        with self._lock:
+            if (y1 - y0 + 1) * (x1 - x0 + 1) > len(self.cells):
+                keys = (key for cell in self.cells.values() for key in cell)
+            else:
+                keys = (
+                    key
+                    for cy in range(y0, y1 + 1)
+                    for cx in range(x0, x1 + 1)
+                    for key in self.cells.get((cy, cx), ())
+                )
+            for key in keys:
+                rec = self.places[key]
+                dist = great_circle_m(lat, lng, rec["lat"], rec["lng"])
+                if dist <= radius_m:
+                    found.append((dist, dict(rec)))
+        found.sort(key=lambda t: t[0])
+        return found[:k]
+
+
+learned_places = LearnedPlaces()
+
+
+def learn(records: Iterable[dict]):
+    """Adds Places results to the learned side index."""
+    for rec in records:
+        learned_places.add(rec)
+
+
+def _same_place(a: dict, b: dict) -> bool:
+    if a.get("place_id") and a.get("place_id") == b.get("place_id"):
+        return True
+    return abs(a["lat"] - b["lat"]) < SAME_SPOT_DEG and abs(a["lng"] - b["lng"]) < SAME_SPOT_DEG
+
+
+def rank_key(kind: int, rating: Optional[float], distance_m: float, radius_m: float) -> float:
+    """
+    Higher is better: type preference, then rating (3.0 if unknown), with a
+    penalty that grows to 1.0 at the edge of the search radius.
+    """
+    r = rating if rating is not None else 3.0
+    return TYPE_WEIGHT.get(kind, 0.0) + r / 5.0 - distance_m / max(radius_m, 1.0)
+
+
+_poi_lock = threading.Lock()
+_poi_index: Optional[PoiIndex] = None
+_poi_checked = False
+
+
+def get_poi_index() -> Optional[PoiIndex]:
+    """
+    Index for NEURODRIVE_POI_FILE, loaded on first use; None if unset or
+    if the file can't be loaded (not retried until restart).
+    """
+    global _poi_index, _poi_checked
+    if not _poi_checked:
+        with _poi_lock:
+            if not _poi_checked:
+                path = os.environ.get("NEURODRIVE_POI_FILE")
+                try:
+                    if path and os.path.exists(path):
+                        _poi_index = PoiIndex(path)
+                except (OSError, ValueError, csv.Error):
+                    _poi_index = None   # Fail safe: fall back to Places
+                finally:
+                    _poi_checked = True
+    return _poi_index
+
+
+def configured() -> bool:
+    """True if a POI file is set, i.e. local results are real data."""
+    return bool(os.environ.get("NEURODRIVE_POI_FILE"))
+
+
+def search(lat: float, lng: float, radius_m: float, max_results: int) -> List[dict]:
+    """
+    Ranked local safe stops within radius_m, from the POI file (if one is
+    configured) and the learned Places results. Pulls a wider
+    nearest-neighbour candidate set, then ranks it.
+    """
+    k = max(max_results * 4, 20)
+    candidates: List[Tuple[float, dict]] = []
+    index = get_poi_index()
+    if index is not None:
+        candidates = [(dist, index.record(row)) for dist, row in index.nearest(lat, lng, radius_m, k)]
+    for dist, rec in learned_places.nearest(lat, lng, radius_m, k):
+        if not any(_same_place(rec, known) for _, known in candidates):
+            candidates.append((dist, rec))
+
+    ranked = []
+    for dist, rec in candidates:
+        rec["distance_m"] = round(dist, 1)
+        score = rank_key(TYPE_CODES[rec["type"]], rec["rating"], dist, radius_m)
+        ranked.append((score, rec))
+    ranked.sort(key=lambda t: t[0], reverse=True)
+    return [rec for _, rec in ranked[:max_results]]
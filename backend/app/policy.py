@@ -0,0 +1,245 @@
+"""
+Escalation policies.
+
+A policy is compiled once into flat tuples so evaluation is a short loop
+over (level, score_min, forecast_min) rows with no per-call allocation.
+Policies come from a JSON file (NEURODRIVE_POLICY_FILE) and are picked
+per user, then per fleet, then "default":
+
+{
+  "policies": {
+    "strict": {
+      "reset_below": 40,
+      "levels": [
+        {"level": 4, "score": 85, "forecast": 85, "action": "..."},
+        ...
+      ],
+      "actions": {"0": "..."}          # optional extra/override actions
+    }
+  },
+  "users": {"driver-1": "strict"},
+  "fleets": {"night-haul": "strict"}
+}
+
+The file is re-read when its mtime changes (checked every
+RELOAD_CHECK_SECONDS on a daemon thread, so requests never touch the
+file), so edits apply without a restart.
+"""
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+RELOAD_CHECK_SECONDS = 5.0
+
+
+def policy_file() -> Optional[str]:
+    # Read lazily so a .env loaded by the app factory is honoured
+    return os.environ.get("NEURODRIVE_POLICY_FILE")
+
+
+class EscalationPolicy:
+    __slots__ = ("name", "rows", "actions", "reset_below")
+
+    def __init__(self, name: str, rows, actions, reset_below: Optional[int]):
+        self.name = name
+        # Highest level first so the riskiest match wins
+        self.rows: Tuple[Tuple[int, float, float], ...] = tuple(
+            sorted(rows, key=lambda r: r[0], reverse=True)
+        )
+        self.actions: Tuple[str, ...] = tuple(actions)
+        self.reset_below = reset_below
+
+    def level_for(self, score: float, predicted_risk: float) -> int:
+        for level, score_min, forecast_min in self.rows:
+            if score >= score_min or predicted_risk >= forecast_min:
+                return level
+        return 0
+
+    def action(self, level: int) -> str:
+        # compile_policy gives every level an action; clamp anything else
+        return self.actions[max(0, min(level, len(self.actions) - 1))]
+
+
+DEFAULT_POLICY = EscalationPolicy(
+    name="default",
+    rows=[
+        (4, 90, 90),   # 🔴 EMERGENCY — immediate jump
+        (3, 80, 80),   # 🟠 CRITICAL — pull over immediately
+        (2, 65, 70),   # 🟡 HIGH — vibration
+        (1, 50, 60),   # 🔵 MODERATE — gentle alert
+    ],
+    actions=[
+        "✅ Normal monitoring",
+        "🔊 Gentle audio alert",
+        "📳 Trigger vibration",
+        "🚨 Strong alert + instruct to pull over",
+        "📞 Notify emergency contact",
+    ],
+    reset_below=45,
+)
+
+
+def _threshold(name: str, entry: dict, key: str) -> float:
+    value = entry.get(key, float("inf"))
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"policy '{name}': '{key}' must be a number")
+    return float(value)
+
+
+def compile_policy(name: str, spec: dict) -> EscalationPolicy:
+    """
+    Builds an EscalationPolicy from its config dict.
+    Raises ValueError on malformed specs.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f"policy '{name}' must be an object")
+    levels = spec.get("levels", [])
+    extra_actions = spec.get("actions", {})
+    if not isinstance(levels, list) or not isinstance(extra_actions, dict):
+        raise ValueError(f"policy '{name}': 'levels' must be a list and 'actions' an object")
+
+    rows = []
+    actions = dict(enumerate(DEFAULT_POLICY.actions))
+    for entry in levels:
+        if not isinstance(entry, dict):
+            raise ValueError(f"policy '{name}': every level must be an object")
+        try:
+            level = int(entry["level"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"policy '{name}': every level needs an integer 'level'")
+        if level <= 0:
+            raise ValueError(f"policy '{name}': levels must be >= 1")
+        score_min = _threshold(name, entry, "score")
+        forecast_min = _threshold(name, entry, "forecast")
+        rows.append((level, score_min, forecast_min))
+        if "action" in entry:
+            actions[level] = entry["action"]
+
+    for level, text in extra_actions.items():
+        try:
+            level = int(level)
+        except ValueError:
+            raise ValueError(f"policy '{name}': action keys must be integer levels")
+        if level < 0:
+            raise ValueError(f"policy '{name}': levels must be >= 0")
+        actions[level] = text
+    if not all(isinstance(text, str) for text in actions.values()):
+        raise ValueError(f"policy '{name}': actions must be strings")
+
+    if not rows:
+        raise ValueError(f"policy '{name}' has no levels")
+
+    # Every level up to the highest one gets an action; a level without
+    # its own keeps the action of the level below
+    top = max(max(actions), max(level for level, _, _ in rows))
+    action_list = [actions[0]]
+    for i in range(1, top + 1):
+        action_list.append(actions.get(i, action_list[-1]))
+    reset_below = spec.get("reset_below", DEFAULT_POLICY.reset_below)
+    if reset_below is not None and (
+        isinstance(reset_below, bool) or not isinstance(reset_below, (int, float))
+    ):
+        raise ValueError(f"policy '{name}': 'reset_below' must be a number or null")
+
+    return EscalationPolicy(name, rows, action_list, reset_below)
+
+
+class PolicyRegistry:
+    """Immutable snapshot of compiled policies and assignments."""
+
+    def __init__(self, policies: Dict[str, EscalationPolicy],
+                 users: Dict[str, str], fleets: Dict[str, str]):
+        self.policies = policies
+        self.users = users
+        self.fleets = fleets
+
+    def resolve(self, user_id: Optional[str], fleet_id: Optional[str]) -> EscalationPolicy:
+        name = self.users.get(user_id) if user_id else None
+        if name is None and fleet_id:
+            name = self.fleets.get(fleet_id)
+        if name is None:
+            name = "default"
+        return self.policies.get(name) or self.policies["default"]
+
+
+def _assignments(raw: dict, key: str) -> Dict[str, str]:
+    value = raw.get(key, {})
+    if not isinstance(value, dict) or not all(isinstance(v, str) for v in value.values()):
+        raise ValueError(f"'{key}' must map ids to policy names")
+    return dict(value)
+
+
+def load_registry(path: str) -> PolicyRegistry:
+    """Reads and compiles the policy file; raises OSError or ValueError."""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    if not isinstance(raw, dict) or not isinstance(raw.get("policies", {}), dict):
+        raise ValueError("policy file must be an object with a 'policies' object")
+
+    policies = {"default": DEFAULT_POLICY}
+    for name, spec in raw.get("policies", {}).items():
+        policies[name] = compile_policy(name, spec)
+
+    users = _assignments(raw, "users")
+    fleets = _assignments(raw, "fleets")
+    for name in list(users.values()) + list(fleets.values()):
+        if name not in policies:
+            raise ValueError(f"unknown policy '{name}' in assignments")
+
+    return PolicyRegistry(policies, users, fleets)
+
+
+_registry = PolicyRegistry({"default": DEFAULT_POLICY}, {}, {})
+_loaded_mtime: Optional[float] = None
+_reloader: Optional[threading.Thread] = None
+_stop_reloader = threading.Event()
+
+
+def reload_policies(force: bool = False) -> PolicyRegistry:
+    """
+    Re-reads the policy file if it changed. A bad file raises and leaves
+    the current registry in place.
+    """
+    global _registry, _loaded_mtime
+    path = policy_file()
+    if not path:
+        return _registry
+
+    mtime = os.path.getmtime(path)
+    if force or mtime != _loaded_mtime:
+        _registry = load_registry(path)
+        _loaded_mtime = mtime
+    return _registry
+
+
+def _try_reload():
+    try:
+        reload_policies()
+    except (OSError, ValueError):
+        # Keep serving the last good policies
+        pass
+
+
+def _reload_loop(interval: float):
+    while not _stop_reloader.wait(interval):
+        _try_reload()
+
+
+def start_policy_reloader(interval: float = RELOAD_CHECK_SECONDS):
+    """Loads the policy file now, then re-checks it on a daemon thread."""
+    global _reloader
+    if _reloader is None:
+        _try_reload()
+        _reloader = threading.Thread(
+            target=_reload_loop, args=(interval,), name="policy-reloader", daemon=True
+        )
+        _reloader.start()
+
+
+def stop_policy_reloader():
+    _stop_reloader.set()
+
+
+def get_policy(user_id: Optional[str] = None, fleet_id: Optional[str] = None) -> EscalationPolicy:
+    return _registry.resolve(user_id, fleet_id)
@@ -0,0 +1,165 @@
+"""
+Warm cache of safe-stop suggestions.
+
+Lookups are keyed by map tile (zoom CACHE_ZOOM, roughly 1 km) and search
+radius, so drivers near each other share one entry and one upstream call.
+The shared lookup is centred on the tile and widened by TILE_MARGIN_M so
+it covers the radius from anywhere in the tile; `localize` then turns the
+tile's places into the answer for the caller's own position (distances,
+radius filter, ranking).
+Prefetches run on a small thread pool; when PREFETCH_MAX_INFLIGHT lookups
+are already running, new prefetches are dropped rather than queued.
+
+Empty results (nothing nearby, or an upstream lookup that failed and came
+back empty) are only kept for EMPTY_TTL_SECONDS, so one transient failure
+doesn't hide a tile's safe stops for the full CACHE_TTL_SECONDS.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from geo import tile_center, tile_xy
+
+CACHE_ZOOM = 15
+TILE_MARGIN_M = 900          # half the diagonal of a zoom-15 tile, rounded up
+CACHE_TTL_SECONDS = 600
+EMPTY_TTL_SECONDS = 15
+CACHE_MAX_ENTRIES = 10000
+PREFETCH_MAX_INFLIGHT = 4
+
+# Prefetch once a driver reaches this level, or the forecast peaks here
+PREFETCH_LEVEL = 2
+PREFETCH_FORECAST_THRESHOLD = 65.0
+
+
+class SafeStopCache:
+    def __init__(self, fetch: Callable[[float, float, int], List],
+                 localize: Optional[Callable[[List, float, float, int], List]] = None,
+                 ttl: float = CACHE_TTL_SECONDS,
+                 empty_ttl: float = EMPTY_TTL_SECONDS,
+                 max_entries: int = CACHE_MAX_ENTRIES,
+                 max_inflight: int = PREFETCH_MAX_INFLIGHT):
+        self.fetch = fetch
+        self.localize = localize or (lambda places, lat, lng, radius_m: places)
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
+        self.max_entries = max_entries
+        self.max_inflight = max_inflight
+        # key -> (expires_at monotonic, places)
+        self._entries: "OrderedDict[Tuple, Tuple[float, List]]" = OrderedDict()
+        self._inflight: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.hits = 0
+        self.misses = 0
+        self.prefetches = 0
+        self.dropped = 0
+
+    @staticmethod
+    def key(lat: float, lng: float, radius_m: int) -> Tuple:
+        x, y = tile_xy(lat, lng, CACHE_ZOOM)
+        return (x, y, radius_m)
+
+    def _fetch_tile(self, k: Tuple) -> List:
+        lat, lng = tile_center(k[0], k[1], CACHE_ZOOM)
+        return self.fetch(lat, lng, k[2] + TILE_MARGIN_M)
+
+    def _cached(self, k: Tuple) -> Optional[List]:
+        with self._lock:
+            entry = self._entries.get(k)
+            if entry is None or time.monotonic() > entry[0]:
+                return None
+            self._entries.move_to_end(k)
+            return entry[1]
+
+    def get(self, lat: float, lng: float, radius_m: int) -> Optional[List]:
+        places = self._cached(self.key(lat, lng, radius_m))
+        return self.localize(places, lat, lng, radius_m) if places is not None else None
+
+    def _put(self, k: Tuple, places: List):
+        with self._lock:
+            ttl = self.ttl if places else self.empty_ttl
+            self._entries[k] = (time.monotonic() + ttl, places)
+            self._entries.move_to_end(k)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_fetch(self, lat: float, lng: float, radius_m: int) -> Tuple[List, bool]:
+        """
+        (places, from_cache), as seen from (lat, lng). Joins a prefetch
+        already running for the tile, otherwise fetches synchronously on a
+        miss (or if the prefetch came back empty).
+        """
+        k = self.key(lat, lng, radius_m)
+        places = self._cached(k)
+        if places is not None:
+            self.hits += 1
+            return self.localize(places, lat, lng, radius_m), True
+
+        with self._lock:
+            pending = self._inflight.get(k)
+        if pending is not None:
+            try:
+                places = pending.result()
+                if places:
+                    self.hits += 1
+                    return self.localize(places, lat, lng, radius_m), True
+            except Exception:
+                pass
+
+        self.misses += 1
+        places = self._fetch_tile(k)
+        self._put(k, places)
+        return self.localize(places, lat, lng, radius_m), False
+
+    def prefetch(self, lat: float, lng: float, radius_m: int) -> bool:
+        """
+        Schedules a background lookup unless the tile is already cached or
+        being fetched, or the in-flight budget is used up.
+        """
+        k = self.key(lat, lng, radius_m)
+        with self._lock:
+            entry = self._entries.get(k)
+            if entry is not None and time.monotonic() <= entry[0]:
+                return False
+            if k in self._inflight:
+                return False
+            if len(self._inflight) >= self.max_inflight:
+                self.dropped += 1
+                return False
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_inflight, thread_name_prefix="safe-stop-prefetch"
+                )
+            self._inflight[k] = self._pool.submit(self._run, k)
+            self.prefetches += 1
+        return True
+
+    def _run(self, k: Tuple) -> List:
+        # A failed prefetch raises into its Future; callers fall back to a
+        # live lookup
+        try:
+            places = self._fetch_tile(k)
+            self._put(k, places)
+            return places
+        finally:
+            with self._lock:
+                self._inflight.pop(k, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "prefetches": self.prefetches,
+            "dropped": self.dropped,
+        }
+
+
+def should_prefetch(level: int, forecast: List[float]) -> bool:
+    return level >= PREFETCH_LEVEL or (
+        bool(forecast) and max(forecast) >= PREFETCH_FORECAST_THRESHOLD
+    )
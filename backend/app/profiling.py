@@ -0,0 +1,191 @@
+"""
+On-demand CPU and allocation profiling of the running worker.
+
+Neither profiler costs anything until it is started: the CPU sampler is a
+thread that exists only for the requested window, and tracemalloc is
+started for the window and stopped again afterwards.
+
+- CpuSampler walks sys._current_frames() every SAMPLE_INTERVAL_SECONDS
+  and counts identical stacks, which is the "collapsed stack" format that
+  flamegraph.pl / speedscope read directly ("frame;frame;frame count").
+- AllocationTracer snapshots tracemalloc at the start and end of the
+  window and attributes the growth to the store that allocated it, by
+  matching the innermost backend frame of each allocation traceback
+  against STORE_SITES. While tracing, allocation-heavy code such as
+  /predict runs several times slower, so keep memory windows short.
+"""
+import ast
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+SAMPLE_INTERVAL_SECONDS = 0.005
+MAX_PROFILE_SECONDS = 60
+TRACE_FRAMES = 16
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (file, function or None for the whole file) -> store. The innermost
+# backend frame that matches decides where an allocation is counted.
+STORE_SITES: Dict[Tuple[str, Optional[str]], str] = {
+    ("main.py", "process_reading"): "fatigue_history",
+    ("main.py", "log_system_event"): "fatigue_history",
+    ("main.py", "safe_stop"): "fatigue_history",
+    ("timeline_index.py", None): "driver_timeline",
+    ("main.py", "_new_snippet_meta"): "incident_snippets",
+    ("main.py", "_attach_snippet"): "incident_snippets",
+    ("main.py", "publish_profile"): "profiles",
+    ("main.py", "personalized_profile"): "profiles",
+    ("calibration.py", None): "profiles",
+    ("sessions.py", None): "sessions",
+    ("sketch.py", None): "ear_sketches",
+    ("rollups.py", None): "rollups",
+    ("serialization.py", None): "encoded_events",
+    ("geo.py", None): "heatmap",
+    ("risk_index.py", None): "at_risk_index",
+    ("snippet_store.py", None): "snippet_store",
+}
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class CpuSampler:
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._running = False
+
+    @staticmethod
+    def _label(code) -> str:
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self, stacks: Counter, skip: int, names: Dict[int, str]):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == skip:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, f"thread-{thread_id}"))
+            stacks[";".join(reversed(labels))] += 1
+
+    def run(self, seconds: float) -> Tuple[str, int]:
+        """
+        Samples every thread for `seconds` (blocking the caller, which should
+        be a worker thread); returns (collapsed stacks, samples taken).
+        """
+        with self._lock:
+            if self._running:
+                raise ProfilerBusy("A CPU profile is already running")
+            self._running = True
+        try:
+            stacks: Counter = Counter()
+            me = threading.get_ident()
+            deadline = time.monotonic() + min(seconds, MAX_PROFILE_SECONDS)
+            samples = 0
+            while time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                self._sample(stacks, me, names)
+                samples += 1
+                time.sleep(self.interval)
+        finally:
+            self._running = False
+        collapsed = "\n".join(f"{stack} {n}" for stack, n in stacks.most_common())
+        return collapsed, samples
+
+
+class AllocationTracer:
+    def __init__(self, nframes: int = TRACE_FRAMES):
+        self.nframes = nframes
+        self._lock = threading.Lock()
+        self._running = False
+        # file -> [(first line, last line, function name)]
+        self._functions: Dict[str, List[Tuple[int, int, str]]] = {}
+
+    def _function_at(self, filename: str, lineno: int) -> Optional[str]:
+        spans = self._functions.get(filename)
+        if spans is None:
+            spans = []
+            try:
+                with open(filename, encoding="utf-8") as f:
+                    tree = ast.parse(f.read())
+                for node in ast.walk(tree):
+                    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        spans.append((node.lineno, node.end_lineno, node.name))
+            except (OSError, SyntaxError):
+                pass
+            # innermost (shortest) span first, for nested functions
+            spans.sort(key=lambda s: s[1] - s[0])
+            self._functions[filename] = spans
+        for first, last, name in spans:
+            if first <= lineno <= last:
+                return name
+        return None
+
+    def _store_for(self, traceback) -> str:
+        for frame in reversed(traceback):   # innermost first
+            if os.path.dirname(frame.filename) != APP_DIR:
+                continue
+            base = os.path.basename(frame.filename)
+            store = STORE_SITES.get((base, None))
+            if store is None:
+                store = STORE_SITES.get((base, self._function_at(frame.filename, frame.lineno)))
+            if store is not None:
+                return store
+        return "other"
+
+    def run(self, seconds: float, top: int = 10) -> dict:
+        """
+        Traces allocations for `seconds` (blocking the caller); returns the
+        net growth per store, with the largest allocation sites in each.
+        """
+        with self._lock:
+            if self._running:
+                raise ProfilerBusy("An allocation trace is already running")
+            self._running = True
+        started_here = not tracemalloc.is_tracing()
+        try:
+            if started_here:
+                tracemalloc.start(self.nframes)
+            before = tracemalloc.take_snapshot()
+            time.sleep(min(seconds, MAX_PROFILE_SECONDS))
+            after = tracemalloc.take_snapshot()
+            overhead = tracemalloc.get_tracemalloc_memory()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+            self._running = False
+
+        stores: Dict[str, dict] = {}
+        for stat in after.compare_to(before, "traceback"):
+            if not stat.size_diff and not stat.count_diff:
+                continue
+            name = self._store_for(stat.traceback)
+            entry = stores.setdefault(name, {"size_diff": 0, "count_diff": 0, "sites": Counter()})
+            entry["size_diff"] += stat.size_diff
+            entry["count_diff"] += stat.count_diff
+            frame = stat.traceback[-1]
+            entry["sites"][f"{os.path.basename(frame.filename)}:{frame.lineno}"] += stat.size_diff
+
+        return {
+            "seconds": min(seconds, MAX_PROFILE_SECONDS),
+            "tracemalloc_overhead_bytes": overhead,
+            "stores": {
+                name: {
+                    "size_diff": e["size_diff"],
+                    "count_diff": e["count_diff"],
+                    "top_sites": [
+                        {"site": site, "size_diff": size}
+                        for site, size in e["sites"].most_common(top)
+                    ],
+                }
+                for name, e in sorted(stores.items(), key=lambda kv: -kv[1]["size_diff"])
+            },
+        }
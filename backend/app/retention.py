@@ -0,0 +1,187 @@
+"""
+Snippet retention and garbage collection.
+
+A daemon thread keeps the snippet store under its disk quota and age
+limits. It works from the store's SQLite index in small batches, so a
+sweep never lists the blob directory and never holds the store lock for
+long; uploads and /predict are not blocked by it.
+
+Clips are kept by priority (from the event type): critical fatigue clips
+longest, then warnings, then everything else. Over quota, the lowest
+priority, oldest clips go first until usage is back under the low-water
+mark.
+
+Each tick also reconciles one blob shard directory against the index:
+blob files with no index row, stale temp files and index rows whose file
+is gone are cleaned up, so the whole tree is covered every 257 ticks.
+"""
+import os
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+DEFAULT_QUOTA_BYTES = 10 * 1024 ** 3
+LOW_WATER_FRACTION = 0.9
+
+PRIORITY_BY_EVENT_TYPE = {"critical_fatigue": 2, "fatigue_warning": 1}
+MAX_AGE_SECONDS = {
+    2: 90 * 86400,
+    1: 30 * 86400,
+    0: 7 * 86400,
+}
+
+SWEEP_INTERVAL_SECONDS = 30
+SWEEP_BATCH = 200
+# Files this young may belong to a commit in progress
+ORPHAN_GRACE_SECONDS = 300
+TMP_MAX_AGE_SECONDS = 24 * 3600
+
+SHARDS = [f"{i:02x}" for i in range(256)] + ["tmp"]
+
+
+def snippet_priority(event_type: Optional[str]) -> int:
+    return PRIORITY_BY_EVENT_TYPE.get(event_type or "", 0)
+
+
+def quota_from_env() -> int:
+    raw = os.environ.get("NEURODRIVE_SNIPPET_QUOTA_BYTES")
+    try:
+        return int(raw) if raw else DEFAULT_QUOTA_BYTES
+    except ValueError:
+        return DEFAULT_QUOTA_BYTES
+
+
+class RetentionManager:
+    def __init__(self, store, quota_bytes: Optional[int] = None,
+                 on_evict: Optional[Callable[[List[str]], None]] = None,
+                 interval: float = SWEEP_INTERVAL_SECONDS):
+        self.store = store
+        self.quota_bytes = quota_bytes if quota_bytes is not None else quota_from_env()
+        self.on_evict = on_evict
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_shard = 0
+        self.expired = 0
+        self.evicted = 0
+        self.orphans_removed = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._loop, name="snippet-retention", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def nudge(self):
+        """Called after uploads; wakes the sweeper early once over quota."""
+        if self.store.stored_bytes > self.quota_bytes:
+            self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception:
+                pass   # keep sweeping; a bad tick shouldn't end retention
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def sweep(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        self.expire(now)
+        self.enforce_quota()
+        self.store.purge_revoked(now)
+        self.reconcile_shard(SHARDS[self._next_shard], now)
+        self._next_shard = (self._next_shard + 1) % len(SHARDS)
+
+    def _release(self, event_ids: Iterable[str]) -> List[str]:
+        released = self.store.release_many(event_ids)
+        if released and self.on_evict is not None:
+            self.on_evict(released)
+        return released
+
+    def expire(self, now: float):
+        for priority, max_age in MAX_AGE_SECONDS.items():
+            while True:
+                batch = self.store.expired(priority, now - max_age, SWEEP_BATCH)
+                if not batch:
+                    break
+                self.expired += len(self._release(batch))
+                if len(batch) < SWEEP_BATCH:
+                    break
+
+    def enforce_quota(self):
+        if self.store.stored_bytes <= self.quota_bytes:
+            return
+        target = self.quota_bytes * LOW_WATER_FRACTION
+        while self.store.stored_bytes > target:
+            batch = self.store.eviction_candidates(SWEEP_BATCH)
+            if not batch:
+                break
+            # Shared blobs only free space on their last reference, so
+            # re-check usage after each release rather than predicting it
+            for event_id in batch:
+                self.evicted += len(self._release([event_id]))
+                if self.store.stored_bytes <= target:
+                    break
+
+    def reconcile_shard(self, shard: str, now: float):
+        path = os.path.join(self.store.blob_dir, shard)
+        try:
+            entries = list(os.scandir(path))
+        except FileNotFoundError:
+            entries = []
+
+        if shard == "tmp":
+            for entry in entries:
+                if now - entry.stat().st_mtime > TMP_MAX_AGE_SECONDS:
+                    self._remove(entry.path)
+            return
+
+        on_disk = set()
+        for entry in entries:
+            blob_id, ext = os.path.splitext(entry.name)
+            if ext != ".snp":
+                if now - entry.stat().st_mtime > ORPHAN_GRACE_SECONDS:
+                    self._remove(entry.path)
+                continue
+            on_disk.add(blob_id)
+
+        indexed = set(self.store.blobs_in_shard(shard))
+        for blob_id in on_disk - indexed:
+            blob_path = self.store.blob_path(blob_id)
+            try:
+                young = now - os.stat(blob_path).st_mtime <= ORPHAN_GRACE_SECONDS
+            except FileNotFoundError:
+                continue
+            # Re-check: the blob may have been committed since the listing
+            if not young and not self.store.has_blob(blob_id):
+                self._remove(blob_path)
+
+        for blob_id in indexed - on_disk:
+            if not os.path.exists(self.store.blob_path(blob_id)):
+                dropped = self.store.drop_blob(blob_id)
+                if dropped and self.on_evict is not None:
+                    self.on_evict(dropped)
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+            self.orphans_removed += 1
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "quota_bytes": self.quota_bytes,
+            "stored_bytes": self.store.stored_bytes,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "orphans_removed": self.orphans_removed,
+        }
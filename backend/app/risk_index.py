@@ -0,0 +1,85 @@
+"""
+Live ranking of at-risk drivers for fleet operators.
+
+Drivers are kept in one list sorted by (escalation level, score, forecast
+peak), updated on every reading: a bisect finds the old and new slots, so
+the search is O(log n) and the list shift is a single memmove. Top-K walks
+the list from the riskiest end. Level is the primary key, so a minimum
+level filter stops the walk early; drivers with no reading for
+STALE_AFTER_SECONDS are dropped when the walk reaches them.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+STALE_AFTER_SECONDS = 600
+MAX_TOP_K = 500
+
+
+class AtRiskIndex:
+    def __init__(self, stale_after: float = STALE_AFTER_SECONDS):
+        self.stale_after = stale_after
+        # ascending (level, score, forecast_peak, user_id)
+        self.keys: List[Tuple[int, int, float, str]] = []
+        # user_id -> (key, last reading unix ts, fleet_id)
+        self.entries: Dict[str, Tuple[tuple, float, Optional[str]]] = {}
+        self._lock = threading.Lock()
+
+    def _drop(self, user_id: str):
+        entry = self.entries.pop(user_id, None)
+        if entry is not None:
+            i = bisect.bisect_left(self.keys, entry[0])
+            del self.keys[i]
+
+    def update(self, user_id: str, level: int, score: int, forecast_peak: float,
+               ts: float, fleet_id: Optional[str] = None):
+        key = (level, score, round(forecast_peak, 2), user_id)
+        with self._lock:
+            self._drop(user_id)
+            bisect.insort(self.keys, key)
+            self.entries[user_id] = (key, ts, fleet_id)
+
+    def remove(self, user_id: str):
+        with self._lock:
+            self._drop(user_id)
+
+    def top(self, k: int, min_level: int = 0, max_age: Optional[float] = None,
+            now: Optional[float] = None) -> List[dict]:
+        """
+        Up to k riskiest drivers at `min_level` or above whose last reading
+        is at most `max_age` seconds old, riskiest first.
+        """
+        now = time.time() if now is None else now
+        out = []
+        stale = []
+        with self._lock:
+            for i in range(len(self.keys) - 1, -1, -1):
+                if len(out) >= k:
+                    break
+                key = self.keys[i]
+                level, score, forecast_peak, user_id = key
+                if level < min_level:
+                    break
+                _, ts, fleet_id = self.entries[user_id]
+                age = now - ts
+                if age > self.stale_after:
+                    stale.append(user_id)
+                    continue
+                if max_age is not None and age > max_age:
+                    continue
+                out.append({
+                    "user_id": user_id,
+                    "fleet_id": fleet_id,
+                    "escalation_level": level,
+                    "fatigue_score": score,
+                    "forecast_peak": forecast_peak,
+                    "last_reading_at": ts,
+                    "seconds_since_reading": round(age, 1),
+                })
+            for user_id in stale:
+                self._drop(user_id)
+        return out
+
+    def __len__(self):
+        return len(self.keys)
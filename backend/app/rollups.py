@@ -0,0 +1,99 @@
+import bisect
+from typing import List
+
+# (bucket width in seconds, number of buckets retained)
+RESOLUTIONS = [
+    (10, 8640),     # 10 s  -> 24 h
+    (60, 10080),    # 1 min -> 7 days
+    (900, 8640),    # 15 min -> 90 days
+    (3600, 8760),   # 1 h   -> 365 days
+]
+
+
+class RollupSeries:
+    """
+    Fixed-width buckets of min/sum/max/count/alert-count for one resolution.
+    Bucket starts are kept sorted so range lookups are a bisect.
+    """
+
+    def __init__(self, width: int, retention: int):
+        self.width = width
+        self.retention = retention
+        self.starts: List[int] = []
+        self.mins: List[int] = []
+        self.maxs: List[int] = []
+        self.sums: List[int] = []
+        self.counts: List[int] = []
+        self.alerts: List[int] = []
+        self.trimmed = False
+
+    def add(self, ts: float, score: int, alert: bool):
+        start = int(ts) // self.width * self.width
+
+        if self.starts and start <= self.starts[-1]:
+            # Late reading: fold into its bucket if we still hold it
+            i = len(self.starts) - 1 if start == self.starts[-1] else bisect.bisect_left(self.starts, start)
+            if i >= len(self.starts) or self.starts[i] != start:
+                return
+            if score < self.mins[i]:
+                self.mins[i] = score
+            if score > self.maxs[i]:
+                self.maxs[i] = score
+            self.sums[i] += score
+            self.counts[i] += 1
+            self.alerts[i] += alert
+            return
+
+        self.starts.append(start)
+        self.mins.append(score)
+        self.maxs.append(score)
+        self.sums.append(score)
+        self.counts.append(1)
+        self.alerts.append(int(alert))
+
+        # Trim in batches so the per-reading cost stays amortised O(1)
+        if len(self.starts) > 2 * self.retention:
+            drop = len(self.starts) - self.retention
+            for col in (self.starts, self.mins, self.maxs, self.sums, self.counts, self.alerts):
+                del col[:drop]
+            self.trimmed = True
+
+    def covers(self, since: float) -> bool:
+        """False if buckets at or after `since` have already been trimmed."""
+        return not self.trimmed or self.starts[0] <= since
+
+    def range(self, since: float, until: float) -> List[dict]:
+        lo = bisect.bisect_left(self.starts, int(since) // self.width * self.width)
+        hi = bisect.bisect_right(self.starts, until)
+        return [
+            {
+                "start": self.starts[i],
+                "min": self.mins[i],
+                "mean": round(self.sums[i] / self.counts[i], 2),
+                "max": self.maxs[i],
+                "count": self.counts[i],
+                "alerts": self.alerts[i],
+            }
+            for i in range(lo, hi)
+        ]
+
+
+class DriverRollups:
+    def __init__(self):
+        self.series = [RollupSeries(w, n) for w, n in RESOLUTIONS]
+
+    def add(self, ts: float, score: int, alert: bool):
+        for s in self.series:
+            s.add(ts, score, alert)
+
+    def pick(self, since: float, until: float, max_points: int) -> RollupSeries:
+        """
+        Finest resolution that fits `max_points` over the range and still
+        retains data back to `since`; falls back to the coarsest.
+        """
+        span = max(until - since, 0)
+        for s in self.series:
+            if span / s.width <= max_points and s.covers(since):
+                return s
+        return self.series[-1]
+
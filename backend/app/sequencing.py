@@ -0,0 +1,204 @@
+"""
+Exactly-once, in-order /predict readings.
+
+Clients number each driver's readings (DriverData.seq) within an epoch
+(DriverData.seq_epoch); a client that restarts its counter sends a higher
+epoch. Per driver:
+
+- a SEQ_WINDOW-bit mask over the last applied sequence numbers answers
+  "already applied?" in O(1); retries of recent readings get the cached
+  response instead of being scored again
+- a retry of a reading that is still being processed waits for it and
+  shares its response
+- a reading that arrives ahead of a gap waits up to REORDER_WAIT_SECONDS
+  for the missing ones, then the gap is skipped; a straggler that shows
+  up after that is rejected as late rather than applied out of order
+- a reading that failed (shed, invalid) doesn't hold up the ones after
+  it, and its retry is applied when it comes, even after later readings
+- a sequence number below the window, or an older epoch, is rejected:
+  it can no longer be told whether that reading was applied
+
+Memory per driver is bounded: one int mask, RESPONSE_CACHE_SIZE cached
+responses and the readings currently waiting.
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+SEQ_WINDOW = 64
+RESPONSE_CACHE_SIZE = 16
+REORDER_WAIT_SECONDS = 0.5
+
+_MASK = (1 << SEQ_WINDOW) - 1
+
+
+class SequenceError(Exception):
+    pass
+
+
+class ReadingSequence:
+    __slots__ = (
+        "epoch", "applied", "seen", "failed", "responses", "inflight", "busy", "_changed",
+    )
+
+    def __init__(self):
+        self.epoch = 0
+        self.applied: Optional[int] = None    # highest applied seq
+        self.seen = 0                         # bit i set: seq (applied - i) was applied
+        self.failed: Set[int] = set()         # not applied, inside the window; may be retried
+        self.responses: "OrderedDict[int, dict]" = OrderedDict()
+        self.inflight: Dict[int, asyncio.Future] = {}
+        self.busy = False
+        self._changed: Optional[asyncio.Event] = None
+
+    def was_applied(self, seq: int) -> Optional[bool]:
+        """True/False for seqs inside the window, None outside it."""
+        if self.applied is None or seq > self.applied:
+            return False
+        d = self.applied - seq
+        if d >= SEQ_WINDOW:
+            return None
+        return bool(self.seen >> d & 1)
+
+    def gap_before(self, seq: int) -> bool:
+        """True if a reading between the last applied one and `seq` is still missing."""
+        if self.applied is None or seq <= self.applied + 1:
+            return False
+        if seq - self.applied - 1 > len(self.failed):
+            return True
+        return any(s not in self.failed for s in range(self.applied + 1, seq))
+
+    def reset(self, epoch: int):
+        self.epoch = epoch
+        self.applied = None
+        self.seen = 0
+        self.failed.clear()
+        self.responses.clear()
+
+    def mark_applied(self, seq: int, response: dict):
+        if self.applied is not None and seq < self.applied:
+            # Retry of a failed reading that later ones overtook
+            self.seen |= 1 << (self.applied - seq)
+        elif self.applied is None or seq - self.applied >= SEQ_WINDOW:
+            self.seen = 1
+            self.applied = seq
+        else:
+            self.seen = ((self.seen << (seq - self.applied)) | 1) & _MASK
+            self.applied = seq
+        self.failed.discard(seq)
+        if self.failed:
+            self.failed = {s for s in self.failed if self.applied - s < SEQ_WINDOW}
+        self.responses[seq] = response
+        while len(self.responses) > RESPONSE_CACHE_SIZE:
+            self.responses.popitem(last=False)
+
+    def notify(self):
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    async def wait_changed(self, timeout: Optional[float]):
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def wait_turn(self, seq: int):
+        """Returns once `seq` is the next reading to apply."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + REORDER_WAIT_SECONDS
+        while True:
+            if not self.busy and min(self.inflight) == seq:
+                if not self.gap_before(seq):
+                    return
+                # Missing predecessors: give them a moment, then skip them
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                await self.wait_changed(remaining)
+            else:
+                await self.wait_changed(None)
+
+
+class ReadingSequencer:
+    def __init__(self):
+        self.duplicates = 0
+        self.late = 0
+        self.too_old = 0
+        self.gaps_skipped = 0
+
+    async def submit(self, state: ReadingSequence, seq: int,
+                     handler: Callable[[], Awaitable[dict]], epoch: int = 0) -> dict:
+        """
+        Runs `handler` for reading `seq` of the driver whose sequence state
+        is `state`, exactly once and in order; returns its response (or the
+        cached one for a retry). If `handler` raises, the reading counts as
+        not applied and may be retried.
+        """
+        if epoch > state.epoch:
+            # Counter restarted on the client: let the old epoch drain first
+            while state.inflight:
+                await state.wait_changed(None)
+            if epoch > state.epoch:
+                state.reset(epoch)
+        if epoch < state.epoch:
+            self.too_old += 1
+            raise SequenceError(f"Reading {seq} is from an earlier epoch than {state.epoch}")
+
+        pending = state.inflight.get(seq)
+        if pending is not None:
+            self.duplicates += 1
+            return await asyncio.shield(pending)
+
+        applied = state.was_applied(seq)
+        if applied is None:
+            self.too_old += 1
+            raise SequenceError(
+                f"Reading {seq} is too far behind reading {state.applied} to be applied"
+            )
+        elif applied:
+            self.duplicates += 1
+            return state.responses.get(seq, {"seq": seq, "duplicate": True})
+        elif state.applied is not None and seq < state.applied and seq not in state.failed:
+            self.late += 1
+            raise SequenceError(
+                f"Reading {seq} arrived after reading {state.applied} was applied"
+            )
+
+        fut = asyncio.get_running_loop().create_future()
+        state.inflight[seq] = fut
+        try:
+            await state.wait_turn(seq)
+            if state.gap_before(seq):
+                self.gaps_skipped += 1
+            state.busy = True
+            try:
+                response = await handler()
+            finally:
+                state.busy = False
+            state.mark_applied(seq, response)
+            fut.set_result(response)
+            return response
+        except BaseException as e:
+            # Not applied: don't hold up later readings, allow a retry
+            state.failed.add(seq)
+            if not fut.done():
+                if isinstance(e, Exception):
+                    fut.set_exception(e)
+                    fut.exception()   # retrieved; retries re-raise it
+                else:
+                    fut.cancel()
+            raise
+        finally:
+            del state.inflight[seq]
+            state.notify()
+
+    def stats(self) -> dict:
+        return {
+            "duplicates": self.duplicates,
+            "late": self.late,
+            "too_old": self.too_old,
+            "gaps_skipped": self.gaps_skipped,
+        }
@@ -0,0 +1,103 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from fastapi import Response
+
+try:
+    import msgpack  # optional: compact binary responses
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# event_id -> UTF-8 JSON bytes, least recently served first. Events are
+# complete once they are appended to the histories; anything that mutates
+# one afterwards must call invalidate_event(). Bounded so a long-running
+# worker only keeps the bytes of events that are actually being re-served.
+ENCODED_CACHE_SIZE = 10_000
+_encoded_events: "OrderedDict[str, bytes]" = OrderedDict()
+_encoded_lock = threading.Lock()
+
+
+def _dumps(obj) -> bytes:
+    # Same settings as FastAPI's JSONResponse
+    return json.dumps(
+        obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def encode_event(event: dict) -> bytes:
+    event_id = event.get("event_id")
+    if event_id is None:
+        return _dumps(event)
+    with _encoded_lock:
+        cached = _encoded_events.get(event_id)
+        if cached is not None:
+            _encoded_events.move_to_end(event_id)
+            return cached
+    cached = _dumps(event)
+    with _encoded_lock:
+        _encoded_events[event_id] = cached
+        while len(_encoded_events) > ENCODED_CACHE_SIZE:
+            _encoded_events.popitem(last=False)
+    return cached
+
+
+def invalidate_event(event_id: str):
+    with _encoded_lock:
+        _encoded_events.pop(event_id, None)
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    return (
+        msgpack is not None
+        and accept is not None
+        and any(t in accept for t in MSGPACK_MEDIA_TYPES)
+    )
+
+
+def columnar(rows: List[dict]) -> dict:
+    """
+    {"columns": [...], "data": {col: [values...]}} so field names are sent
+    once rather than once per row.
+    """
+    seen: Dict[str, None] = {}
+    for r in rows:
+        for k in r:
+            seen.setdefault(k)
+    columns = list(seen)
+    return {
+        "columns": columns,
+        "data": {c: [r.get(c) for r in rows] for c in columns},
+    }
+
+
+def events_response(events: List[dict], accept: Optional[str] = None) -> Response:
+    """
+    JSON array assembled from per-event cached bytes, or columnar MessagePack
+    when the client asks for it via Accept.
+    """
+    if wants_msgpack(accept):
+        return Response(
+            content=msgpack.packb(columnar(events)),
+            media_type=MSGPACK_MEDIA_TYPES[0],
+        )
+    body = b"[" + b",".join([encode_event(e) for e in events]) + b"]"
+    return Response(content=body, media_type="application/json")
+
+
+def rows_response(rows: List[dict], accept: Optional[str] = None) -> Response:
+    """Like events_response for small rows that aren't worth caching."""
+    if wants_msgpack(accept):
+        return Response(
+            content=msgpack.packb(columnar(rows)),
+            media_type=MSGPACK_MEDIA_TYPES[0],
+        )
+    return Response(content=_dumps(rows), media_type="application/json")
+
+
+def json_response(obj) -> Response:
+    """Encodes plain JSON types directly, skipping FastAPI's jsonable_encoder walk."""
+    return Response(content=_dumps(obj), media_type="application/json")
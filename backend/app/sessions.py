@@ -0,0 +1,214 @@
+"""
+Per-driver session state.
+
+Everything the backend keeps per driver (escalation state, profile,
+contacts, timeline, EAR sketch, score rollups, last position, reading
+sequence) lives on one DriverSession. Sessions idle for longer than
+SESSION_IDLE_SECONDS are packed into a compressed pickle and dropped from
+the active set; the next access unpacks them again. Active sessions are
+kept in last-access order, so each eviction pass only looks at the idle
+head of the list. Passes run on a daemon thread every EVICT_CHECK_SECONDS,
+never on a request.
+"""
+import os
+import pickle
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from rollups import DriverRollups
+from sequencing import ReadingSequence
+from sketch import EarSketch
+from timeline_index import DriverTimelineIndex
+
+SESSION_IDLE_SECONDS = 1800
+EVICT_CHECK_SECONDS = 30
+EVICT_BATCH = 1000    # sessions packed per pass, to keep lock holds short
+
+_FORMAT = 1
+
+
+class DriverSession:
+    __slots__ = (
+        "user_id", "escalation", "profile", "contacts", "last_sms",
+        "timeline", "sketch", "rollups", "position", "sequence", "last_seen",
+    )
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.escalation: Optional[dict] = None     # level / last_change / recent_scores
+        self.profile: Optional[dict] = None
+        self.contacts: Optional[List[dict]] = None
+        self.last_sms: Optional[float] = None
+        self.timeline: Optional[DriverTimelineIndex] = None
+        self.sketch: Optional[EarSketch] = None
+        self.rollups: Optional[DriverRollups] = None
+        self.position: Optional[tuple] = None       # (lat, lng, unix ts)
+        self.sequence: Optional[ReadingSequence] = None
+        self.last_seen = time.monotonic()
+
+    def timeline_index(self) -> DriverTimelineIndex:
+        if self.timeline is None:
+            self.timeline = DriverTimelineIndex()
+        return self.timeline
+
+    def ear_sketch(self) -> EarSketch:
+        if self.sketch is None:
+            self.sketch = EarSketch()
+        return self.sketch
+
+    def score_rollups(self) -> DriverRollups:
+        if self.rollups is None:
+            self.rollups = DriverRollups()
+        return self.rollups
+
+    def reading_sequence(self) -> ReadingSequence:
+        if self.sequence is None:
+            self.sequence = ReadingSequence()
+        return self.sequence
+
+    def events(self) -> List[dict]:
+        return self.timeline.events if self.timeline is not None else []
+
+    def busy(self) -> bool:
+        return self.sequence is not None and bool(self.sequence.inflight)
+
+    def pack(self) -> bytes:
+        seq = None
+        if self.sequence is not None and self.sequence.applied is not None:
+            seq = (self.sequence.applied, self.sequence.seen, self.sequence.epoch)
+        state = (
+            _FORMAT, self.escalation, self.profile, self.contacts, self.last_sms,
+            self.timeline, self.sketch, self.rollups, self.position, seq,
+        )
+        return zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+    @classmethod
+    def unpack(cls, user_id: str, blob: bytes) -> "DriverSession":
+        state = pickle.loads(zlib.decompress(blob))
+        if state[0] != _FORMAT:
+            raise ValueError(f"Unknown session format {state[0]}")
+        s = cls(user_id)
+        (_, s.escalation, s.profile, s.contacts, s.last_sms,
+         s.timeline, s.sketch, s.rollups, s.position, seq) = state
+        if seq is not None:
+            s.sequence = ReadingSequence()
+            s.sequence.applied, s.sequence.seen, s.sequence.epoch = seq
+        return s
+
+
+def idle_seconds_from_env() -> float:
+    raw = os.environ.get("NEURODRIVE_SESSION_IDLE_SECONDS")
+    try:
+        return float(raw) if raw else SESSION_IDLE_SECONDS
+    except ValueError:
+        return SESSION_IDLE_SECONDS
+
+
+class SessionRegistry:
+    def __init__(self, idle_seconds: Optional[float] = None,
+                 on_evict: Optional[Callable[[DriverSession], None]] = None,
+                 on_rehydrate: Optional[Callable[[DriverSession], None]] = None,
+                 interval: float = EVICT_CHECK_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.on_evict = on_evict
+        self.on_rehydrate = on_rehydrate
+        self.interval = interval
+        self.active: "OrderedDict[str, DriverSession]" = OrderedDict()
+        self.dormant: Dict[str, bytes] = {}
+        self.dormant_bytes = 0
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.evicted = 0
+        self.rehydrated = 0
+
+    def get(self, user_id: str) -> Optional[DriverSession]:
+        """The driver's session (unpacked if dormant), or None if unknown."""
+        with self._lock:
+            session = self.active.get(user_id)
+            if session is not None:
+                self.active.move_to_end(user_id)
+            else:
+                blob = self.dormant.pop(user_id, None)
+                if blob is None:
+                    return None
+                self.dormant_bytes -= len(blob)
+                session = DriverSession.unpack(user_id, blob)
+                if self.on_rehydrate is not None:
+                    self.on_rehydrate(session)
+                self.active[user_id] = session
+                self.rehydrated += 1
+            session.last_seen = time.monotonic()
+        return session
+
+    def peek(self, user_id: str) -> Optional[DriverSession]:
+        """The driver's session if it is active; never unpacks a dormant one."""
+        return self.active.get(user_id)
+
+    def get_or_create(self, user_id: str) -> DriverSession:
+        session = self.get(user_id)
+        if session is None:
+            with self._lock:
+                session = self.active.get(user_id)
+                if session is None:
+                    session = DriverSession(user_id)
+                    self.active[user_id] = session
+        return session
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._loop, name="session-evictor", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                while self.evict_idle() == EVICT_BATCH:
+                    pass
+            except Exception:
+                pass   # keep sweeping; a bad pass shouldn't stop eviction
+
+    def evict_idle(self, now: Optional[float] = None, limit: int = EVICT_BATCH) -> int:
+        now = time.monotonic() if now is None else now
+        if self.idle_seconds is None:
+            self.idle_seconds = idle_seconds_from_env()
+        cutoff = now - self.idle_seconds
+        packed = []
+        with self._lock:
+            for _ in range(min(len(self.active), limit)):
+                user_id, session = next(iter(self.active.items()))
+                if session.last_seen > cutoff:
+                    break
+                if session.busy():
+                    self.active.move_to_end(user_id)
+                    continue
+                del self.active[user_id]
+                blob = session.pack()
+                self.dormant[user_id] = blob
+                self.dormant_bytes += len(blob)
+                packed.append(session)
+        self.evicted += len(packed)
+        if self.on_evict is not None:
+            for session in packed:
+                self.on_evict(session)
+        return len(packed)
+
+    def __len__(self):
+        return len(self.active) + len(self.dormant)
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self.active),
+            "dormant": len(self.dormant),
+            "dormant_bytes": self.dormant_bytes,
+            "evicted": self.evicted,
+            "rehydrated": self.rehydrated,
+        }
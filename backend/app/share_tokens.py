@@ -0,0 +1,114 @@
+"""
+Signed, self-describing snippet share tokens.
+
+A token is base64url(payload) "." base64url(mac), where the payload is
+
+    version (1) | expires_at (4, unix s) | scope (1) | token_id (8) | event_id \\0 user_id
+
+and the mac is the first MAC_BYTES of HMAC-SHA256 over the payload with a
+key derived from the snippet key. Verifying one is a constant-time compare
+plus a revocation lookup, with no table of issued tokens, so any worker
+sharing the snippet key (and restarts) can serve it.
+
+Revoking a token records its token_id in the snippet store's index until
+it would have expired anyway. Every worker checks that table directly,
+so a revocation holds on all of them at once.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import time
+from typing import NamedTuple, Optional, Tuple
+
+from snippet_store import SnippetStore
+
+SCOPE_META = 1
+SCOPE_CONTENT = 2
+SCOPES = {"meta": SCOPE_META, "content": SCOPE_CONTENT, "all": SCOPE_META | SCOPE_CONTENT}
+
+DEFAULT_TTL_SECONDS = 7 * 86400
+MAX_TTL_SECONDS = 90 * 86400
+MAC_BYTES = 16
+
+_VERSION = 1
+_HEADER = struct.Struct(">BIB8s")   # version, expires_at, scope, token_id
+
+
+class ShareTokenError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ShareClaims(NamedTuple):
+    event_id: str
+    user_id: str
+    scope: int
+    expires_at: int
+    token_id: bytes
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class ShareTokens:
+    def __init__(self, key: bytes, store: SnippetStore):
+        self.key = key
+        self.store = store
+
+    def _mac(self, payload: bytes) -> bytes:
+        return hmac.new(self.key, payload, hashlib.sha256).digest()[:MAC_BYTES]
+
+    def issue(self, event_id: str, user_id: str, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+              scope: int = SCOPES["all"], now: Optional[float] = None) -> Tuple[str, ShareClaims]:
+        now = time.time() if now is None else now
+        expires_at = int(now) + max(1, min(ttl_seconds, MAX_TTL_SECONDS))
+        claims = ShareClaims(event_id, user_id, scope, expires_at, os.urandom(8))
+        payload = (
+            _HEADER.pack(_VERSION, expires_at, scope, claims.token_id)
+            + event_id.encode() + b"\0" + user_id.encode()
+        )
+        return f"{_b64encode(payload)}.{_b64encode(self._mac(payload))}", claims
+
+    def decode(self, token: str) -> ShareClaims:
+        """Claims of a genuine token, whatever its expiry or scope."""
+        try:
+            body, _, mac = token.partition(".")
+            payload = _b64decode(body)
+            valid = hmac.compare_digest(_b64decode(mac), self._mac(payload))
+        except (ValueError, UnicodeEncodeError):
+            valid = False
+        if not valid or len(payload) < _HEADER.size:
+            raise ShareTokenError(404, "Invalid share token")
+        version, expires_at, scope, token_id = _HEADER.unpack_from(payload)
+        event_id, sep, user_id = payload[_HEADER.size:].partition(b"\0")
+        if version != _VERSION or not sep:
+            raise ShareTokenError(404, "Invalid share token")
+        return ShareClaims(event_id.decode(), user_id.decode(), scope, expires_at, token_id)
+
+    def verify(self, token: str, scope: int, now: Optional[float] = None) -> ShareClaims:
+        """Claims of a live token that grants `scope`; raises ShareTokenError otherwise."""
+        now = time.time() if now is None else now
+        claims = self.decode(token)
+        if claims.expires_at <= now:
+            raise ShareTokenError(410, "Share token expired")
+        if not claims.scope & scope:
+            raise ShareTokenError(403, "Share token does not grant this access")
+        if self.store.is_revoked(claims.token_id):
+            raise ShareTokenError(410, "Share token revoked")
+        return claims
+
+    def revoke(self, token: str, now: Optional[float] = None) -> ShareClaims:
+        now = time.time() if now is None else now
+        claims = self.decode(token)
+        if claims.expires_at > now:
+            self.store.revoke_token(claims.token_id, claims.expires_at)
+        return claims
@@ -0,0 +1,97 @@
+from array import array
+from typing import Optional
+
+# EAR readings live in roughly [0, 0.5]; 100 bins gives 0.005 resolution.
+EAR_MIN = 0.0
+EAR_MAX = 0.5
+EAR_BINS = 100
+
+# Readings needed before auto-calibrated baselines are trusted
+WARMUP_SAMPLES = 20
+
+# Quantiles used as baselines: eyes are open most of the time, so the
+# median tracks the open EAR and a low quantile tracks closures.
+OPEN_QUANTILE = 0.5
+CLOSED_QUANTILE = 0.03
+
+# A driver who rarely closes their eyes gives a low quantile close to the
+# open EAR; cap closed/open so the span never gets too narrow to score.
+MAX_CLOSED_TO_OPEN = 0.6
+
+_COUNT_CAP = 0xFFFF
+
+
+class EarSketch:
+    """
+    Fixed-memory streaming histogram of one driver's EAR readings.
+
+    Counts are uint16 (200 bytes for 100 bins). When a bin saturates,
+    every bin is halved, which also ages out old readings so baselines
+    follow the driver through a long shift. Update is O(1) amortised;
+    quantile lookup is O(bins).
+    """
+
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts = array("H", bytes(2 * EAR_BINS))
+        self.total = 0
+
+    def add(self, ear: float):
+        i = int((ear - EAR_MIN) / (EAR_MAX - EAR_MIN) * EAR_BINS)
+        if i < 0:
+            i = 0
+        elif i >= EAR_BINS:
+            i = EAR_BINS - 1
+
+        if self.counts[i] == _COUNT_CAP:
+            self._halve()
+        self.counts[i] += 1
+        self.total += 1
+
+    def _halve(self):
+        counts = self.counts
+        total = 0
+        for i in range(EAR_BINS):
+            c = counts[i] >> 1
+            counts[i] = c
+            total += c
+        self.total = total
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.total == 0:
+            return None
+        target = q * self.total
+        seen = 0
+        width = (EAR_MAX - EAR_MIN) / EAR_BINS
+        for i in range(EAR_BINS):
+            c = self.counts[i]
+            if c and seen + c >= target:
+                # Interpolate within the bin
+                frac = (target - seen) / c
+                return EAR_MIN + (i + frac) * width
+            seen += c
+        return EAR_MAX
+
+    def warm(self) -> bool:
+        return self.total >= WARMUP_SAMPLES
+
+    def baselines(self) -> Optional[dict]:
+        """
+        Open/closed EAR and blink thresholds in the same shape as a
+        /calibrate profile, or None until warmed up.
+        """
+        if not self.warm():
+            return None
+        open_ear = self.quantile(OPEN_QUANTILE)
+        closed_ear = min(self.quantile(CLOSED_QUANTILE), open_ear * MAX_CLOSED_TO_OPEN)
+        span = open_ear - closed_ear
+        if span <= 0:
+            return None
+        return {
+            "open_ear": open_ear,
+            "closed_ear": closed_ear,
+            "blink_low": closed_ear + 0.1 * span,
+            "blink_high": open_ear - 0.1 * span,
+        }
+
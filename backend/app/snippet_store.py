@@ -0,0 +1,558 @@
+"""
+Content-addressed, encrypted snippet storage.
+
+Each distinct clip is stored once as a blob named by a keyed hash of its
+content, so retried or re-attached uploads share storage. Blobs are split
+into CHUNK_SIZE plaintext chunks; each chunk is zlib-compressed when that
+actually shrinks it, then sealed with AES-GCM as raw bytes (no base64).
+
+Blob layout:
+
+    [chunk 0][chunk 1]...[chunk n-1][index][trailer]
+
+    index    n x (offset u64, length u32, flags u8)
+    trailer  magic(8) nonce_prefix(8) chunk_size u32 n_chunks u32
+             plain_size u64 index_offset u64
+
+Chunk i uses nonce = nonce_prefix + i (big-endian u32) and is bound to its
+position, and to whether it is the last chunk, through the AEAD associated
+data, so chunks can't be reordered or the blob truncated undetected.
+"""
+import hashlib
+import hmac
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+CHUNK_SIZE = 256 * 1024
+MAGIC = b"NDSNIP01"
+TRAILER = struct.Struct("<8s8sIIQQ")
+INDEX_ENTRY = struct.Struct("<QIB")
+
+FLAG_ZLIB = 1
+
+READER_CACHE_SIZE = 256
+
+# Stop trying to compress a blob after this many chunks in a row didn't
+# shrink by at least MIN_COMPRESSION_GAIN (already-encoded video)
+COMPRESSION_PROBE_CHUNKS = 2
+MIN_COMPRESSION_GAIN = 0.1
+
+
+class SnippetStoreError(Exception):
+    pass
+
+
+def derive_keys(master: bytes):
+    """(content-hash key, AES-256 key, share-token key) from the configured snippet key."""
+    hash_key = hmac.new(master, b"neurodrive/snippet/hash", hashlib.sha256).digest()
+    aead_key = hmac.new(master, b"neurodrive/snippet/aead", hashlib.sha256).digest()
+    share_key = hmac.new(master, b"neurodrive/snippet/share", hashlib.sha256).digest()
+    return hash_key, aead_key, share_key
+
+
+class BlobWriter:
+    """
+    Seals chunks into a blob file as they arrive; `finish()` writes the
+    index and trailer. Used for whole uploads and for streamed ones.
+    `suspend()` closes the file between writes (the next write reopens
+    it), so a long-lived writer doesn't hold a file descriptor.
+    """
+
+    def __init__(self, path: str, aead, chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.aead = aead
+        self.chunk_size = chunk_size
+        self.nonce_prefix = os.urandom(8)
+        self.entries: List[tuple] = []
+        self.plain_size = 0
+        self.offset = 0
+        self._misses = 0
+        self._try_compress = True
+        self._pending = b""
+        self._f = open(path, "wb")
+
+    def _seal(self, index: int, chunk: bytes, last: bool) -> bytes:
+        nonce = self.nonce_prefix + struct.pack(">I", index)
+        aad = struct.pack("<IB", index, 1 if last else 0)
+        return self.aead.encrypt(nonce, chunk, aad)
+
+    def _emit(self, chunk: bytes, last: bool):
+        flags = 0
+        payload = chunk
+        if self._try_compress:
+            packed = zlib.compress(chunk, 1)
+            if len(packed) <= len(chunk) * (1 - MIN_COMPRESSION_GAIN):
+                payload, flags = packed, FLAG_ZLIB
+                self._misses = 0
+            else:
+                self._misses += 1
+                if self._misses >= COMPRESSION_PROBE_CHUNKS:
+                    self._try_compress = False
+
+        sealed = self._seal(len(self.entries), payload, last)
+        self._file().write(sealed)
+        self.entries.append((self.offset, len(sealed), flags))
+        self.offset += len(sealed)
+        self.plain_size += len(chunk)
+
+    def write(self, data: bytes):
+        # Hold back up to one chunk so the final one can be flagged as last
+        if self._pending:
+            data = self._pending + data
+        view = memoryview(data)
+        pos = 0
+        while len(view) - pos > self.chunk_size:
+            self._emit(bytes(view[pos:pos + self.chunk_size]), last=False)
+            pos += self.chunk_size
+        self._pending = bytes(view[pos:])
+
+    @property
+    def received(self) -> int:
+        """Plaintext bytes accepted so far."""
+        return self.plain_size + len(self._pending)
+
+    def _file(self):
+        if self._f is None:
+            self._f = open(self.path, "ab")
+        return self._f
+
+    def suspend(self):
+        """Closes the file until the next write; buffered bytes stay in memory."""
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def finish(self) -> int:
+        """Closes the blob; returns its size on disk."""
+        self._emit(self._pending, last=True)
+        self._pending = b""
+        index_offset = self.offset
+        f = self._file()
+        for entry in self.entries:
+            f.write(INDEX_ENTRY.pack(*entry))
+        f.write(TRAILER.pack(
+            MAGIC, self.nonce_prefix, self.chunk_size, len(self.entries),
+            self.plain_size, index_offset,
+        ))
+        f.flush()
+        os.fsync(f.fileno())
+        self.suspend()
+        return os.path.getsize(self.path)
+
+    def abort(self):
+        self.suspend()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class BlobReader:
+    def __init__(self, path: str, aead):
+        self.path = path
+        self.aead = aead
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size < TRAILER.size:
+                raise SnippetStoreError("Blob too short")
+            f.seek(size - TRAILER.size)
+            (magic, self.nonce_prefix, self.chunk_size, self.n_chunks,
+             self.plain_size, index_offset) = TRAILER.unpack(f.read(TRAILER.size))
+            if magic != MAGIC:
+                raise SnippetStoreError("Not a snippet blob")
+            f.seek(index_offset)
+            raw = f.read(self.n_chunks * INDEX_ENTRY.size)
+        self.entries = [
+            INDEX_ENTRY.unpack_from(raw, i * INDEX_ENTRY.size)
+            for i in range(self.n_chunks)
+        ]
+
+    def open_chunk(self, index: int, sealed: bytes) -> bytes:
+        nonce = self.nonce_prefix + struct.pack(">I", index)
+        aad = struct.pack("<IB", index, 1 if index == self.n_chunks - 1 else 0)
+        payload = self.aead.decrypt(nonce, sealed, aad)
+        if self.entries[index][2] & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        return payload
+
+    def iter_chunks(self, first: int = 0, last: Optional[int] = None) -> Iterable[bytes]:
+        last = self.n_chunks - 1 if last is None else last
+        if last < first:
+            return
+        # Ciphertext is read through a shared read-only mapping, so
+        # concurrent readers of a blob share the page cache and each holds
+        # at most one decrypted chunk.
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            view = memoryview(m)
+            try:
+                for i in range(first, last + 1):
+                    offset, length, _ = self.entries[i]
+                    # Release the slice before yielding or raising, or the
+                    # view (and the mapping) can't be closed
+                    with view[offset:offset + length] as sealed:
+                        chunk = self.open_chunk(i, sealed)
+                    yield chunk
+            finally:
+                view.release()
+
+    def iter_range(self, start: int, end: int) -> Iterable[bytes]:
+        """
+        Plaintext bytes [start, end] (inclusive), decrypting only the chunks
+        that overlap the range.
+        """
+        first = start // self.chunk_size
+        last = end // self.chunk_size
+        for i, chunk in enumerate(self.iter_chunks(first, last), start=first):
+            base = i * self.chunk_size
+            lo = max(start - base, 0)
+            hi = min(end - base + 1, len(chunk))
+            yield chunk if lo == 0 and hi == len(chunk) else chunk[lo:hi]
+
+    def read_all(self) -> bytes:
+        return b"".join(self.iter_chunks())
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    blob_id     TEXT PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    refs        INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snippets (
+    event_id    TEXT PRIMARY KEY,
+    blob_id     TEXT NOT NULL,
+    priority    INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    meta        TEXT
+);
+CREATE INDEX IF NOT EXISTS snippets_by_age ON snippets (priority, created_at);
+CREATE INDEX IF NOT EXISTS snippets_by_blob ON snippets (blob_id);
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    token_id    BLOB NOT NULL UNIQUE,
+    expires_at  INTEGER NOT NULL
+);
+"""
+
+
+class SnippetStore:
+    """
+    event_id -> blob mapping with per-blob reference counts, kept in a
+    SQLite index next to the blobs so it survives restarts and retention
+    sweeps can walk it in (priority, age) order without listing files.
+    A blob is deleted when its last event reference is released.
+    """
+
+    def __init__(self, root: str, master_key: bytes):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._hash_key, aead_key, self.share_key = derive_keys(master_key)
+        self.aead = AESGCM(aead_key)
+        self._lock = threading.Lock()
+        self._readers: "OrderedDict[str, BlobReader]" = OrderedDict()
+
+        self.db = sqlite3.connect(
+            os.path.join(root, "index.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        row = self.db.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()
+        self.stored_bytes = row[0]
+
+    def blob_path(self, blob_id: str) -> str:
+        return os.path.join(self.blob_dir, blob_id[:2], blob_id + ".snp")
+
+    def content_id(self, data: bytes) -> str:
+        # Keyed so blob names don't reveal whether a known clip is stored
+        return hmac.new(self._hash_key, data, hashlib.sha256).hexdigest()
+
+    def content_hasher(self):
+        """Incremental form of content_id() for streamed uploads."""
+        return hmac.new(self._hash_key, digestmod=hashlib.sha256)
+
+    def new_writer(self, blob_hint: str) -> BlobWriter:
+        """BlobWriter on a temp path inside the blob directory."""
+        shard = os.path.join(self.blob_dir, "tmp")
+        os.makedirs(shard, exist_ok=True)
+        path = os.path.join(shard, f"{blob_hint}.{os.getpid()}.{threading.get_ident()}.tmp")
+        return BlobWriter(path, self.aead)
+
+    def has_blob(self, blob_id: str) -> bool:
+        row = self.db.execute("SELECT 1 FROM blobs WHERE blob_id = ?", (blob_id,)).fetchone()
+        return row is not None
+
+    def put(self, event_id: str, data: bytes, meta: Optional[dict] = None,
+            priority: int = 0, blob_id: Optional[str] = None) -> dict:
+        """
+        Stores `data` for `event_id` (replacing any earlier snippet for the
+        event), with `meta` and the retention `priority` in the index.
+        `blob_id` skips re-hashing if the caller already has content_id().
+        Returns blob info including whether it was deduplicated.
+        Compression and encryption run outside the lock.
+        """
+        blob_id = blob_id or self.content_id(data)
+        while True:
+            tmp = None
+            if not self.has_blob(blob_id):
+                writer = self.new_writer(blob_id)
+                try:
+                    writer.write(data)
+                    tmp = (writer.path, writer.finish())
+                except Exception:
+                    writer.abort()
+                    raise
+            info = self.commit(event_id, blob_id, len(data), tmp, meta, priority)
+            if info is not None:
+                return info
+            # The blob was released between the check and the commit
+
+    def commit(self, event_id: str, blob_id: str, size: int, tmp: Optional[tuple],
+               meta: Optional[dict], priority: int) -> Optional[dict]:
+        """
+        Points `event_id` at `blob_id`. `tmp` is (path, stored_size) of a
+        freshly written blob, moved into place unless an identical blob
+        already exists, or None if the blob is expected to exist. Returns
+        None if it doesn't (anymore).
+        """
+        delete: List[str] = []
+        with self._lock:
+            row = self.db.execute(
+                "SELECT size, stored_size, refs FROM blobs WHERE blob_id = ?", (blob_id,)
+            ).fetchone()
+            if row is None and tmp is None:
+                return None
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                deduplicated = row is not None
+                if row is None:
+                    path = self.blob_path(blob_id)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp[0], path)
+                    self.db.execute(
+                        "INSERT INTO blobs VALUES (?, ?, ?, 0)", (blob_id, size, tmp[1])
+                    )
+                    self.stored_bytes += tmp[1]
+                elif tmp is not None:
+                    # Another upload of the same clip won the race
+                    delete.append(tmp[0])
+
+                prev = self.db.execute(
+                    "SELECT blob_id FROM snippets WHERE event_id = ?", (event_id,)
+                ).fetchone()
+                self.db.execute(
+                    "INSERT OR REPLACE INTO snippets VALUES (?, ?, ?, ?, ?)",
+                    (event_id, blob_id, priority, time.time(),
+                     json.dumps(meta) if meta is not None else None),
+                )
+                if prev is None or prev[0] != blob_id:
+                    self.db.execute(
+                        "UPDATE blobs SET refs = refs + 1 WHERE blob_id = ?", (blob_id,)
+                    )
+                    if prev is not None:
+                        delete.extend(self._unref(prev[0]))
+                info = self.db.execute(
+                    "SELECT size, stored_size, refs FROM blobs WHERE blob_id = ?", (blob_id,)
+                ).fetchone()
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+        _remove_files(delete)
+        return {
+            "blob_id": blob_id,
+            "deduplicated": deduplicated,
+            "size": info[0],
+            "stored_size": info[1],
+            "refs": info[2],
+        }
+
+    def _unref(self, blob_id: str) -> List[str]:
+        """Drops one reference (inside a transaction); returns files to delete."""
+        self.db.execute("UPDATE blobs SET refs = refs - 1 WHERE blob_id = ?", (blob_id,))
+        row = self.db.execute(
+            "SELECT refs, stored_size FROM blobs WHERE blob_id = ?", (blob_id,)
+        ).fetchone()
+        if row is None or row[0] > 0:
+            return []
+        self.db.execute("DELETE FROM blobs WHERE blob_id = ?", (blob_id,))
+        self.stored_bytes -= row[1]
+        self._readers.pop(blob_id, None)
+        return [self.blob_path(blob_id)]
+
+    def release_many(self, event_ids: Iterable[str]) -> List[str]:
+        """
+        Removes the events' snippet references; returns the event_ids that
+        had one. Blob files are deleted after the index is updated.
+        """
+        released: List[str] = []
+        delete: List[str] = []
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for event_id in event_ids:
+                    row = self.db.execute(
+                        "SELECT blob_id FROM snippets WHERE event_id = ?", (event_id,)
+                    ).fetchone()
+                    if row is None:
+                        continue
+                    self.db.execute("DELETE FROM snippets WHERE event_id = ?", (event_id,))
+                    delete.extend(self._unref(row[0]))
+                    released.append(event_id)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        _remove_files(delete)
+        return released
+
+    def release(self, event_id: str) -> bool:
+        return bool(self.release_many([event_id]))
+
+    def reader(self, event_id: str) -> Optional[BlobReader]:
+        """Reader for the event's blob; parsed indexes are cached per blob."""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT blob_id FROM snippets WHERE event_id = ?", (event_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            blob_id = row[0]
+            reader = self._readers.get(blob_id)
+            if reader is not None:
+                self._readers.move_to_end(blob_id)
+                return reader
+        reader = BlobReader(self.blob_path(blob_id), self.aead)
+        with self._lock:
+            self._readers[blob_id] = reader
+            while len(self._readers) > READER_CACHE_SIZE:
+                self._readers.popitem(last=False)
+        return reader
+
+    def drop_blob(self, blob_id: str) -> List[str]:
+        """
+        Forgets a blob whose file has gone missing, along with every event
+        that referenced it. Returns those event_ids.
+        """
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.db.execute(
+                    "SELECT event_id FROM snippets WHERE blob_id = ?", (blob_id,)
+                ).fetchall()
+                self.db.execute("DELETE FROM snippets WHERE blob_id = ?", (blob_id,))
+                row = self.db.execute(
+                    "SELECT stored_size FROM blobs WHERE blob_id = ?", (blob_id,)
+                ).fetchone()
+                if row is not None:
+                    self.db.execute("DELETE FROM blobs WHERE blob_id = ?", (blob_id,))
+                    self.stored_bytes -= row[0]
+                self._readers.pop(blob_id, None)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return [r[0] for r in rows]
+
+    def blobs_in_shard(self, shard: str) -> List[str]:
+        """Indexed blob_ids stored under blobs/<shard>/ (a primary-key range scan)."""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT blob_id FROM blobs WHERE blob_id >= ? AND blob_id < ?",
+                (shard, shard[:-1] + chr(ord(shard[-1]) + 1)),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def snippet_meta(self) -> Iterable[tuple]:
+        """(event_id, meta) for every stored snippet, e.g. after a restart."""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT event_id, meta FROM snippets WHERE meta IS NOT NULL"
+            ).fetchall()
+        for event_id, meta in rows:
+            yield event_id, json.loads(meta)
+
+    def meta(self, event_id: str) -> Optional[dict]:
+        """Stored meta of one snippet, whichever worker uploaded it."""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT meta FROM snippets WHERE event_id = ?", (event_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row is not None and row[0] is not None else None
+
+    def expired(self, priority: int, cutoff: float, limit: int) -> List[str]:
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT event_id FROM snippets WHERE priority = ? AND created_at < ? "
+                "ORDER BY created_at LIMIT ?",
+                (priority, cutoff, limit),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def eviction_candidates(self, limit: int) -> List[str]:
+        """Lowest priority, oldest first."""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT event_id FROM snippets ORDER BY priority, created_at LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def revoke_token(self, token_id: bytes, expires_at: int):
+        """Records a revoked share token until it would have expired anyway."""
+        with self._lock:
+            self.db.execute(
+                "INSERT OR IGNORE INTO revoked_tokens (token_id, expires_at) VALUES (?, ?)",
+                (token_id, expires_at),
+            )
+
+    def is_revoked(self, token_id: bytes) -> bool:
+        with self._lock:
+            row = self.db.execute(
+                "SELECT 1 FROM revoked_tokens WHERE token_id = ?", (token_id,)
+            ).fetchone()
+        return row is not None
+
+    def purge_revoked(self, now: float) -> int:
+        with self._lock:
+            return self.db.execute(
+                "DELETE FROM revoked_tokens WHERE expires_at <= ?", (int(now),)
+            ).rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            events, logical = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(b.size), 0) "
+                "FROM snippets s JOIN blobs b ON b.blob_id = s.blob_id"
+            ).fetchone()
+            blobs = self.db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        return {
+            "events": events,
+            "blobs": blobs,
+            "logical_bytes": logical,
+            "stored_bytes": self.stored_bytes,
+        }
+
+
+def _remove_files(paths: Iterable[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,195 @@
+import bisect
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from event_ids import id_time
+
+# How far past its ID's time an event's index time may sit (appends that
+# raced with another event, or were clamped after a clock step)
+FIND_SLACK_SECONDS = 1.0
+
+# Events kept per driver; the oldest are dropped in batches of TRIM_BATCH
+TIMELINE_RETENTION = 10000
+TRIM_BATCH = 1000
+
+
+class DriverTimelineIndex:
+    """
+    Append-ordered timeline for one driver.
+
+    Keeps a sorted list of event times plus posting lists (event positions)
+    per tag and per event_type, so range/tag queries bisect into the
+    smallest matching list instead of scanning the whole history.
+
+    Only the newest `retention` events are kept. Positions (and so
+    cursors) count every event ever added, so they stay valid when the
+    oldest events are trimmed; `base` is the position of events[0].
+
+    Events are added from the event loop, threadpool endpoints and the
+    deadline thread, so every method holds the index's lock.
+    """
+
+    def __init__(self, retention: int = TIMELINE_RETENTION):
+        self.retention = retention
+        self.base = 0
+        self.events: List[dict] = []
+        self.times: List[float] = []
+        self.by_tag: Dict[str, List[int]] = {}
+        self.by_type: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Posting lists are derived; rebuild them instead of storing them
+        with self._lock:
+            return self.retention, self.base, list(self.events), list(self.times)
+
+    def __setstate__(self, state):
+        self.retention, self.base, self.events, self.times = state
+        self._lock = threading.Lock()
+        self.by_tag = {}
+        self.by_type = {}
+        for pos, event in enumerate(self.events, self.base):
+            self.by_type.setdefault(event["event_type"], []).append(pos)
+            for tag in event["tags"]:
+                self.by_tag.setdefault(tag, []).append(pos)
+
+    def add(self, event: dict, ts: float):
+        with self._lock:
+            # Positions double as cursors, so times must stay non-decreasing
+            # even if the wall clock steps backwards.
+            if self.times and ts < self.times[-1]:
+                ts = self.times[-1]
+
+            pos = self.base + len(self.events)
+            self.events.append(event)
+            self.times.append(ts)
+
+            self.by_type.setdefault(event["event_type"], []).append(pos)
+            for tag in event["tags"]:
+                self.by_tag.setdefault(tag, []).append(pos)
+
+            # Trim in batches so the per-event cost stays amortised O(1)
+            if len(self.events) > self.retention + TRIM_BATCH:
+                self._trim(len(self.events) - self.retention)
+
+    def _trim(self, drop: int):
+        del self.events[:drop]
+        del self.times[:drop]
+        self.base += drop
+        for postings in (self.by_tag, self.by_type):
+            for key in list(postings):
+                positions = postings[key]
+                del positions[:bisect.bisect_left(positions, self.base)]
+                if not positions:
+                    del postings[key]
+
+    def __len__(self):
+        return len(self.events)
+
+    def find(self, event_id: str) -> Optional[int]:
+        """
+        Position of the event, or None. Compact IDs carry their creation
+        time, so only the events within FIND_SLACK_SECONDS after it are
+        checked; other IDs (old uuid4 events) are scanned newest first.
+        """
+        with self._lock:
+            return self._find(event_id)
+
+    def _find(self, event_id: str) -> Optional[int]:
+        t = id_time(event_id)
+        if t is not None:
+            i = bisect.bisect_left(self.times, t)
+            while i < len(self.times) and self.times[i] <= t + FIND_SLACK_SECONDS:
+                if self.events[i]["event_id"] == event_id:
+                    return self.base + i
+                i += 1
+            return None
+        for i in range(len(self.events) - 1, -1, -1):
+            if self.events[i]["event_id"] == event_id:
+                return self.base + i
+        return None
+
+    def get(self, event_id: str) -> Optional[dict]:
+        with self._lock:
+            pos = self._find(event_id)
+            return self.events[pos - self.base] if pos is not None else None
+
+    def replace(self, event: dict) -> bool:
+        """Swaps in `event` for the held event with the same ID, if any."""
+        with self._lock:
+            pos = self._find(event["event_id"])
+            if pos is None:
+                return False
+            self.events[pos - self.base] = event
+            return True
+
+    def query(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        event_type: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        min_score: Optional[int] = None,
+        cursor: Optional[int] = None,
+        after: Optional[int] = None,
+        limit: int = 50,
+    ) -> Tuple[List[dict], Optional[int]]:
+        """
+        Returns (events, next_cursor).
+
+        Events are the newest `limit` matches in [since, until], oldest first.
+        `next_cursor` is the position to pass back as `cursor` to fetch the
+        previous (older) page, or None when there is nothing older. `after`
+        keeps only events past that position.
+        """
+        with self._lock:
+            return self._query(since, until, event_type, tags, min_score, cursor, after, limit)
+
+    def _query(self, since, until, event_type, tags, min_score, cursor, after,
+               limit) -> Tuple[List[dict], Optional[int]]:
+        base = self.base
+        lo = base + (bisect.bisect_left(self.times, since) if since is not None else 0)
+        hi = base + (bisect.bisect_right(self.times, until) if until is not None else len(self.times))
+        if cursor is not None:
+            hi = min(hi, max(cursor, 0))
+        if after is not None:
+            lo = max(lo, after + 1)
+        if lo >= hi or limit <= 0:
+            return [], None
+
+        # Drive the scan from the most selective posting list
+        postings: List[List[int]] = []
+        if event_type is not None:
+            postings.append(self.by_type.get(event_type, []))
+        for tag in tags or []:
+            postings.append(self.by_tag.get(tag, []))
+
+        if postings:
+            driver = min(postings, key=len)
+            start = bisect.bisect_left(driver, lo)
+            end = bisect.bisect_left(driver, hi)
+            candidates = (driver[i] for i in range(end - 1, start - 1, -1))
+        else:
+            candidates = iter(range(hi - 1, lo - 1, -1))
+
+        required_tags = set(tags) if tags else None
+        picked: List[int] = []
+        for pos in candidates:
+            e = self.events[pos - base]
+            if event_type is not None and e["event_type"] != event_type:
+                continue
+            if required_tags and not required_tags.issubset(e["tags"]):
+                continue
+            if min_score is not None and e["fatigue_score"] < min_score:
+                continue
+            picked.append(pos)
+            if len(picked) > limit:
+                break
+
+        next_cursor = None
+        if len(picked) > limit:
+            picked = picked[:limit]
+            next_cursor = picked[-1]
+
+        picked.reverse()
+        return [self.events[p - base] for p in picked], next_cursor
@@ -0,0 +1,128 @@
+"""
+Hierarchical timer wheel for per-driver deadlines.
+
+Time is counted in ticks of `tick` seconds. Level 0 has SLOTS one-tick
+slots, level 1 has SLOTS slots of SLOTS ticks each, and so on, so LEVELS
+levels cover SLOTS ** LEVELS ticks. A timer sits in the lowest level whose
+range reaches its deadline. When level 0 wraps, the next level-1 slot is
+cascaded down into level 0 (and likewise further up), so each timer moves
+at most LEVELS times before it fires.
+
+Timers are keyed (e.g. (user_id, "heartbeat")). Scheduling a key again
+replaces its timer, so schedule/cancel are O(1) dict operations and
+nothing ever scans all drivers.
+"""
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+LEVELS = 4     # 64 ** 4 one-second ticks is about 194 days
+
+
+class TimerWheel:
+    def __init__(self, tick: float = 1.0, now: Optional[float] = None):
+        self.tick = tick
+        self.current = int((time.time() if now is None else now) / tick)
+        # level -> slot -> key -> (deadline tick, payload)
+        self.wheels: List[List[Dict[Hashable, Tuple[int, Any]]]] = [
+            [{} for _ in range(SLOTS)] for _ in range(LEVELS)
+        ]
+        # key -> (level, slot)
+        self.where: Dict[Hashable, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _place(self, key: Hashable, deadline: int, payload: Any):
+        deadline = max(deadline, self.current + 1)
+        for level in range(LEVELS):
+            shift = SLOT_BITS * level
+            if (deadline >> shift) - (self.current >> shift) < SLOTS:
+                break
+        else:
+            # Beyond the wheel's range: park in the top level's furthest
+            # slot; it is re-placed when that slot cascades
+            deadline = min(deadline, self.current + SLOTS ** LEVELS - 1)
+        slot = (deadline >> shift) % SLOTS
+        self.wheels[level][slot][key] = (deadline, payload)
+        self.where[key] = (level, slot)
+
+    def _unlink(self, key: Hashable):
+        pos = self.where.pop(key, None)
+        if pos is not None:
+            del self.wheels[pos[0]][pos[1]][key]
+
+    def schedule(self, key: Hashable, when: float, payload: Any = None):
+        """(Re)schedules `key` to fire at unix time `when`."""
+        with self._lock:
+            self._unlink(key)
+            self._place(key, math.ceil(when / self.tick), payload)
+
+    def cancel(self, key: Hashable):
+        with self._lock:
+            self._unlink(key)
+
+    def advance(self, now: Optional[float] = None) -> List[Tuple[Hashable, Any]]:
+        """Moves the wheel to `now`; returns the (key, payload) pairs that expired."""
+        target = int((time.time() if now is None else now) / self.tick)
+        expired = []
+        with self._lock:
+            while self.current < target:
+                self.current += 1
+                t = self.current
+                # Cascade from the top so timers fall through every level
+                for level in range(LEVELS - 1, 0, -1):
+                    shift = SLOT_BITS * level
+                    if t % (1 << shift) == 0:
+                        bucket = self.wheels[level][(t >> shift) % SLOTS]
+                        moved = list(bucket.items())
+                        bucket.clear()
+                        for key, (deadline, payload) in moved:
+                            del self.where[key]
+                            self._place(key, deadline, payload)
+                bucket = self.wheels[0][t % SLOTS]
+                for key, (deadline, payload) in bucket.items():
+                    del self.where[key]
+                    expired.append((key, payload))
+                bucket.clear()
+        return expired
+
+    def __len__(self):
+        return len(self.where)
+
+
+class DeadlineScheduler:
+    """Runs a TimerWheel on a daemon thread and hands expired timers to `on_expire`."""
+
+    def __init__(self, on_expire: Callable[[Hashable, Any], None], tick: float = 1.0):
+        self.wheel = TimerWheel(tick)
+        self.on_expire = on_expire
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.fired = 0
+
+    def schedule(self, key: Hashable, when: float, payload: Any = None):
+        self.wheel.schedule(key, when, payload)
+
+    def cancel(self, key: Hashable):
+        self.wheel.cancel(key)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._loop, name="deadline-scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.wheel.tick):
+            for key, payload in self.wheel.advance():
+                self.fired += 1
+                try:
+                    self.on_expire(key, payload)
+                except Exception:
+                    pass   # one bad handler shouldn't stop the clock
@@ -0,0 +1,171 @@
+"""
+Resumable snippet uploads.
+
+    POST   /timeline/{user_id}/{event_id}/snippet/uploads   {"size", "content_type"}
+    PUT    /snippet/uploads/{upload_id}?offset=N            raw bytes
+    GET    /snippet/uploads/{upload_id}                     received range
+    POST   /snippet/uploads/{upload_id}/complete
+    DELETE /snippet/uploads/{upload_id}
+
+Offsets are plaintext byte positions. Bytes are hashed and sealed into the
+blob file as they arrive, so a session holds at most one plaintext chunk in
+memory however large the clip is. A PUT may start anywhere up to the
+received offset; bytes the server already has are skipped, so resending a
+chunk after a dropped connection is safe. Whatever part of a PUT body
+arrived before a disconnect is kept.
+
+Sessions idle for UPLOAD_TTL_SECONDS are aborted and their temp files
+removed, unless a request is still using them (`get(..., hold=True)` until
+`release()`). The temp file is only open while a chunk is being written,
+so pending uploads don't hold file descriptors.
+"""
+import asyncio
+import secrets
+import threading
+import time
+from typing import Dict, Optional
+
+from snippet_store import SnippetStore
+
+UPLOAD_TTL_SECONDS = 3600
+MAX_OPEN_UPLOADS = 1000
+MAX_UPLOAD_BYTES = 1024 ** 3
+EXPIRE_CHECK_SECONDS = 60
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class UploadSession:
+    __slots__ = (
+        "upload_id", "user_id", "event_id", "size", "content_type",
+        "writer", "hasher", "created_at", "touched", "lock", "users",
+    )
+
+    def __init__(self, store: SnippetStore, user_id: str, event_id: str,
+                 size: int, content_type: str):
+        self.upload_id = secrets.token_urlsafe(16)
+        self.user_id = user_id
+        self.event_id = event_id
+        self.size = size
+        self.content_type = content_type
+        self.writer = store.new_writer(self.upload_id)
+        self.writer.suspend()
+        self.hasher = store.content_hasher()
+        self.created_at = time.time()
+        self.touched = self.created_at
+        # Serializes PUTs for this session across awaits
+        self.lock = asyncio.Lock()
+        self.users = 0      # requests holding the session; guarded by the manager
+
+    @property
+    def received(self) -> int:
+        return self.writer.received
+
+    def append(self, offset: int, data: bytes) -> int:
+        """Adds `data` found at `offset`; returns the new received offset."""
+        received = self.writer.received
+        if offset > received:
+            raise UploadError(409, f"Offset {offset} is past the received offset {received}")
+        skip = received - offset
+        if skip >= len(data):
+            return received
+        if offset + len(data) > self.size:
+            raise UploadError(413, f"Upload exceeds its declared size of {self.size} bytes")
+        data = memoryview(data)[skip:]
+        self.hasher.update(data)
+        try:
+            self.writer.write(data)
+        finally:
+            self.writer.suspend()
+        self.touched = time.time()
+        return self.writer.received
+
+    def finish(self) -> tuple:
+        """Seals the blob; returns (blob_id, (temp path, stored size))."""
+        if self.writer.received != self.size:
+            raise UploadError(
+                409, f"Received {self.writer.received} of {self.size} bytes"
+            )
+        stored = self.writer.finish()
+        return self.hasher.hexdigest(), (self.writer.path, stored)
+
+    def status(self) -> dict:
+        return {
+            "upload_id": self.upload_id,
+            "event_id": self.event_id,
+            "size": self.size,
+            "received": [[0, self.received]] if self.received else [],
+            "next_offset": self.received,
+            "expires_at": self.touched + UPLOAD_TTL_SECONDS,
+        }
+
+
+class UploadManager:
+    def __init__(self, ttl: float = UPLOAD_TTL_SECONDS,
+                 max_open: int = MAX_OPEN_UPLOADS):
+        self.ttl = ttl
+        self.max_open = max_open
+        self.sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+        self._last_expire = 0.0
+
+    def create(self, store: SnippetStore, user_id: str, event_id: str,
+               size: int, content_type: str) -> UploadSession:
+        if size <= 0 or size > MAX_UPLOAD_BYTES:
+            raise UploadError(400, f"size must be between 1 and {MAX_UPLOAD_BYTES}")
+        self.expire()
+        with self._lock:
+            if len(self.sessions) >= self.max_open:
+                raise UploadError(429, "Too many open uploads, retry later")
+            session = UploadSession(store, user_id, event_id, size, content_type)
+            self.sessions[session.upload_id] = session
+        return session
+
+    def get(self, upload_id: str, hold: bool = False) -> UploadSession:
+        """
+        The open session. With `hold`, expiry leaves it alone until
+        release() is called.
+        """
+        self.expire()
+        with self._lock:
+            session = self.sessions.get(upload_id)
+            if session is None:
+                raise UploadError(404, "Upload not found or expired")
+            if hold:
+                session.users += 1
+        return session
+
+    def release(self, session: UploadSession):
+        with self._lock:
+            session.users -= 1
+            session.touched = time.time()
+
+    def is_open(self, session: UploadSession) -> bool:
+        """False once the session was completed, aborted or expired."""
+        return self.sessions.get(session.upload_id) is session
+
+    def discard(self, session: UploadSession, abort: bool = True):
+        with self._lock:
+            self.sessions.pop(session.upload_id, None)
+        if abort:
+            session.writer.abort()
+
+    def expire(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        if now - self._last_expire < EXPIRE_CHECK_SECONDS:
+            return
+        self._last_expire = now
+        with self._lock:
+            stale = [
+                s for s in self.sessions.values()
+                if now - s.touched > self.ttl and not s.users
+            ]
+            for session in stale:
+                del self.sessions[session.upload_id]
+        for session in stale:
+            session.writer.abort()
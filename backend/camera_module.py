@@ -290,32 +290,11 @@ BACKEND_URL = "http://127.0.0.1:8000/predict"
 mp_face_mesh = mp.solutions.face_mesh
 face_mesh = mp_face_mesh.FaceMesh(refine_landmarks=True)
 
-# Define EAR (Eye Aspect Ratio)
-def eye_aspect_ratio(landmarks, eye_indices):
-    p1 = np.array([landmarks[eye_indices[0]].x, landmarks[eye_indices[0]].y])
-    p2 = np.array([landmarks[eye_indices[1]].x, landmarks[eye_indices[1]].y])
-    p3 = np.array([landmarks[eye_indices[2]].x, landmarks[eye_indices[2]].y])
-    p4 = np.array([landmarks[eye_indices[3]].x, landmarks[eye_indices[3]].y])
-    p5 = np.array([landmarks[eye_indices[4]].x, landmarks[eye_indices[4]].y])
-    p6 = np.array([landmarks[eye_indices[5]].x, landmarks[eye_indices[5]].y])
-    A = np.linalg.norm(p2 - p6)
-    B = np.linalg.norm(p3 - p5)
-    C = np.linalg.norm(p1 - p4)
-    return (A + B) / (2.0 * C)
-
-# Define mouth opening ratio (for yawning)
-def mouth_opening_ratio(landmarks):
-    top_lip = np.array([landmarks[13].x, landmarks[13].y])
-    bottom_lip = np.array([landmarks[14].x, landmarks[14].y])
-    left_lip = np.array([landmarks[61].x, landmarks[61].y])
-    right_lip = np.array([landmarks[291].x, landmarks[291].y])
-    vertical = np.linalg.norm(top_lip - bottom_lip)
-    horizontal = np.linalg.norm(left_lip - right_lip)
-    return vertical / horizontal
-
-# Eye landmark indices
-LEFT_EYE = [33, 160, 158, 133, 153, 144]
-RIGHT_EYE = [362, 385, 387, 263, 373, 380]
+# Landmark metrics (shared with multi_camera.py)
+from face_metrics import (
+    LEFT_EYE, RIGHT_EYE, blink_thresholds, eye_aspect_ratio, head_tilt_degrees,
+    mouth_opening_ratio,
+)
 
 # Camera
 cap = cv2.VideoCapture(0)
@@ -338,6 +317,15 @@ def play_alert_sound():
     except Exception as e:
         print("⚠️ Sound error:", e)
 
+# ---------------- INCIDENT CLIPS ----------------
+from incident_clips import IncidentRecorder
+
+USER_ID = "driver_1"
+BACKEND_BASE = BACKEND_URL.rsplit("/predict", 1)[0]
+
+recorder = IncidentRecorder(USER_ID, BACKEND_BASE)
+recorder.start()
+
 # ---------------- AUTO CALIBRATION ----------------
 print("⚙️ Starting auto calibration...")
 open_ear_values = []
@@ -392,8 +380,7 @@ cv2.destroyWindow("Calibration")
 # Compute thresholds
 open_avg = np.mean(open_ear_values) if open_ear_values else 0.3
 closed_avg = np.mean(closed_ear_values) if closed_ear_values else 0.2
-blink_thresh_low = closed_avg + 0.1 * (open_avg - closed_avg)
-blink_thresh_high = open_avg - 0.1 * (open_avg - closed_avg)
+blink_thresh_low, blink_thresh_high = blink_thresholds(open_avg, closed_avg)
 
 print(f"\n✅ Calibration complete:")
 print(f"   Open EAR:   {open_avg:.3f}")
@@ -409,6 +396,7 @@ while cap.isOpened():
         break
 
     frame = cv2.flip(frame, 1)
+    recorder.add_frame(frame)   # before the overlays are drawn
     rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
     results = face_mesh.process(rgb_frame)
 
@@ -427,10 +415,7 @@ while cap.isOpened():
             blink_start = False
 
         # Head tilt
-        left_eye = np.array([landmarks[33].x, landmarks[33].y])
-        right_eye = np.array([landmarks[263].x, landmarks[263].y])
-        dx, dy = right_eye - left_eye
-        head_tilt = np.degrees(np.arctan2(dy, dx))
+        head_tilt = head_tilt_degrees(landmarks)
 
         # Yawn detection
         mouth_ratio = mouth_opening_ratio(landmarks)
@@ -457,6 +442,8 @@ while cap.isOpened():
         # Send data to backend
         if time.time() - last_send_time > send_interval:
             payload = {
+                "user_id": USER_ID,
+                "mode": "instant",
                 "eye_ratio": float(ear),
                 "blink_count": blink_count,
                 "head_tilt": float(head_tilt),
@@ -467,6 +454,7 @@ while cap.isOpened():
                 if r.ok:
                     response = r.json()
                     print("🧠 Fatigue:", response)
+                    recorder.on_response(response)
 
                     # Show backend status
                     status = response.get("status", "")
@@ -0,0 +1,46 @@
+# Landmark metrics shared by camera_module.py and multi_camera.py
+import numpy as np
+
+# Indices for left and right eyes (Mediapipe FaceMesh)
+LEFT_EYE = [33, 160, 158, 133, 153, 144]
+RIGHT_EYE = [362, 385, 387, 263, 373, 380]
+
+
+# Define EAR calculation
+def eye_aspect_ratio(landmarks, eye_indices):
+    p1 = np.array([landmarks[eye_indices[0]].x, landmarks[eye_indices[0]].y])
+    p2 = np.array([landmarks[eye_indices[1]].x, landmarks[eye_indices[1]].y])
+    p3 = np.array([landmarks[eye_indices[2]].x, landmarks[eye_indices[2]].y])
+    p4 = np.array([landmarks[eye_indices[3]].x, landmarks[eye_indices[3]].y])
+    p5 = np.array([landmarks[eye_indices[4]].x, landmarks[eye_indices[4]].y])
+    p6 = np.array([landmarks[eye_indices[5]].x, landmarks[eye_indices[5]].y])
+    A = np.linalg.norm(p2 - p6)
+    B = np.linalg.norm(p3 - p5)
+    C = np.linalg.norm(p1 - p4)
+    return (A + B) / (2.0 * C)
+
+
+# Mouth opening (yawn) ratio
+def mouth_opening_ratio(landmarks):
+    top_lip = np.array([landmarks[13].x, landmarks[13].y])
+    bottom_lip = np.array([landmarks[14].x, landmarks[14].y])
+    left_lip = np.array([landmarks[61].x, landmarks[61].y])
+    right_lip = np.array([landmarks[291].x, landmarks[291].y])
+    vertical = np.linalg.norm(top_lip - bottom_lip)
+    horizontal = np.linalg.norm(left_lip - right_lip)
+    return vertical / horizontal
+
+
+# Rough head tilt (degrees) from the eyes' horizontal alignment
+def head_tilt_degrees(landmarks):
+    left_eye = np.array([landmarks[33].x, landmarks[33].y])
+    right_eye = np.array([landmarks[263].x, landmarks[263].y])
+    dx, dy = right_eye - left_eye
+    return np.degrees(np.arctan2(dy, dx))
+
+
+# Blink thresholds from calibrated open/closed EAR averages
+def blink_thresholds(open_avg, closed_avg):
+    low = closed_avg + 0.1 * (open_avg - closed_avg)
+    high = open_avg - 0.1 * (open_avg - closed_avg)
+    return low, high
@@ -0,0 +1,179 @@
+# Incident clips for camera_module.py
+#
+# The last PRE_EVENT_SECONDS of video are kept as JPEG frames in a ring
+# buffer capped by both age and bytes, so memory stays fixed however long
+# the drive is. When the backend reports critical_fatigue or escalation
+# level 3+, the buffer is copied, POST_EVENT_SECONDS more are appended,
+# and the clip is muxed and uploaded on a background thread.
+#
+# OpenCV is only needed to encode and mux frames, so it is imported there.
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+
+import requests
+
+PRE_EVENT_SECONDS = 10
+POST_EVENT_SECONDS = 5
+RECORD_FPS = 15                        # frames kept per second (capture may be faster)
+JPEG_QUALITY = 70
+RING_BUFFER_MAX_BYTES = 32 * 1024 ** 2
+CLIP_COOLDOWN_SECONDS = 30             # one clip per incident, not per reading
+UPLOAD_CHUNK_BYTES = 1024 ** 2
+UPLOAD_RETRIES = 5
+RETRY_BASE_SECONDS = 1                 # backoff doubles per failed chunk
+
+
+class FrameRingBuffer:
+    """(timestamp, jpeg bytes) for the last `seconds`, at most `max_bytes` in total."""
+
+    def __init__(self, seconds, max_bytes):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.frames = deque()
+        self.bytes = 0
+
+    def add(self, ts, jpeg):
+        self.frames.append((ts, jpeg))
+        self.bytes += len(jpeg)
+        while self.frames and (
+            self.bytes > self.max_bytes or ts - self.frames[0][0] > self.seconds
+        ):
+            self.bytes -= len(self.frames.popleft()[1])
+
+    def snapshot(self):
+        return list(self.frames)
+
+
+def encode_jpeg(frame):
+    import cv2
+
+    ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return jpeg.tobytes() if ok else None
+
+
+class IncidentRecorder:
+    def __init__(self, user_id, backend_base, encode=encode_jpeg):
+        self.user_id = user_id
+        self.backend_base = backend_base
+        self.encode = encode
+        self.ring = FrameRingBuffer(PRE_EVENT_SECONDS, RING_BUFFER_MAX_BYTES)
+        self.next_due = 0.0
+        self.clip = None                   # {"event_id", "frames", "until"} being filled
+        self.last_clip_time = 0.0
+        # At most two finished clips wait for upload; more are dropped
+        self.uploads = queue.Queue(maxsize=2)
+
+    def start(self):
+        threading.Thread(target=self._upload_loop, name="clip-uploader", daemon=True).start()
+
+    def add_frame(self, frame, now=None):
+        now = time.time() if now is None else now
+        if now < self.next_due:
+            return
+        self.next_due = max(self.next_due + 1.0 / RECORD_FPS, now)
+        jpeg = self.encode(frame)
+        if jpeg is None:
+            return
+        self.ring.add(now, jpeg)
+        if self.clip is not None:
+            self.clip["frames"].append((now, jpeg))
+            if now >= self.clip["until"]:
+                self._finish_clip()
+
+    def on_response(self, response, now=None):
+        """Starts a clip if this /predict response marks an incident."""
+        incident = (
+            response.get("event_type") == "critical_fatigue"
+            or response.get("escalation_level", 0) >= 3
+        )
+        now = time.time() if now is None else now
+        if not incident or self.clip is not None or now - self.last_clip_time < CLIP_COOLDOWN_SECONDS:
+            return
+        self.last_clip_time = now
+        self.clip = {
+            "event_id": response["event_id"],
+            "frames": self.ring.snapshot(),
+            "until": now + POST_EVENT_SECONDS,
+        }
+        print("🎬 Capturing incident clip for event", response["event_id"])
+
+    def _finish_clip(self):
+        clip, self.clip = self.clip, None
+        try:
+            self.uploads.put_nowait(clip)
+        except queue.Full:
+            print("⚠️ Clip upload queue full, dropping clip for", clip["event_id"])
+
+    def _upload_loop(self):
+        while True:
+            clip = self.uploads.get()
+            path = None
+            try:
+                path = write_clip(clip["frames"])
+                if path is not None:
+                    upload_clip(self.backend_base, self.user_id, clip["event_id"], path)
+                    print("📤 Uploaded incident clip for event", clip["event_id"])
+            except Exception as e:
+                print("⚠️ Clip upload failed:", e)
+            finally:
+                if path is not None:
+                    os.remove(path)
+
+
+def write_clip(frames):
+    """Muxes JPEG frames into an MJPEG .avi temp file; returns its path."""
+    import cv2
+    import numpy as np
+
+    if len(frames) < 2:
+        return None
+    fps = max(1.0, (len(frames) - 1) / (frames[-1][0] - frames[0][0]))
+    first = cv2.imdecode(np.frombuffer(frames[0][1], np.uint8), cv2.IMREAD_COLOR)
+    h, w = first.shape[:2]
+    fd, path = tempfile.mkstemp(suffix=".avi")
+    os.close(fd)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (w, h))
+    try:
+        for _, jpeg in frames:
+            writer.write(cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR))
+    finally:
+        writer.release()
+    return path
+
+
+def upload_clip(backend_base, user_id, event_id, path, http=requests):
+    """Resumable upload: on a dropped connection, resume from the server's offset."""
+    size = os.path.getsize(path)
+    r = http.post(
+        f"{backend_base}/timeline/{user_id}/{event_id}/snippet/uploads",
+        json={"size": size, "content_type": "video/x-msvideo"},
+        timeout=10,
+    )
+    r.raise_for_status()
+    upload_id = r.json()["upload_id"]
+    url = f"{backend_base}/snippet/uploads/{upload_id}"
+
+    offset = 0
+    failures = 0
+    with open(path, "rb") as f:
+        while offset < size:
+            f.seek(offset)
+            chunk = f.read(UPLOAD_CHUNK_BYTES)
+            try:
+                r = http.put(url, params={"offset": offset}, data=chunk, timeout=30)
+                r.raise_for_status()
+                offset = r.json()["next_offset"]
+            except requests.RequestException:
+                failures += 1
+                if failures > UPLOAD_RETRIES:
+                    raise
+                time.sleep(RETRY_BASE_SECONDS * 2 ** failures)
+                try:
+                    offset = http.get(url, timeout=10).json()["next_offset"]
+                except requests.RequestException:
+                    pass
+    http.post(f"{url}/complete", timeout=30).raise_for_status()
@@ -0,0 +1,337 @@
+"""
+Multi-stream NeuroDrive camera client (depot boxes, multi-cabin vehicles).
+
+One process ingests several cameras, RTSP streams or recorded files:
+
+    python multi_camera.py --source cab1=0 --source cab2=rtsp://10.0.0.12/live \\
+        --source cab3=recordings/cab3.mp4 [--workers 4] [--fast]
+
+- one reader thread per stream decodes frames into that stream's
+  shared-memory frame slot (no pickling of frames)
+- a pool of worker processes (default: one per core) runs FaceMesh. Each
+  stream is pinned to one worker (round-robin over the workers, through
+  that worker's own task queue), which keeps a FaceMesh graph per stream,
+  so graphs are built once and landmark tracking runs frame to frame
+- each stream has at most one frame in flight, so its results arrive in
+  order; live sources drop frames while their previous one is still being
+  processed, recorded files (with --fast) wait instead, so every frame
+  is processed
+- blink counting and calibration state are kept per stream
+- every SEND_INTERVAL seconds the latest readings of all streams go to
+  /predict/batch in one request over one keep-alive connection
+
+Streams need no interactive calibration: the first CALIBRATION_SECONDS of
+detected frames set the stream's open-eye EAR baseline.
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+import requests
+
+from face_metrics import (
+    LEFT_EYE, RIGHT_EYE, blink_thresholds, eye_aspect_ratio, head_tilt_degrees,
+    mouth_opening_ratio,
+)
+
+BACKEND_URL = "http://127.0.0.1:8000"
+SEND_INTERVAL = 3            # seconds
+INFERENCE_WIDTH = 640        # wider frames are downscaled before inference
+CALIBRATION_SECONDS = 5
+DEFAULT_OPEN_EAR = 0.3
+DEFAULT_CLOSED_EAR = 0.2
+CLOSED_EAR_FRACTION = 0.65   # closed-eye EAR assumed relative to the open baseline
+
+
+# ---------------- WORKER PROCESSES ----------------
+_meshes = {}                 # stream -> FaceMesh, for the streams pinned here
+_segments = {}               # shared memory name -> SharedMemory
+
+
+def _face_mesh(stream):
+    mesh = _meshes.get(stream)
+    if mesh is None:
+        import mediapipe as mp   # workers only; the parent never loads it
+        mesh = _meshes[stream] = mp.solutions.face_mesh.FaceMesh(refine_landmarks=True)
+    return mesh
+
+
+def _attach(name):
+    seg = _segments.get(name)
+    if seg is None:
+        # Workers share the parent's resource tracker, which unlinks the
+        # segment only if the parent dies without closing its streams
+        seg = shared_memory.SharedMemory(name=name)
+        _segments[name] = seg
+    return seg
+
+
+def landmark_metrics(frame_bgr, mesh):
+    """(ear, head_tilt, mouth_ratio) for the first face, or None."""
+    rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+    results = mesh.process(rgb)
+    if not results.multi_face_landmarks:
+        return None
+    landmarks = results.multi_face_landmarks[0].landmark
+    ear = (eye_aspect_ratio(landmarks, LEFT_EYE) + eye_aspect_ratio(landmarks, RIGHT_EYE)) / 2.0
+    return float(ear), float(head_tilt_degrees(landmarks)), float(mouth_opening_ratio(landmarks))
+
+
+def worker_main(tasks, results):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # the parent handles Ctrl-C
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        stream, shm_name, shape, ts = task
+        frame = np.ndarray(shape, np.uint8, buffer=_attach(shm_name).buf)
+        try:
+            metrics = landmark_metrics(frame, _face_mesh(stream))
+        except Exception as e:
+            print(f"⚠️ [{stream}] inference error:", e)
+            metrics = None
+        results.put((stream, ts, metrics))
+
+
+# ---------------- PER-STREAM STATE ----------------
+class Stream:
+    def __init__(self, driver_id, source):
+        self.driver_id = driver_id
+        self.source = int(source) if source.isdigit() else source
+        self.is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+        self.shm = None
+        self.shape = None
+        self.idle = threading.Event()    # no frame in flight
+        self.idle.set()
+        self.done = False
+        self.lock = threading.Lock()
+
+        self.frames_read = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+        # Calibration / blink state
+        self.calibration = []
+        self.calibration_start = None
+        self.blink_low, self.blink_high = blink_thresholds(DEFAULT_OPEN_EAR, DEFAULT_CLOSED_EAR)
+        self.calibrated = False
+        self.blink_start = False
+        self.blink_count = 0
+        self.latest = None               # (ear, head_tilt, mouth_ratio)
+
+    def submit(self, frame, tasks):
+        """Copies `frame` into the stream's slot and queues it for inference."""
+        if self.shm is None:
+            self.shape = frame.shape
+            self.shm = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+        elif frame.shape != self.shape:
+            frame = cv2.resize(frame, (self.shape[1], self.shape[0]))
+        np.ndarray(self.shape, np.uint8, buffer=self.shm.buf)[...] = frame
+        self.idle.clear()
+        tasks.put((self.driver_id, self.shm.name, self.shape, time.time()))
+
+    def on_result(self, ts, metrics):
+        with self.lock:
+            self.frames_processed += 1
+            if metrics is None:
+                return
+            ear, head_tilt, mouth_ratio = metrics
+            if not self.calibrated:
+                if self.calibration_start is None:
+                    self.calibration_start = ts
+                self.calibration.append(ear)
+                if ts - self.calibration_start >= CALIBRATION_SECONDS:
+                    open_avg = float(np.median(self.calibration))
+                    self.blink_low, self.blink_high = blink_thresholds(
+                        open_avg, open_avg * CLOSED_EAR_FRACTION
+                    )
+                    self.calibrated = True
+                    self.calibration = []
+                    print(f"✅ [{self.driver_id}] calibrated: open EAR {open_avg:.3f}")
+            # Blink detection
+            if ear < self.blink_low and not self.blink_start:
+                self.blink_start = True
+            if ear >= self.blink_high and self.blink_start:
+                self.blink_count += 1
+                self.blink_start = False
+            self.latest = (ear, head_tilt, mouth_ratio)
+
+    def take_reading(self):
+        """Payload for /predict/batch (resets the blink window), or None."""
+        with self.lock:
+            if not self.calibrated or self.latest is None:
+                return None
+            ear, head_tilt, mouth_ratio = self.latest
+            payload = {
+                "user_id": self.driver_id,
+                "mode": "instant",
+                "eye_ratio": ear,
+                "blink_count": self.blink_count,
+                "head_tilt": head_tilt,
+                "yawn_ratio": mouth_ratio,
+            }
+            self.blink_count = 0
+            return payload
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+
+
+# ---------------- THREADS (parent process) ----------------
+def read_loop(stream, tasks, realtime, stop):
+    cap = cv2.VideoCapture(stream.source)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    next_frame = time.time()
+    while not stop.is_set():
+        success, frame = cap.read()
+        if not success:
+            if stream.is_file:
+                break
+            time.sleep(1.0)    # camera hiccup / RTSP reconnect
+            cap.release()
+            cap = cv2.VideoCapture(stream.source)
+            continue
+        stream.frames_read += 1
+
+        if stream.is_file and realtime:
+            next_frame += 1.0 / fps
+            time.sleep(max(0.0, next_frame - time.time()))
+
+        frame = cv2.flip(frame, 1)
+        if frame.shape[1] > INFERENCE_WIDTH:
+            scale = INFERENCE_WIDTH / frame.shape[1]
+            frame = cv2.resize(frame, (INFERENCE_WIDTH, int(frame.shape[0] * scale)))
+
+        if stream.is_file and not realtime:
+            while not stream.idle.wait(0.5):
+                if stop.is_set():
+                    break
+        elif not stream.idle.is_set():
+            stream.frames_dropped += 1
+            continue
+        if stop.is_set():
+            break
+        stream.submit(frame, tasks)
+    cap.release()
+    stream.idle.wait(5.0)   # let the last frame finish before reporting done
+    stream.done = True
+
+
+def collect_loop(streams, results, stop):
+    while not stop.is_set():
+        try:
+            driver_id, ts, metrics = results.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        stream = streams[driver_id]
+        stream.on_result(ts, metrics)
+        stream.idle.set()
+
+
+def telemetry_loop(streams, backend_url, stop):
+    session = requests.Session()     # one keep-alive connection for all drivers
+    while not stop.wait(SEND_INTERVAL):
+        batch = [p for p in (s.take_reading() for s in streams.values()) if p is not None]
+        if not batch:
+            continue
+        try:
+            r = session.post(f"{backend_url}/predict/batch", json=batch, timeout=5)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            print("⚠️ Could not send to backend:", e)
+            continue
+        # Results come back in request order
+        for reading, result in zip(batch, r.json()):
+            driver = reading["user_id"]
+            if "error" in result:
+                print(f"⚠️ [{driver}] {result['error']}: {result['detail']}")
+            elif result.get("status") == "alert":
+                print(f"🧠 [{driver}] ALERT", result)
+
+
+def parse_sources(values):
+    streams = OrderedDict()
+    for i, value in enumerate(values):
+        driver_id, sep, source = value.partition("=")
+        if not sep:
+            driver_id, source = f"driver_{i + 1}", value
+        streams[driver_id] = Stream(driver_id, source)
+    return streams
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NeuroDrive multi-stream camera client")
+    parser.add_argument("--source", action="append", required=True,
+                        help="driver_id=camera index, RTSP URL or video file (repeatable)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="FaceMesh worker processes (default: one per core)")
+    parser.add_argument("--backend", default=BACKEND_URL)
+    parser.add_argument("--fast", action="store_true",
+                        help="process recorded files as fast as possible instead of in real time")
+    parser.add_argument("--no-telemetry", action="store_true",
+                        help="don't send readings to the backend (benchmarks)")
+    args = parser.parse_args()
+
+    streams = parse_sources(args.source)
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    # One task queue per worker; a stream always goes to the same worker
+    worker_tasks = [ctx.Queue() for _ in range(max(1, min(args.workers, len(streams))))]
+    workers = [
+        ctx.Process(target=worker_main, args=(tasks, results), daemon=True)
+        for tasks in worker_tasks
+    ]
+    for w in workers:
+        w.start()
+
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=read_loop,
+                         args=(s, worker_tasks[i % len(worker_tasks)], not args.fast, stop),
+                         name=f"reader-{s.driver_id}", daemon=True)
+        for i, s in enumerate(streams.values())
+    ]
+    threads.append(threading.Thread(target=collect_loop, args=(streams, results, stop), daemon=True))
+    if not args.no_telemetry:
+        threads.append(threading.Thread(
+            target=telemetry_loop, args=(streams, args.backend, stop), daemon=True
+        ))
+    for t in threads:
+        t.start()
+
+    print(f"🎥 {len(streams)} streams, {len(workers)} FaceMesh workers. Ctrl-C to stop.")
+    started = time.time()
+    try:
+        while not all(s.done for s in streams.values()):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    elapsed = time.time() - started
+
+    for tasks in worker_tasks:
+        tasks.put(None)
+    for w in workers:
+        w.join(timeout=5)
+    for s in streams.values():
+        s.close()
+
+    total = sum(s.frames_processed for s in streams.values())
+    for s in streams.values():
+        print(f"   {s.driver_id}: read {s.frames_read}, processed {s.frames_processed}, "
+              f"dropped {s.frames_dropped}")
+    print(f"📊 {total} frames in {elapsed:.1f}s = {total / elapsed:.1f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# The app modules import each other as top-level modules (uvicorn runs
+# from backend/app), so put that directory on the path.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "app"))
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """TestClient for a fresh app; snippets are stored under tmp_path."""
+    from fastapi.testclient import TestClient
+    import main
+
+    monkeypatch.setattr(main, "SNIPPETS_DIR", str(tmp_path / "snippets"))
+    for name in ("_snippet_store", "_retention", "_share_tokens"):
+        monkeypatch.setattr(main, name, None)
+    with TestClient(main.create_app()) as c:
+        yield c
@@ -0,0 +1,178 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+
+import main
+from admission import LAG_SAMPLE_SECONDS, LEVEL_DEADLINE_SECONDS, AdmissionController, Overloaded
+from models import DriverData
+
+READING = {"mode": "instant", "eye_ratio": 0.3, "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+
+
+async def queue_up(controller, level):
+    """Starts a reading that waits for a slot at `level`."""
+    async def wait():
+        async with controller.slot(level):
+            pass
+    task = asyncio.ensure_future(wait())
+    await asyncio.sleep(0)
+    return task
+
+
+def test_highest_level_admitted_first():
+    async def run():
+        controller = AdmissionController(max_concurrent=1)
+        order = []
+        async with controller.slot(0):
+            async def reading(name, level):
+                async with controller.slot(level):
+                    order.append(name)
+            tasks = [asyncio.ensure_future(reading(n, l)) for n, l in
+                     (("a", 0), ("b", 2), ("c", 0), ("d", 2))]
+            await asyncio.sleep(0)
+            assert controller.stats()["queued"][2] == 2
+        await asyncio.gather(*tasks)
+        return order, controller
+
+    order, controller = asyncio.run(run())
+    assert order == ["b", "d", "a", "c"]
+    assert controller.running == 0 and controller.queued == 0
+
+
+def test_over_budget_wait_is_shed_with_retry_after():
+    async def run():
+        controller = AdmissionController(max_concurrent=1)
+        controller.service_time = LEVEL_DEADLINE_SECONDS[0]
+        async with controller.slot(3):
+            waiting = await queue_up(controller, 3)
+            with pytest.raises(Overloaded) as e:
+                async with controller.slot(0):
+                    pass
+        await waiting
+        return e.value, controller
+
+    shed, controller = asyncio.run(run())
+    assert shed.retry_after >= 1
+    assert "latency budget" in shed.reason
+    assert controller.shed[0] == 1 and controller.admitted == 2
+
+
+def test_full_queue_displaces_a_lower_level():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queued=1)
+        async with controller.slot(0):
+            low = await queue_up(controller, 0)
+            high = await queue_up(controller, 2)
+            with pytest.raises(Overloaded):
+                await low
+            with pytest.raises(Overloaded) as e:
+                async with controller.slot(0):
+                    pass
+        await high
+        return e.value, controller
+
+    full, controller = asyncio.run(run())
+    assert full.reason == "Admission queue full"
+    assert controller.shed[0] == 2 and controller.queued == 0
+
+
+def test_queued_reading_shed_at_its_deadline():
+    async def run():
+        controller = AdmissionController(max_concurrent=1)
+        async with controller.slot(0):
+            waiting = await queue_up(controller, 0)
+            await asyncio.sleep(LEVEL_DEADLINE_SECONDS[0] + 0.05)
+            with pytest.raises(Overloaded) as e:
+                await waiting
+        return e.value, controller
+
+    late, controller = asyncio.run(run())
+    assert late.reason == "Queue deadline exceeded"
+    assert controller.queued == 0 and controller.running == 0
+
+
+def test_shed_reading_returns_503_with_retry_after(client, monkeypatch):
+    lagging = AdmissionController()
+    lagging.record_lag(6.5)
+    monkeypatch.setattr(main, "_admission", lagging)
+    r = client.post("/predict", json={"user_id": "admission-503", **READING})
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "7"
+
+
+def test_loop_lag_sheds_low_levels_first(monkeypatch):
+    controller = AdmissionController(max_concurrent=1)
+    monkeypatch.setattr(main, "_admission", controller)
+    urgent = main.driver_sessions.get_or_create("admission-urgent")
+    urgent.escalation = {"level": 3, "last_change": 0.0, "recent_scores": [85]}
+    controller.record_lag(LEVEL_DEADLINE_SECONDS[0] + 0.5)
+
+    async def run():
+        tasks = BackgroundTasks()
+        calm = DriverData(user_id="admission-calm", **READING)
+        with pytest.raises(HTTPException) as e:
+            await main.admit_reading(calm, tasks)
+        return e.value, await main.admit_reading(DriverData(user_id="admission-urgent", **READING), tasks)
+
+    shed, response = asyncio.run(run())
+    assert shed.status_code == 503 and shed.headers["Retry-After"] == "1"
+    assert "fatigue_score" in response
+    assert controller.shed[0] == 1 and controller.admitted == 1
+
+
+def test_lag_monitor_sees_a_blocked_loop():
+    async def run():
+        controller = AdmissionController()
+        controller.start()
+        await asyncio.sleep(LAG_SAMPLE_SECONDS / 2)
+        time.sleep(0.3)   # blocks the loop, as inline work under load would
+        await asyncio.sleep(LAG_SAMPLE_SECONDS * 2)
+        lagged = controller.loop_lag
+        for _ in range(40):
+            controller.record_lag(0.0)
+        controller.stop()
+        return lagged, controller.loop_lag
+
+    lagged, recovered = asyncio.run(run())
+    assert lagged >= 0.2
+    assert recovered < 0.01
+
+
+def test_sms_not_reported_queued_when_it_cannot_be_sent(client, monkeypatch):
+    monkeypatch.delenv("TWILIO_FROM_NUMBER", raising=False)
+    session = main.driver_sessions.get_or_create("sms-1")
+    session.escalation = {"level": 3, "last_change": 0.0, "recent_scores": [95] * 10}
+
+    r = client.post("/predict", json={
+        "user_id": "sms-1", "mode": "instant", "eye_ratio": 0.05, "blink_count": 30,
+        "head_tilt": 40.0, "yawn_ratio": 0.9,
+    }).json()
+    assert r["escalation_level"] == 4
+    assert r["sms_triggered"] is False
+    assert r["sms_info"] == "Twilio not configured"
+
+
+def test_sms_queued_once_when_sendable(client, monkeypatch):
+    sent = []
+
+    class Messages:
+        def create(self, **kw):
+            sent.append(kw)
+
+    class Client:
+        messages = Messages()
+
+    monkeypatch.setenv("TWILIO_FROM_NUMBER", "+10000000000")
+    monkeypatch.setattr(main, "get_twilio_client", lambda: Client())
+    session = main.driver_sessions.get_or_create("sms-2")
+    session.contacts = [{"name": "Ops", "phone_number": "+10000000001"}]
+    session.escalation = {"level": 3, "last_change": 0.0, "recent_scores": [95] * 10}
+
+    r = client.post("/predict", json={
+        "user_id": "sms-2", "mode": "instant", "eye_ratio": 0.05, "blink_count": 30,
+        "head_tilt": 40.0, "yawn_ratio": 0.9,
+    }).json()
+    assert (r["sms_triggered"], r["sms_info"]) == (True, "SMS queued")
+    assert len(sent) == 1
@@ -0,0 +1,70 @@
+import numpy as np
+
+import calibration
+import main
+
+
+def _body(open_frames=50, closed_frames=50, channels=1):
+    rng = np.random.default_rng(0)
+    opened = rng.normal(0.30, 0.01, (open_frames, channels))
+    closed = rng.normal(0.12, 0.01, (closed_frames, channels))
+    return np.concatenate([opened, closed]).astype("<f4").tobytes()
+
+
+def test_binary_calibration(client):
+    r = client.post("/calibrate/driver-1/binary?open_frames=50&channels=2", content=_body(channels=2))
+    assert r.status_code == 200
+    profile = r.json()["profile"]
+    assert profile["open_ear"] > profile["closed_ear"]
+    assert "open_left" in profile["stats"]
+
+
+def test_oversized_body_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(calibration, "MAX_CALIBRATION_SAMPLES", 64)
+    r = client.post("/calibrate/driver-1/binary?open_frames=50", content=_body())
+    assert r.status_code == 413
+
+    # Without Content-Length the stream is cut off at the limit too
+    r = client.post(
+        "/calibrate/driver-1/binary?open_frames=50",
+        content=iter([_body()[:200], _body()[200:]]),
+    )
+    assert r.status_code == 413
+
+
+def _samples():
+    rng = np.random.default_rng(0)
+    return {"open_ears": rng.normal(0.30, 0.01, 50).tolist(),
+            "closed_ears": rng.normal(0.12, 0.01, 50).tolist()}
+
+
+def test_json_calibration(client):
+    r = client.post("/calibrate/json-driver", json=_samples())
+    assert r.status_code == 200
+    assert r.json()["profile"]["open_ear"] > r.json()["profile"]["closed_ear"]
+    assert client.post("/calibrate/json-driver", json={"open_ears": "x"}).status_code == 422
+
+
+def test_oversized_json_body_is_rejected_before_parsing(client, monkeypatch):
+    monkeypatch.setattr(calibration, "MAX_CALIBRATION_SAMPLES", 64)
+    parsed = []
+    monkeypatch.setattr(main.CalibrationSamples, "model_validate_json",
+                        classmethod(lambda cls, raw: parsed.append(raw)))
+    r = client.post("/calibrate/json-driver", json={"open_ears": [0.3] * 2000, "closed_ears": []})
+    assert r.status_code == 413
+    assert parsed == []
+
+
+def test_installed_profile_is_never_edited(client):
+    assert client.post("/calibrate/cow-driver", json=_samples()).status_code == 200
+    session = main.driver_sessions.get("cow-driver")
+    installed = session.profile
+    before = dict(installed)
+
+    reading = {"user_id": "cow-driver", "mode": "personalized", "eye_ratio": 0.2,
+               "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+    assert client.post("/predict", json=reading).status_code == 200
+    assert installed == before
+    assert session.profile is not installed
+    assert session.profile["version"] == installed["version"]
+    assert session.profile["ema_closed"] != installed["ema_closed"]
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+import main
+from timeline_index import DriverTimelineIndex
+
+
+class Pool:
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        self.calls.append(args)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    p = Pool()
+    monkeypatch.setattr(main, "get_notify_pool", lambda: p)
+    return p
+
+
+def escalated(user_id, t0):
+    session = main.driver_sessions.get_or_create(user_id)
+    session.escalation = {"level": 3, "last_change": t0, "recent_scores": [85], "last_reading": t0}
+    return session
+
+
+def event_types(session):
+    return [e["event_type"] for e in session.events()]
+
+
+def test_heartbeat_fires_after_persistence_event(pool):
+    t0 = time.time()
+    session = escalated("silent-1", t0)
+
+    main.on_deadline(("silent-1", "persistence"), t0)
+    main.on_deadline(("silent-1", "heartbeat"), t0)
+    assert event_types(session) == ["persistent_high_fatigue", "driver_silent"]
+    assert len(pool.calls) == 2
+
+
+def test_heartbeat_skipped_after_newer_reading(pool):
+    t0 = time.time()
+    session = escalated("silent-2", t0)
+    session.escalation["last_reading"] = t0 + 5
+
+    main.on_deadline(("silent-2", "heartbeat"), t0)
+    assert event_types(session) == []
+    assert pool.calls == []
+
+
+def test_timeline_index_concurrent_add_and_query():
+    index = DriverTimelineIndex()
+    start = time.time()
+
+    def writer(tag):
+        for i in range(2000):
+            index.add({"event_id": f"{tag}-{i}", "event_type": "normal", "tags": [tag],
+                       "fatigue_score": 10}, start + i * 1e-3)
+
+    threads = [threading.Thread(target=writer, args=(t,)) for t in ("a", "b", "c")]
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        events, _ = index.query(tags=["a"], limit=20)
+        assert all("a" in e["tags"] for e in events)
+    for t in threads:
+        t.join()
+
+    assert len(index.events) == len(index.times) == 6000
+    assert index.times == sorted(index.times)
+    assert sum(len(p) for p in index.by_tag.values()) == 6000
+    assert index.find("b-1999") is not None
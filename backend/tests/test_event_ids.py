@@ -0,0 +1,77 @@
+import sqlite3
+import time
+
+import pytest
+
+from event_ids import (
+    WORKER_LEASE_SECONDS, EventIdGenerator, WorkerIdError, WorkerIdLease, id_time,
+    worker_id_from_env,
+)
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "workers.sqlite")
+
+
+def test_ids_sort_by_creation_time():
+    ids = EventIdGenerator(worker_id=5)
+    made = [ids.next() for _ in range(5000)]
+    assert [i for i, _ in made] == sorted(i for i, _ in made)
+    assert len({i for i, _ in made}) == 5000
+    event_id, ts = made[0]
+    assert id_time(event_id) == ts and abs(ts - time.time()) < 5
+    assert int(event_id, 16) >> 12 & 1023 == 5
+
+
+def test_workers_lease_distinct_ids(db):
+    first, second = WorkerIdLease(db), WorkerIdLease(db)
+    assert (first.claim(), second.claim()) == (0, 1)
+    first.release()
+    assert WorkerIdLease(db).claim() == 0
+
+
+def test_explicit_id_clash_fails(db):
+    WorkerIdLease(db).claim(7)
+    with pytest.raises(WorkerIdError):
+        WorkerIdLease(db).claim(7)
+    assert WorkerIdLease(db).claim() == 0
+
+
+def test_lapsed_lease_is_reused(db):
+    dead = WorkerIdLease(db)
+    dead.claim(3)
+    with sqlite3.connect(db) as conn:
+        conn.execute("UPDATE worker_ids SET renewed_at = ?", (time.time() - WORKER_LEASE_SECONDS - 1,))
+    taker = WorkerIdLease(db)
+    assert taker.claim(3) == 3
+    with pytest.raises(WorkerIdError):
+        dead.renew()
+    taker.renew()
+
+
+def test_generator_needs_a_worker_id():
+    with pytest.raises(WorkerIdError):
+        EventIdGenerator().next()
+    assert EventIdGenerator(assign=lambda: 9).next()[0]
+
+
+def test_worker_id_env_is_validated(monkeypatch):
+    monkeypatch.delenv("NEURODRIVE_WORKER_ID", raising=False)
+    assert worker_id_from_env() is None
+    monkeypatch.setenv("NEURODRIVE_WORKER_ID", "12")
+    assert worker_id_from_env() == 12
+    for bad in ("1024", "-1", "worker-3"):
+        monkeypatch.setenv("NEURODRIVE_WORKER_ID", bad)
+        with pytest.raises(WorkerIdError):
+            worker_id_from_env()
+
+
+def test_second_worker_on_the_same_directory(client):
+    import main
+
+    assert main.event_ids.worker_id == main._worker_lease.worker_id
+    other = WorkerIdLease(main._worker_lease.db_path)
+    assert other.claim() != main.event_ids.worker_id
+    with pytest.raises(WorkerIdError):
+        WorkerIdLease(other.db_path).claim(main.event_ids.worker_id)
@@ -0,0 +1,54 @@
+import pytest
+
+import geo
+
+
+@pytest.fixture(autouse=True)
+def empty_tiles(monkeypatch):
+    monkeypatch.setattr(geo, "tiles", {z: {} for z in range(geo.MIN_ZOOM, geo.MAX_ZOOM + 1)})
+
+
+BERLIN = (52.52, 13.405)
+
+
+def test_tile_center_lies_in_its_tile():
+    for zoom in (3, 12, 16):
+        x, y = geo.tile_xy(*BERLIN, zoom)
+        assert geo.tile_xy(*geo.tile_center(x, y, zoom), zoom) == (x, y)
+    assert geo.tile_xy(89.9, 180.0, 3) == (7, 0)   # clamped to the map
+
+
+def test_readings_aggregate_on_every_zoom():
+    geo.record_reading(*BERLIN, 40, False)
+    geo.record_reading(BERLIN[0] + 0.0001, BERLIN[1], 90, True)
+    geo.record_safe_stop(*BERLIN)
+
+    for zoom in (geo.MIN_ZOOM, 12, geo.MAX_ZOOM):
+        [tile] = geo.heatmap(52.0, 13.0, 53.0, 14.0, zoom)["tiles"]
+        assert (tile["count"], tile["mean_score"], tile["max_score"]) == (2, 65.0, 90)
+        assert (tile["alerts"], tile["safe_stops"]) == (1, 1)
+
+
+def test_small_and_large_boxes_agree():
+    for i in range(20):
+        geo.record_reading(52.0 + i * 0.05, 13.0 + i * 0.05, i, False)
+    small = geo.heatmap(52.0, 13.0, 53.0, 14.0, 10)      # enumerates the box
+    large = geo.heatmap(-80.0, -170.0, 80.0, 170.0, 10)  # filters populated tiles
+    key = lambda t: (t["x"], t["y"])
+    assert sorted(small["tiles"], key=key) == sorted(large["tiles"], key=key)
+    assert sum(t["count"] for t in small["tiles"]) == 20
+    assert geo.heatmap(0.0, 0.0, 1.0, 1.0, 10)["tiles"] == []
+
+
+def test_heatmap_endpoint(client):
+    reading = {"user_id": "geo-driver", "mode": "instant", "eye_ratio": 0.2, "blink_count": 3,
+               "head_tilt": 0.0, "yawn_ratio": 0.1, "lat": BERLIN[0], "lng": BERLIN[1]}
+    assert client.post("/predict", json=reading).status_code == 200
+
+    box = {"min_lat": 52.0, "min_lng": 13.0, "max_lat": 53.0, "max_lng": 14.0, "zoom": 30}
+    body = client.get("/heatmap", params=box).json()
+    assert body["zoom"] == geo.MAX_ZOOM
+    assert body["tiles"][0]["count"] == 1
+
+    bad = {**box, "min_lat": 54.0}
+    assert client.get("/heatmap", params=bad).status_code == 400
@@ -0,0 +1,126 @@
+import os
+import sys
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import incident_clips
+from incident_clips import (
+    CLIP_COOLDOWN_SECONDS, POST_EVENT_SECONDS, PRE_EVENT_SECONDS, RECORD_FPS,
+    FrameRingBuffer, IncidentRecorder, upload_clip,
+)
+
+BASE = "http://backend"
+T0 = 1_700_000_000.0
+
+
+def test_ring_buffer_caps_age_and_bytes():
+    ring = FrameRingBuffer(seconds=2, max_bytes=10 ** 6)
+    for i in range(50):
+        ring.add(i * 0.1, b"x" * 10)
+    assert [ts for ts, _ in ring.snapshot()][0] == pytest.approx(2.9)
+    assert ring.bytes == 10 * len(ring.frames)
+
+    small = FrameRingBuffer(seconds=60, max_bytes=100)
+    for i in range(50):
+        small.add(i, b"x" * 30)
+    assert len(small.frames) == 3 and small.bytes == 90
+
+
+def record(recorder, start, seconds, fps=30):
+    for i in range(int(seconds * fps)):
+        recorder.add_frame(b"frame", now=start + i / fps)
+
+
+def test_incident_clip_spans_before_and_after_the_event():
+    recorder = IncidentRecorder("driver", BASE, encode=lambda frame: frame)
+    record(recorder, T0, 20)
+    assert len(recorder.ring.frames) == pytest.approx(PRE_EVENT_SECONDS * RECORD_FPS, abs=2)
+
+    event_at = T0 + 20
+    recorder.on_response({"event_id": "calm", "event_type": "normal", "escalation_level": 0}, now=event_at)
+    assert recorder.clip is None
+    recorder.on_response({"event_id": "evt", "event_type": "critical_fatigue"}, now=event_at)
+    record(recorder, event_at, POST_EVENT_SECONDS + 1)
+
+    clip = recorder.uploads.get_nowait()
+    times = [ts for ts, _ in clip["frames"]]
+    assert clip["event_id"] == "evt"
+    assert times[0] <= event_at - PRE_EVENT_SECONDS + 0.1
+    assert times[-1] >= event_at + POST_EVENT_SECONDS
+    assert recorder.clip is None
+
+
+def test_one_clip_per_incident_and_bounded_queue():
+    recorder = IncidentRecorder("driver", BASE, encode=lambda frame: frame)
+    escalated = {"event_id": "e1", "escalation_level": 3}
+    recorder.on_response(escalated, now=T0)
+    recorder.on_response({**escalated, "event_id": "e2"}, now=T0 + 1)
+    assert recorder.clip["event_id"] == "e1"
+    recorder.add_frame(b"frame", now=T0 + POST_EVENT_SECONDS)
+    recorder.on_response({**escalated, "event_id": "e3"}, now=T0 + POST_EVENT_SECONDS + 1)
+    assert recorder.clip is None   # still cooling down
+
+    for n in range(1, 4):
+        now = T0 + n * (CLIP_COOLDOWN_SECONDS + 1)
+        recorder.on_response({**escalated, "event_id": f"clip-{n}"}, now=now)
+        recorder.add_frame(b"frame", now=now + POST_EVENT_SECONDS)
+    assert recorder.uploads.qsize() == 2
+
+
+class FlakyBackend:
+    """requests-like client over a TestClient; the first PUT drops mid-body."""
+
+    def __init__(self, client):
+        self.client = client
+        self.dropped = False
+
+    def _path(self, url):
+        assert url.startswith(BASE)
+        return url[len(BASE):]
+
+    def post(self, url, json=None, timeout=None):
+        return self.client.post(self._path(url), json=json)
+
+    def get(self, url, timeout=None):
+        return self.client.get(self._path(url))
+
+    def put(self, url, params=None, data=None, timeout=None):
+        if not self.dropped and params["offset"] > 0:
+            self.dropped = True
+            self.client.put(self._path(url), params=params, content=data[: len(data) // 2])
+            raise requests.ConnectionError("connection reset")
+        return self.client.put(self._path(url), params=params, content=data)
+
+
+def test_clip_upload_resumes_after_a_dropped_connection(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(incident_clips, "UPLOAD_CHUNK_BYTES", 1000)
+    monkeypatch.setattr(incident_clips, "RETRY_BASE_SECONDS", 0)
+    reading = {"user_id": "clip-upload", "mode": "instant", "eye_ratio": 0.2,
+               "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+    event_id = client.post("/predict", json=reading).json()["event_id"]
+    clip = os.urandom(3500)
+    path = tmp_path / "clip.avi"
+    path.write_bytes(clip)
+
+    backend = FlakyBackend(client)
+    upload_clip(BASE, "clip-upload", event_id, str(path), http=backend)
+    assert backend.dropped
+    assert client.get(f"/timeline/clip-upload/{event_id}/snippet").content == clip
+
+
+def test_write_clip_muxes_frames(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    np = pytest.importorskip("numpy")
+    frames = []
+    for i in range(10):
+        ok, jpeg = cv2.imencode(".jpg", np.full((48, 64, 3), i * 20, np.uint8))
+        frames.append((i / RECORD_FPS, jpeg.tobytes()))
+    path = incident_clips.write_clip(frames)
+    try:
+        assert cv2.VideoCapture(path).get(cv2.CAP_PROP_FRAME_COUNT) == 10
+    finally:
+        os.remove(path)
+    assert incident_clips.write_clip(frames[:1]) is None
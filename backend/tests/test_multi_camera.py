@@ -0,0 +1,46 @@
+"""Runs multi_camera.py on a short recorded clip (needs opencv and mediapipe).
+
+Doubles as a throughput check: run with `pytest -s` to see frames/s.
+"""
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("mediapipe")
+np = pytest.importorskip("numpy")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLIP_FRAMES = 30
+
+
+@pytest.fixture
+def clip(tmp_path):
+    """A 1 s, 320x240 MJPG clip of a moving gradient."""
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (320, 240))
+    for i in range(CLIP_FRAMES):
+        frame = np.full((240, 320, 3), (i * 8) % 256, np.uint8)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def test_fast_run_processes_every_frame_of_every_stream(clip):
+    sources = [f"--source=cab{i}={clip}" for i in range(3)]
+    out = subprocess.run(
+        [sys.executable, "multi_camera.py", *sources, "--workers", "2", "--fast", "--no-telemetry"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=120,
+    )
+    assert out.returncode == 0, out.stderr
+    print(out.stdout)
+
+    counts = re.findall(r"(cab\d): read (\d+), processed (\d+), dropped (\d+)", out.stdout)
+    assert sorted(c[0] for c in counts) == ["cab0", "cab1", "cab2"]
+    for _, read, processed, dropped in counts:
+        assert int(read) == int(processed) == CLIP_FRAMES
+        assert int(dropped) == 0
+    assert re.search(r"frames/s", out.stdout)
@@ -0,0 +1,98 @@
+import pytest
+
+import poi
+
+CSV = """name,lat,lng,type,rating,user_ratings_total
+Rest A,52.5200,13.4050,rest_area,4.5,120
+Car park B,52.5210,13.4060,parking,n/a,lots
+Fuel C,52.5190,13.4040,fuel,,
+"""
+
+
+@pytest.fixture
+def poi_file(tmp_path, monkeypatch):
+    path = tmp_path / "poi.csv"
+    path.write_text(CSV)
+    monkeypatch.setenv("NEURODRIVE_POI_FILE", str(path))
+    monkeypatch.delenv("GOOGLE_MAPS_API_KEY", raising=False)
+    monkeypatch.setattr(poi, "_poi_index", None)
+    monkeypatch.setattr(poi, "_poi_checked", False)
+    monkeypatch.setattr(poi, "learned_places", poi.LearnedPlaces())
+    return path
+
+
+def test_bad_rating_fields_are_read_as_unknown(poi_file):
+    results = {r["name"]: r for r in poi.search(52.52, 13.405, 1000, 5)}
+    assert results["Rest A"]["rating"] == 4.5
+    assert results["Car park B"]["rating"] is None
+    assert results["Car park B"]["user_ratings_total"] is None
+
+
+def test_failed_load_is_not_retried(poi_file, monkeypatch):
+    calls = []
+
+    def broken(path):
+        calls.append(path)
+        raise ValueError("corrupt")
+
+    monkeypatch.setattr(poi, "PoiIndex", broken)
+    assert poi.search(52.52, 13.405, 1000, 5) == []
+    assert poi.search(52.52, 13.405, 1000, 5) == []
+    assert len(calls) == 1
+
+
+def test_no_demo_stops_when_poi_data_is_loaded(poi_file):
+    import main
+
+    assert [s.name for s in main.find_safe_stops(52.52, 13.405)]
+    # Nothing within 5 km of this point: no made-up places either
+    assert main.find_safe_stops(48.0, 11.0) == []
+
+
+def test_demo_stops_without_any_data(monkeypatch):
+    import main
+
+    monkeypatch.delenv("NEURODRIVE_POI_FILE", raising=False)
+    monkeypatch.delenv("GOOGLE_MAPS_API_KEY", raising=False)
+    monkeypatch.setattr(poi, "_poi_index", None)
+    monkeypatch.setattr(poi, "_poi_checked", False)
+    monkeypatch.setattr(poi, "learned_places", poi.LearnedPlaces())
+    assert main.find_safe_stops(48.0, 11.0)[0].type == "demo_rest_area"
+
+
+def place(name, lat, lng, place_id=None, type="parking"):
+    from models import SafeStopPlace
+    return SafeStopPlace(name=name, lat=lat, lng=lng, place_id=place_id, type=type, rating=4.0)
+
+
+def test_places_results_fill_in_sparse_areas(poi_file, monkeypatch):
+    import main
+
+    monkeypatch.setenv("GOOGLE_MAPS_API_KEY", "key")
+    calls = []
+
+    def places(lat, lng, api_key, radius, max_results):
+        calls.append((lat, lng))
+        return [place(f"Munich {i}", 48.0 + i * 0.001, 11.0, f"m{i}") for i in range(5)]
+
+    monkeypatch.setattr(main, "_places_safe_stops", places)
+    first = main.find_safe_stops(48.0, 11.0)
+    again = main.find_safe_stops(48.001, 11.0)
+    assert len(calls) == 1
+    assert {s.name for s in again} == {s.name for s in first}
+    assert again[0].distance_m is not None
+
+
+def test_learned_places_dedupe_and_stay_bounded(poi_file):
+    learned = poi.LearnedPlaces(max_places=3)
+    poi.learned_places = learned
+    learned.add({"name": "Rest A again", "lat": 52.52001, "lng": 13.40501, "place_id": "x"})
+    assert [r["name"] for r in poi.search(52.52, 13.405, 1000, 5)].count("Rest A again") == 0
+
+    for i in range(5):
+        learned.add({"name": f"P{i}", "lat": 10.0 + i, "lng": 10.0, "place_id": f"p{i}"})
+    learned.add({"name": "P4 renamed", "lat": 14.0, "lng": 10.0, "place_id": "p4"})
+    assert len(learned) == 3
+    assert [r["name"] for _, r in learned.nearest(14.0, 10.0, 1000, 5)] == ["P4 renamed"]
+    assert learned.nearest(10.0, 10.0, 1000, 5) == []
+    assert sum(len(keys) for keys in learned.cells.values()) == 3
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+import policy
+
+
+@pytest.fixture
+def policy_path(tmp_path, monkeypatch):
+    path = tmp_path / "policies.json"
+    monkeypatch.setenv("NEURODRIVE_POLICY_FILE", str(path))
+    monkeypatch.setattr(policy, "_registry", policy.PolicyRegistry({"default": policy.DEFAULT_POLICY}, {}, {}))
+    monkeypatch.setattr(policy, "_loaded_mtime", None)
+    return path
+
+
+def write(path, raw):
+    path.write_text(raw if isinstance(raw, str) else json.dumps(raw))
+
+
+GOOD = {
+    "policies": {"strict": {"reset_below": 30, "levels": [{"level": 4, "score": 60, "forecast": 60}]}},
+    "users": {"driver-1": "strict"},
+}
+
+
+@pytest.mark.parametrize("raw", [
+    {"policies": {"bad": {"levels": [{"level": 1, "score": None}]}}},
+    {"policies": {"bad": {"levels": [{"level": 1, "score": 50}], "actions": ["x"]}}},
+    {"policies": {"bad": {"levels": [{"level": 1, "score": 50}], "reset_below": "low"}}},
+    {"policies": {"bad": {"levels": ["level"]}}},
+    {"policies": {"bad": []}},
+    {"policies": []},
+    {"policies": {}, "users": {"driver-1": ["strict"]}},
+    [1, 2],
+    "{not json",
+])
+def test_malformed_file_raises_value_error(policy_path, raw):
+    write(policy_path, raw)
+    with pytest.raises(ValueError):
+        policy.load_registry(str(policy_path))
+
+
+def test_bad_reload_keeps_last_good_policy(policy_path):
+    write(policy_path, GOOD)
+    policy.reload_policies()
+    assert policy.get_policy("driver-1").name == "strict"
+
+    write(policy_path, {"policies": {"strict": {"levels": [{"level": 1, "score": None}]}},
+                        "users": {"driver-1": "strict"}})
+    policy._try_reload()
+    assert policy.get_policy("driver-1").name == "strict"
+    with pytest.raises(ValueError):
+        policy.reload_policies(force=True)
+    assert policy.get_policy("driver-1").rows == ((4, 60.0, 60.0),)
+
+
+def test_get_policy_never_reads_the_file(policy_path, monkeypatch):
+    write(policy_path, GOOD)
+    monkeypatch.setattr(policy, "load_registry", None)   # any call would raise
+    monkeypatch.setattr(policy.os.path, "getmtime", None)
+    assert policy.get_policy("driver-1").name == "default"
+
+
+def test_levels_above_the_action_list_get_an_action():
+    p = policy.compile_policy("custom", {"levels": [
+        {"level": 7, "score": 95, "forecast": 95},
+        {"level": 6, "score": 92, "forecast": 92, "action": "Call dispatch"},
+    ]})
+    assert p.action(4) == policy.DEFAULT_POLICY.actions[4]
+    assert p.action(5) == policy.DEFAULT_POLICY.actions[4]
+    assert p.action(6) == "Call dispatch"
+    assert p.action(7) == "Call dispatch"
+    assert p.action(9) == "Call dispatch"
+    assert p.action(-1) == policy.DEFAULT_POLICY.actions[0]
+
+
+def test_predict_survives_malformed_policy_file(policy_path, client):
+    write(policy_path, {"level": 1, "score": None, "policies": {"p": {"levels": [{"level": 1, "score": None}]}}})
+    reading = {"user_id": "driver-1", "mode": "instant", "eye_ratio": 0.3,
+               "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+    r = client.post("/predict", json=reading)
+    assert r.status_code == 200
+
+    r = client.post("/policies/reload")
+    assert r.status_code == 400
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from geo import tile_center, tile_xy
+from prefetch import CACHE_ZOOM, TILE_MARGIN_M, SafeStopCache
+
+
+def test_empty_results_expire_quickly():
+    answers = [[], ["stop"]]
+    cache = SafeStopCache(lambda lat, lng, r: answers.pop(0), empty_ttl=0.05)
+
+    assert cache.get_or_fetch(52.5, 13.4, 5000) == ([], False)
+    time.sleep(0.06)
+    assert cache.get_or_fetch(52.5, 13.4, 5000) == (["stop"], False)
+    assert cache.get_or_fetch(52.5, 13.4, 5000) == (["stop"], True)
+
+
+def test_empty_prefetch_falls_back_to_live_lookup():
+    release = threading.Event()
+    answers = [[], ["stop"]]
+
+    def fetch(lat, lng, r):
+        if len(answers) == 2:
+            release.wait(5)   # keep the prefetch in flight
+        return answers.pop(0)
+
+    cache = SafeStopCache(fetch)
+    assert cache.prefetch(52.5, 13.4, 5000)
+    threading.Timer(0.05, release.set).start()
+    # Joins the in-flight prefetch, which comes back empty
+    assert cache.get_or_fetch(52.5, 13.4, 5000) == (["stop"], False)
+
+
+def test_tile_lookup_is_ranked_for_each_caller():
+    import main
+    from models import SafeStopPlace
+
+    calls = []
+
+    def fetch(lat, lng, radius_m):
+        calls.append((lat, lng, radius_m))
+        return [SafeStopPlace(name=n, lat=lat_, lng=lng_, type="parking", rating=4.0)
+                for n, lat_, lng_ in (("west", 52.5196, 13.4040), ("east", 52.5196, 13.4135))]
+
+    cache = SafeStopCache(fetch, localize=main.safe_stops_near)
+    west, _ = cache.get_or_fetch(52.5197, 13.4041, 300)
+    east, cached = cache.get_or_fetch(52.5197, 13.4134, 300)
+
+    [(lat, lng, radius)] = calls
+    x, y = tile_xy(52.5197, 13.4041, CACHE_ZOOM)
+    assert (lat, lng) == tile_center(x, y, CACHE_ZOOM) and radius == 300 + TILE_MARGIN_M
+    assert cached
+    assert [p.name for p in west] == ["west"] and west[0].distance_m < 20
+    assert [p.name for p in east] == ["east"] and east[0].distance_m < 20
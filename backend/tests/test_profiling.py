@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+import main
+from profiling import AllocationTracer, CpuSampler, ProfilerBusy
+from sketch import EarSketch
+
+TOKEN = "profile-secret"
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setenv("NEURODRIVE_ADMIN_TOKEN", TOKEN)
+    return {"X-Admin-Token": TOKEN}
+
+
+def test_cpu_sampler_collapses_stacks():
+    stop = threading.Event()
+
+    def spin():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=spin, name="spinner")
+    worker.start()
+    try:
+        collapsed, samples = CpuSampler(interval=0.001).run(0.1)
+    finally:
+        stop.set()
+        worker.join()
+    assert samples > 10
+    spinner = [line for line in collapsed.splitlines() if line.startswith("spinner;")]
+    assert spinner and all(line.rsplit(" ", 1)[1].isdigit() for line in spinner)
+    assert any("spin (test_profiling.py:" in line for line in spinner)
+
+
+def test_allocations_attributed_to_their_store():
+    tracer = AllocationTracer()
+    report = {}
+    thread = threading.Thread(target=lambda: report.update(tracer.run(0.3)))
+    thread.start()
+    time.sleep(0.05)
+    kept = [EarSketch() for _ in range(200)]
+    thread.join()
+    assert kept
+    assert report["stores"]["ear_sketches"]["size_diff"] > 0
+    assert report["stores"]["ear_sketches"]["top_sites"][0]["site"].startswith("sketch.py:")
+
+
+def test_one_profile_at_a_time():
+    sampler = CpuSampler()
+    sampler._running = True
+    with pytest.raises(ProfilerBusy):
+        sampler.run(0.01)
+
+
+def test_admin_endpoints_hidden_without_a_token(client, monkeypatch):
+    monkeypatch.delenv("NEURODRIVE_ADMIN_TOKEN", raising=False)
+    assert client.post("/admin/profile/cpu", params={"seconds": 0.01}).status_code == 404
+
+
+def test_admin_endpoints_need_the_right_token(client, admin):
+    assert client.post("/admin/profile/cpu", params={"seconds": 0.01}).status_code == 403
+    r = client.post("/admin/profile/cpu", params={"seconds": 0.01},
+                    headers={"X-Admin-Token": "wrong"})
+    assert r.status_code == 403
+
+
+def test_profile_endpoints(client, admin, monkeypatch):
+    r = client.post("/admin/profile/cpu", params={"seconds": 0.05}, headers=admin)
+    assert r.status_code == 200
+    assert int(r.headers["X-Profile-Samples"]) > 0
+
+    r = client.post("/admin/profile/memory", params={"seconds": 0.05}, headers=admin)
+    assert r.status_code == 200
+    assert {"fatigue_history", "sessions", "at_risk_index"} <= set(r.json()["store_sizes"])
+
+    monkeypatch.setattr(main.cpu_sampler, "_running", True)
+    assert client.post("/admin/profile/cpu", params={"seconds": 0.01}, headers=admin).status_code == 409
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from snippet_store import CHUNK_SIZE, SnippetStore
+
+CLIP = os.urandom(CHUNK_SIZE * 2 + 1000)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-10", (990, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=0-1,5-6", None),       # multi-range: whole body
+    ("items=0-1", None),
+    ("bytes=abc", None),
+])
+def test_parse_range(header, expected):
+    assert main.parse_range(header, 1000) == expected
+
+
+def test_unsatisfiable_range():
+    with pytest.raises(HTTPException) as e:
+        main.parse_range("bytes=1000-", 1000)
+    assert e.value.status_code == 416
+    assert e.value.headers["Content-Range"] == "bytes */1000"
+
+
+def test_range_reads_only_overlapping_chunks(tmp_path, monkeypatch):
+    store = SnippetStore(str(tmp_path), b"k" * 32)
+    store.put("e1", CLIP)
+    reader = store.reader("e1")
+    opened = []
+    real = reader.open_chunk
+    monkeypatch.setattr(reader, "open_chunk", lambda i, sealed: opened.append(i) or real(i, sealed))
+
+    start, end = CHUNK_SIZE - 10, CHUNK_SIZE + 9
+    assert b"".join(reader.iter_range(start, end)) == CLIP[start:end + 1]
+    assert opened == [0, 1]
+
+
+def test_corrupt_chunk_raises_its_own_error(tmp_path):
+    from cryptography.exceptions import InvalidTag
+
+    store = SnippetStore(str(tmp_path), b"k" * 32)
+    store.put("e1", CLIP)
+    reader = store.reader("e1")
+    with open(reader.path, "r+b") as f:
+        f.seek(reader.entries[1][0] + 5)
+        f.write(b"\0\0\0\0")
+    with pytest.raises(InvalidTag):
+        list(reader.iter_chunks())
+
+
+def test_download_endpoint_ranges(client):
+    reading = {"user_id": "range-driver", "mode": "instant", "eye_ratio": 0.2,
+               "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+    event_id = client.post("/predict", json=reading).json()["event_id"]
+    client.post(f"/timeline/range-driver/{event_id}/snippet", files={"file": ("c.mp4", CLIP, "video/mp4")})
+    url = f"/timeline/range-driver/{event_id}/snippet"
+
+    full = client.get(url)
+    assert full.status_code == 200 and full.content == CLIP
+    assert full.headers["accept-ranges"] == "bytes"
+
+    part = client.get(url, headers={"Range": f"bytes={CHUNK_SIZE - 5}-{CHUNK_SIZE + 4}"})
+    assert part.status_code == 206
+    assert part.content == CLIP[CHUNK_SIZE - 5:CHUNK_SIZE + 5]
+    assert part.headers["content-range"] == f"bytes {CHUNK_SIZE - 5}-{CHUNK_SIZE + 4}/{len(CLIP)}"
+
+    assert client.get(url, headers={"Range": f"bytes={len(CLIP)}-"}).status_code == 416
+    assert client.get(f"/timeline/someone-else/{event_id}/snippet").status_code == 404
@@ -0,0 +1,89 @@
+import os
+import time
+
+import pytest
+
+from retention import MAX_AGE_SECONDS, ORPHAN_GRACE_SECONDS, RetentionManager
+from snippet_store import SnippetStore
+
+DAY = 86400
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnippetStore(str(tmp_path), b"k" * 32)
+
+
+def manager(store, quota=10 ** 9):
+    evicted = []
+    return RetentionManager(store, quota_bytes=quota, on_evict=evicted.extend), evicted
+
+
+def test_clips_expire_by_priority(store):
+    for priority in (0, 1, 2):
+        store.put(f"p{priority}", os.urandom(100 + priority), priority=priority)
+    retention, evicted = manager(store)
+
+    retention.expire(time.time() + MAX_AGE_SECONDS[0] + DAY)
+    assert evicted == ["p0"]
+    retention.expire(time.time() + MAX_AGE_SECONDS[1] + DAY)
+    assert evicted == ["p0", "p1"]
+    assert store.stats()["events"] == 1
+
+
+def test_quota_evicts_lowest_priority_oldest_first(store):
+    for i, priority in enumerate((2, 0, 1, 0)):
+        store.put(f"e{i}", os.urandom(1000), priority=priority)
+    per_blob = store.stored_bytes // 4
+    retention, evicted = manager(store, quota=per_blob * 3)
+
+    retention.enforce_quota()
+    assert evicted == ["e1", "e3"]    # down to the 90% low-water mark
+    assert store.stored_bytes <= per_blob * 3 * 0.9
+
+
+def test_shared_blob_frees_space_on_last_reference(store):
+    clip = os.urandom(1000)
+    store.put("a", clip)
+    store.put("b", clip)
+    store.put("c", os.urandom(1000), priority=1)
+    retention, evicted = manager(store, quota=store.stored_bytes - 1)
+
+    retention.enforce_quota()
+    assert evicted == ["a", "b"]
+    assert store.stats()["events"] == 1
+
+
+def test_reconcile_removes_orphans_and_drops_missing_blobs(store):
+    store.put("kept", b"kept")
+    store.put("lost", b"lost")
+    lost_path = store.reader("lost").path
+    os.remove(lost_path)
+
+    shard = os.path.basename(os.path.dirname(store.reader("kept").path))
+    orphan = os.path.join(store.blob_dir, shard, shard + "0" * 62 + ".snp")
+    with open(orphan, "wb") as f:
+        f.write(b"x")
+    old = time.time() - ORPHAN_GRACE_SECONDS - 1
+    os.utime(orphan, (old, old))
+
+    retention, evicted = manager(store)
+    for s in {shard, os.path.basename(os.path.dirname(lost_path))}:
+        retention.reconcile_shard(s, time.time())
+    assert not os.path.exists(orphan)
+    assert evicted == ["lost"]
+    assert store.reader("kept").read_all() == b"kept"
+
+
+def test_evicted_clip_clears_the_event_flag(client):
+    import main
+
+    reading = {"user_id": "retention-driver", "mode": "instant", "eye_ratio": 0.2,
+               "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+    event_id = client.post("/predict", json=reading).json()["event_id"]
+    client.post(f"/timeline/retention-driver/{event_id}/snippet", files={"file": ("c.mp4", b"clip")})
+
+    retention = main.get_retention()
+    retention.expire(time.time() + MAX_AGE_SECONDS[0] + DAY)
+    assert not client.get(f"/timeline/retention-driver/{event_id}").json()["has_snippet"]
+    assert client.get(f"/timeline/retention-driver/{event_id}/snippet").status_code == 404
@@ -0,0 +1,54 @@
+import main
+from risk_index import STALE_AFTER_SECONDS, AtRiskIndex
+
+NOW = 1_700_000_000.0
+
+
+def test_ranked_by_level_then_score_then_forecast():
+    index = AtRiskIndex()
+    index.update("a", 1, 90, 95.0, NOW)
+    index.update("b", 3, 40, 50.0, NOW)
+    index.update("c", 1, 90, 99.0, NOW, "fleet-1")
+    index.update("d", 0, 99, 99.0, NOW)
+    top = index.top(10, now=NOW)
+    assert [d["user_id"] for d in top] == ["b", "c", "a", "d"]
+    assert top[1]["fleet_id"] == "fleet-1"
+    assert [d["user_id"] for d in index.top(2, now=NOW)] == ["b", "c"]
+
+
+def test_update_moves_a_driver():
+    index = AtRiskIndex()
+    index.update("a", 3, 80, 80.0, NOW)
+    index.update("b", 2, 60, 60.0, NOW)
+    index.update("a", 0, 10, 10.0, NOW + 1)
+    assert [d["user_id"] for d in index.top(10, now=NOW + 1)] == ["b", "a"]
+    assert len(index) == 2
+    index.remove("b")
+    assert [d["user_id"] for d in index.top(10, now=NOW + 1)] == ["a"]
+
+
+def test_filters_and_stale_drivers():
+    index = AtRiskIndex()
+    index.update("fresh", 2, 70, 70.0, NOW)
+    index.update("older", 3, 70, 70.0, NOW - 120)
+    index.update("stale", 4, 90, 90.0, NOW - STALE_AFTER_SECONDS - 1)
+    index.update("calm", 0, 10, 10.0, NOW)
+
+    assert [d["user_id"] for d in index.top(10, min_level=2, now=NOW)] == ["older", "fresh"]
+    assert [d["user_id"] for d in index.top(10, max_age=60, now=NOW)] == ["fresh", "calm"]
+    assert "stale" not in index.entries and len(index) == 3
+
+
+def test_at_risk_endpoint(client):
+    calm = {"user_id": "risk-calm", "mode": "instant", "eye_ratio": 0.3,
+            "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+    tired = {**calm, "user_id": "risk-tired", "eye_ratio": 0.05, "blink_count": 30,
+             "head_tilt": 40.0, "yawn_ratio": 0.9, "fleet_id": "risk-fleet"}
+    client.post("/predict", json=calm)
+    client.post("/predict", json=tired)
+
+    drivers = client.get("/fleet/at-risk", params={"k": main.MAX_TOP_K}).json()["drivers"]
+    ranked = [d["user_id"] for d in drivers]
+    assert ranked.index("risk-tired") < ranked.index("risk-calm")
+    assert drivers[ranked.index("risk-tired")]["fleet_id"] == "risk-fleet"
+    assert client.get("/fleet/at-risk", params={"k": 0}).status_code == 422
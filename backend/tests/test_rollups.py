@@ -0,0 +1,56 @@
+from rollups import DriverRollups, RollupSeries
+
+T0 = 1_760_000_000   # a multiple of 3600
+
+
+def test_buckets_aggregate_scores():
+    series = RollupSeries(10, 100)
+    for offset, score, alert in ((0, 40, False), (3, 80, True), (9, 60, False), (12, 20, False)):
+        series.add(T0 + offset, score, alert)
+
+    assert series.range(T0, T0 + 20) == [
+        {"start": T0, "min": 40, "mean": 60.0, "max": 80, "count": 3, "alerts": 1},
+        {"start": T0 + 10, "min": 20, "mean": 20.0, "max": 20, "count": 1, "alerts": 0},
+    ]
+
+
+def test_late_reading_folds_into_its_bucket_or_is_dropped():
+    series = RollupSeries(10, 2)
+    for i in range(6):
+        series.add(T0 + 10 * i, 50, False)
+    series.add(T0 + 41, 90, True)
+    assert series.range(T0 + 40, T0 + 40) == [
+        {"start": T0 + 40, "min": 50, "mean": 70.0, "max": 90, "count": 2, "alerts": 1},
+    ]
+    series.add(T0, 10, False)       # already trimmed
+    assert series.starts[0] > T0
+    assert not series.covers(T0)
+
+
+def test_trim_keeps_at_most_twice_the_retention():
+    series = RollupSeries(10, 5)
+    for i in range(100):
+        series.add(T0 + 10 * i, i, False)
+        assert len(series.starts) <= 10
+    assert series.starts[-1] == T0 + 990
+
+
+def test_pick_finest_resolution_that_fits():
+    rollups = DriverRollups()
+    rollups.add(T0, 50, False)
+    assert rollups.pick(T0, T0 + 3600, 400).width == 10
+    assert rollups.pick(T0, T0 + 3600, 100).width == 60
+    assert rollups.pick(T0, T0 + 7 * 86400, 200).width == 3600
+    assert rollups.pick(T0, T0 + 10 * 365 * 86400, 10).width == 3600
+
+
+def test_trends_endpoint(client):
+    reading = {"user_id": "trends-driver", "mode": "instant", "eye_ratio": 0.2,
+               "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+    for _ in range(3):
+        assert client.post("/predict", json=reading).status_code == 200
+
+    body = client.get("/trends/trends-driver", params={"points": 400}).json()
+    assert body["resolution_seconds"] == 10
+    assert sum(b["count"] for b in body["buckets"]) == 3
+    assert client.get("/trends/nobody").json()["buckets"] == []
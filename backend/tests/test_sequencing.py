@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+
+import main
+from admission import AdmissionController
+from sequencing import REORDER_WAIT_SECONDS, SEQ_WINDOW, ReadingSequence, ReadingSequencer, SequenceError
+
+
+class Shed(Exception):
+    pass
+
+
+def run(*submissions):
+    """Submits (seq, epoch, fail) readings in order; returns results and apply order."""
+    applied = []
+
+    async def go():
+        sequencer, state = ReadingSequencer(), ReadingSequence()
+        results = []
+        for seq, epoch, fail in submissions:
+            async def handler(seq=seq, fail=fail):
+                if fail:
+                    raise Shed(seq)
+                applied.append(seq)
+                return {"seq": seq}
+            try:
+                results.append(await sequencer.submit(state, seq, handler, epoch))
+            except (Shed, SequenceError) as e:
+                results.append(type(e).__name__)
+        return results, state
+
+    results, state = asyncio.run(go())
+    return results, applied, state
+
+
+def test_retry_gets_the_cached_response():
+    results, applied, _ = run((1, 0, False), (2, 0, False), (1, 0, False))
+    assert results == [{"seq": 1}, {"seq": 2}, {"seq": 1}]
+    assert applied == [1, 2]
+
+
+def test_failed_reading_neither_stalls_the_next_nor_blocks_its_retry():
+    start = time.monotonic()
+    results, applied, _ = run(
+        (1, 0, False), (2, 0, True), (3, 0, False), (2, 0, False), (2, 0, False),
+    )
+    assert time.monotonic() - start < REORDER_WAIT_SECONDS / 2
+    assert results == [{"seq": 1}, "Shed", {"seq": 3}, {"seq": 2}, {"seq": 2}]
+    assert applied == [1, 3, 2]
+
+
+def test_late_reading_that_never_failed_is_rejected():
+    async def go():
+        sequencer, state = ReadingSequencer(), ReadingSequence()
+
+        async def handler():
+            return {}
+        await sequencer.submit(state, 1, handler)
+        await sequencer.submit(state, 3, handler)   # waits out the gap at 2
+        with pytest.raises(SequenceError):
+            await sequencer.submit(state, 2, handler)
+        return sequencer
+
+    start = time.monotonic()
+    sequencer = asyncio.run(go())
+    assert time.monotonic() - start >= REORDER_WAIT_SECONDS
+    assert (sequencer.gaps_skipped, sequencer.late) == (1, 1)
+
+
+def test_stale_retry_is_not_taken_for_a_restart():
+    last = SEQ_WINDOW + 10
+    readings = [(seq, 0, False) for seq in range(1, last + 1)]
+    results, applied, state = run(*readings, (1, 0, False))
+    assert results[-1] == "SequenceError"
+    assert applied == list(range(1, last + 1))
+    assert state.applied == last
+
+
+def test_new_epoch_starts_the_counter_over():
+    results, applied, state = run((5, 0, False), (1, 1, False), (1, 1, False), (6, 0, False))
+    assert results == [{"seq": 5}, {"seq": 1}, {"seq": 1}, "SequenceError"]
+    assert applied == [5, 1]
+    assert (state.epoch, state.applied) == (1, 1)
+
+
+def test_shed_reading_can_be_retried(client, monkeypatch):
+    reading = {"user_id": "seq-driver", "mode": "instant", "eye_ratio": 0.3,
+               "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+    assert client.post("/predict", json={**reading, "seq": 1}).status_code == 200
+
+    admission = main.get_admission()
+    lagging = AdmissionController()
+    lagging.record_lag(60.0)
+    monkeypatch.setattr(main, "_admission", lagging)
+    assert client.post("/predict", json={**reading, "seq": 2}).status_code == 503
+    monkeypatch.setattr(main, "_admission", admission)
+
+    assert client.post("/predict", json={**reading, "seq": 3}).status_code == 200
+    retried = client.post("/predict", json={**reading, "seq": 2})
+    assert retried.status_code == 200
+    assert client.post("/predict", json={**reading, "seq": 2}).json() == retried.json()
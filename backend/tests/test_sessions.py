@@ -0,0 +1,59 @@
+import time
+
+import main
+from sessions import SessionRegistry
+
+READING = {"mode": "instant", "eye_ratio": 0.3, "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+
+
+def evict_all():
+    return main.driver_sessions.evict_idle(now=time.monotonic() + 10 ** 6)
+
+
+def flags(client, user_id, event_id):
+    history = {e["event_id"]: e for e in client.get("/history").json()}
+    timeline = {e["event_id"]: e for e in client.get(f"/timeline/{user_id}").json()}
+    return history[event_id]["has_snippet"], timeline[event_id]["has_snippet"]
+
+
+def test_history_and_timeline_agree_after_rehydration(client):
+    event_id = client.post("/predict", json={"user_id": "rehydrate-1", **READING}).json()["event_id"]
+    assert evict_all() >= 1
+    assert main.driver_sessions.peek("rehydrate-1") is None
+
+    r = client.post(
+        f"/timeline/rehydrate-1/{event_id}/snippet",
+        files={"file": ("clip.mp4", b"\x00clip" * 100, "video/mp4")},
+    )
+    assert r.status_code == 200
+    assert flags(client, "rehydrate-1", event_id) == (True, True)
+    recent = next(e for e in main.fatigue_history if e["event_id"] == event_id)
+    assert main.driver_event("rehydrate-1", event_id) is recent
+
+
+def test_forget_snippets_leaves_drivers_packed(client):
+    event_id = client.post("/predict", json={"user_id": "rehydrate-2", **READING}).json()["event_id"]
+    client.post(
+        f"/timeline/rehydrate-2/{event_id}/snippet",
+        files={"file": ("clip.mp4", b"\x01clip" * 100, "video/mp4")},
+    )
+    evict_all()
+    active = main.driver_sessions.stats()["active"]
+
+    main.forget_snippets([event_id])
+    assert main.driver_sessions.stats()["active"] == active
+    assert main.driver_sessions.peek("rehydrate-2") is None
+    # /history holds the live dict; the packed copy is fixed on rehydration
+    assert flags(client, "rehydrate-2", event_id) == (False, False)
+
+
+def test_get_never_evicts():
+    registry = SessionRegistry(idle_seconds=0)
+    for i in range(5):
+        registry.get_or_create(f"driver-{i}")
+    for i in range(5):
+        registry.get(f"driver-{i}")
+    assert registry.stats()["active"] == 5
+    assert registry.evict_idle(now=time.monotonic() + 1) == 5
+    assert registry.get("driver-0") is not None
+    assert registry.stats()["rehydrated"] == 1
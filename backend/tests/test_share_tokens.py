@@ -0,0 +1,123 @@
+import pytest
+
+import main
+from share_tokens import (
+    MAX_TTL_SECONDS, SCOPE_CONTENT, SCOPE_META, SCOPES, ShareTokenError, ShareTokens,
+)
+from snippet_store import SnippetStore
+
+READING = {"mode": "instant", "eye_ratio": 0.3, "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def tokens(tmp_path):
+    store = SnippetStore(str(tmp_path), b"k" * 32)
+    return ShareTokens(store.share_key, store)
+
+
+def status(e):
+    return e.value.status_code
+
+
+def test_issue_and_verify(tokens):
+    token, claims = tokens.issue("evt-1", "driver-1", ttl_seconds=60, now=NOW)
+    assert claims.expires_at == NOW + 60
+    verified = tokens.verify(token, SCOPE_CONTENT, now=NOW + 59)
+    assert (verified.event_id, verified.user_id) == ("evt-1", "driver-1")
+    assert verified.token_id == claims.token_id
+
+
+def test_ttl_is_capped(tokens):
+    _, claims = tokens.issue("evt-1", "driver-1", ttl_seconds=10 ** 9, now=NOW)
+    assert claims.expires_at == NOW + MAX_TTL_SECONDS
+
+
+def test_expired_token_is_gone(tokens):
+    token, _ = tokens.issue("evt-1", "driver-1", ttl_seconds=60, now=NOW)
+    with pytest.raises(ShareTokenError) as e:
+        tokens.verify(token, SCOPE_META, now=NOW + 60)
+    assert status(e) == 410
+
+
+def test_scope_is_enforced(tokens):
+    token, _ = tokens.issue("evt-1", "driver-1", scope=SCOPES["meta"], now=NOW)
+    tokens.verify(token, SCOPE_META, now=NOW)
+    with pytest.raises(ShareTokenError) as e:
+        tokens.verify(token, SCOPE_CONTENT, now=NOW)
+    assert status(e) == 403
+
+
+def test_forged_or_tampered_tokens_are_rejected(tokens, tmp_path):
+    token, _ = tokens.issue("evt-1", "driver-1", now=NOW)
+    body, mac = token.split(".")
+    other_key = SnippetStore(str(tmp_path / "other"), b"o" * 32)
+    forged, _ = ShareTokens(other_key.share_key, other_key).issue("evt-1", "driver-1", now=NOW)
+    tampered = body[:3] + ("B" if body[3] == "A" else "A") + body[4:]
+    for bad in (body + "." + mac[::-1], tampered + "." + mac, forged, "not-a-token", ""):
+        with pytest.raises(ShareTokenError) as e:
+            tokens.verify(bad, SCOPE_META, now=NOW)
+        assert status(e) == 404
+
+
+def test_revocation_is_shared_through_the_store(tokens):
+    token, _ = tokens.issue("evt-1", "driver-1", now=NOW)
+    other_worker = ShareTokens(tokens.key, SnippetStore(tokens.store.root, b"k" * 32))
+    other_worker.verify(token, SCOPE_META, now=NOW)
+
+    tokens.revoke(token, now=NOW)
+    for worker in (tokens, other_worker):
+        with pytest.raises(ShareTokenError) as e:
+            worker.verify(token, SCOPE_META, now=NOW)
+        assert status(e) == 410
+    tokens.store.purge_revoked(NOW + MAX_TTL_SECONDS + 1)
+    assert not tokens.store.is_revoked(tokens.decode(token).token_id)
+
+
+def shared_snippet(client, user_id):
+    event_id = client.post("/predict", json={"user_id": user_id, **READING}).json()["event_id"]
+    r = client.post(
+        f"/timeline/{user_id}/{event_id}/snippet",
+        files={"file": ("clip.mp4", b"clip bytes" * 100, "video/mp4")},
+    )
+    return event_id, r.json()["share_token"]
+
+
+@pytest.fixture
+def shared_key(monkeypatch):
+    """Workers that share snippets share the snippet key."""
+    monkeypatch.setenv("NEURODRIVE_SNIPPET_KEY", "shared-snippet-key")
+
+
+def test_token_works_on_a_worker_that_never_saw_the_upload(shared_key, client, monkeypatch):
+    event_id, token = shared_snippet(client, "share-1")
+
+    # Another worker shares the snippet directory and key, but has neither
+    # the driver's session nor the snippet in memory
+    monkeypatch.setattr(main, "incident_snippets", {})
+    monkeypatch.setattr(main.driver_sessions, "get", lambda user_id: None)
+    for name in ("_snippet_store", "_retention", "_share_tokens"):
+        monkeypatch.setattr(main, name, None)
+
+    meta = client.get(f"/snippet/share/{token}")
+    assert meta.status_code == 200
+    assert meta.json()["event"]["event_id"] == event_id
+    content = client.get(f"/snippet/share/{token}/content", headers={"Range": "bytes=0-9"})
+    assert (content.status_code, content.content) == (206, b"clip bytes")
+
+    assert client.post(f"/snippet/share/{token}/revoke").json() == {"revoked": True}
+    assert client.get(f"/snippet/share/{token}/content").status_code == 410
+
+
+def test_share_endpoint_scopes_and_revocation(client):
+    event_id, _ = shared_snippet(client, "share-2")
+    r = client.post(f"/timeline/share-2/{event_id}/snippet/share",
+                    params={"scope": "meta", "ttl_seconds": 60}).json()
+    token = r["share_token"]
+    assert client.get(f"/snippet/share/{token}").status_code == 200
+    assert client.get(f"/snippet/share/{token}/content").status_code == 403
+    assert client.post(f"/timeline/other-driver/{event_id}/snippet/share").status_code == 404
+
+    client.post(f"/snippet/share/{token}/revoke")
+    assert client.get(f"/snippet/share/{token}").status_code == 410
+    assert client.post("/snippet/share/garbage/revoke").status_code == 404
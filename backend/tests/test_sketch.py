@@ -0,0 +1,62 @@
+import pytest
+
+from sketch import EAR_MAX, WARMUP_SAMPLES, EarSketch, _COUNT_CAP
+
+
+def test_quantiles_track_the_readings():
+    sketch = EarSketch()
+    for i in range(1000):
+        sketch.add(0.1 + 0.2 * i / 1000)
+    assert sketch.quantile(0.5) == pytest.approx(0.2, abs=0.006)
+    assert sketch.quantile(0.1) == pytest.approx(0.12, abs=0.006)
+    assert EarSketch().quantile(0.5) is None
+
+
+def test_out_of_range_readings_are_clamped():
+    sketch = EarSketch()
+    sketch.add(-1.0)
+    sketch.add(5.0)
+    assert sketch.counts[0] == 1 and sketch.counts[-1] == 1
+    assert sketch.quantile(1.0) <= EAR_MAX
+
+
+def test_saturated_bin_halves_everything():
+    sketch = EarSketch()
+    sketch.add(0.1)
+    sketch.add(0.1)
+    for _ in range(_COUNT_CAP + 1):
+        sketch.add(0.3)
+    assert max(sketch.counts) < _COUNT_CAP
+    assert sketch.total == sum(sketch.counts)
+    assert sketch.counts[20] == 1
+
+
+def test_baselines_after_warmup():
+    sketch = EarSketch()
+    for _ in range(WARMUP_SAMPLES - 1):
+        sketch.add(0.3)
+    assert sketch.baselines() is None
+
+    for i in range(200):
+        sketch.add(0.12 if i % 20 == 0 else 0.3)
+    base = sketch.baselines()
+    assert base["open_ear"] == pytest.approx(0.3, abs=0.006)
+    assert base["closed_ear"] == pytest.approx(0.12, abs=0.006)
+    assert base["blink_low"] < base["blink_high"]
+
+
+def test_closed_baseline_kept_below_open():
+    sketch = EarSketch()
+    for _ in range(100):
+        sketch.add(0.3)
+    base = sketch.baselines()
+    assert base["closed_ear"] <= 0.6 * base["open_ear"]
+
+
+def test_uncalibrated_driver_gets_auto_profile(client):
+    reading = {"user_id": "sketch-driver", "mode": "personalized", "eye_ratio": 0.3,
+               "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+    assert client.post("/predict", json=reading).status_code == 400
+    for _ in range(WARMUP_SAMPLES):
+        r = client.post("/predict", json=reading)
+    assert r.status_code == 200
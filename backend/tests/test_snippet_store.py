@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from snippet_store import CHUNK_SIZE, FLAG_ZLIB, SnippetStore, BlobReader
+
+KEY = b"k" * 32
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnippetStore(str(tmp_path), KEY)
+
+
+def blob_file(store, event_id):
+    return store.reader(event_id).path
+
+
+def test_round_trip_across_chunks(store):
+    data = os.urandom(CHUNK_SIZE * 2 + 123)
+    store.put("e1", data, {"user_id": "u"})
+    reader = store.reader("e1")
+    assert reader.n_chunks == 3
+    assert reader.read_all() == data
+    assert dict(store.snippet_meta()) == {"e1": {"user_id": "u"}}
+
+
+def test_identical_clips_are_stored_once(store):
+    data = b"clip" * 1000
+    first = store.put("e1", data)
+    second = store.put("e2", data)
+    assert (first["deduplicated"], second["deduplicated"]) == (False, True)
+    assert second["refs"] == 2
+    assert store.stats()["blobs"] == 1
+
+    path = blob_file(store, "e1")
+    assert store.release("e1") and os.path.exists(path)
+    assert store.release("e2") and not os.path.exists(path)
+    assert store.stats() == {"events": 0, "blobs": 0, "logical_bytes": 0, "stored_bytes": 0}
+
+
+def test_replacing_a_snippet_drops_the_old_blob(store):
+    store.put("e1", b"old" * 100)
+    old = blob_file(store, "e1")
+    store.put("e1", b"new" * 100)
+    assert not os.path.exists(old)
+    assert store.reader("e1").read_all() == b"new" * 100
+
+
+def test_compresses_only_when_it_helps(store):
+    store.put("text", b"a" * CHUNK_SIZE)
+    store.put("video", os.urandom(CHUNK_SIZE))
+    assert store.reader("text").entries[0][2] & FLAG_ZLIB
+    assert not store.reader("video").entries[0][2] & FLAG_ZLIB
+    assert store.stats()["stored_bytes"] < CHUNK_SIZE * 2
+
+
+def test_tampering_is_detected(store):
+    from cryptography.exceptions import InvalidTag
+
+    store.put("e1", os.urandom(1000))
+    path = blob_file(store, "e1")
+    with open(path, "r+b") as f:
+        f.seek(10)
+        byte = f.read(1)
+        f.seek(10)
+        f.write(bytes([byte[0] ^ 1]))
+    reader = BlobReader(path, store.aead)
+    offset, length, _ = reader.entries[0]
+    with open(path, "rb") as f:
+        f.seek(offset)
+        sealed = f.read(length)
+    with pytest.raises(InvalidTag):
+        reader.open_chunk(0, sealed)
+
+
+def test_index_survives_reopen(tmp_path):
+    SnippetStore(str(tmp_path), KEY).put("e1", b"clip" * 10, {"user_id": "u"})
+    reopened = SnippetStore(str(tmp_path), KEY)
+    assert reopened.reader("e1").read_all() == b"clip" * 10
+    assert reopened.stats()["events"] == 1
+
+
+def test_upload_reports_deduplication(client):
+    reading = {"user_id": "clip-driver", "mode": "instant", "eye_ratio": 0.2,
+               "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+    events = [client.post("/predict", json=reading).json()["event_id"] for _ in range(2)]
+    results = [
+        client.post(f"/timeline/clip-driver/{e}/snippet", files={"file": ("c.mp4", b"same clip")}).json()
+        for e in events
+    ]
+    assert [r["deduplicated"] for r in results] == [False, True]
+    assert client.get(f"/timeline/clip-driver/{events[1]}").json()["has_snippet"]
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import main
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+
+
+def test_importing_main_skips_heavy_clients():
+    code = (
+        "import sys, main; "
+        "print(sorted(m for m in ('twilio', 'requests', 'cryptography') if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=APP_DIR,
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_twilio_is_optional(monkeypatch):
+    monkeypatch.delenv("TWILIO_ACCOUNT_SID", raising=False)
+    monkeypatch.setattr(main, "_twilio_client", None)
+    monkeypatch.setattr(main, "_twilio_checked", False)
+    assert main.get_twilio_client() is None
+    assert main._twilio_checked
+
+
+def test_factory_builds_independent_apps(client):
+    other = main.create_app()
+    assert other is not main.app
+    assert {r.path for r in other.routes} >= {"/predict", "/timeline/{user_id}", "/history"}
+    assert client.get("/").json() == {"message": "NeuroDrive backend running"}
@@ -0,0 +1,114 @@
+import pickle
+import uuid
+
+from event_ids import EPOCH_MS, SEQUENCE_BITS, WORKER_BITS
+from timeline_index import DriverTimelineIndex
+
+
+class CountingList(list):
+    reads = 0
+
+    def __getitem__(self, i):
+        CountingList.reads += 1
+        return super().__getitem__(i)
+
+
+def compact_id(ms: int) -> str:
+    return format((ms - EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS) | 1 << SEQUENCE_BITS, "016x")
+
+
+START_MS = 1_760_000_000_000
+
+
+def build(n):
+    """n events, one every 100 ms."""
+    index = DriverTimelineIndex()
+    for i in range(n):
+        ms = START_MS + i * 100
+        index.add({"event_id": compact_id(ms), "event_type": "normal", "tags": []}, ms / 1000)
+    return index
+
+
+def test_compact_ids_found_by_bisect():
+    index = build(5000)
+    index.events = CountingList(index.events)
+    target = index.events[1234]["event_id"]
+    CountingList.reads = 0
+    assert index.find(target) == 1234
+
+    # Unknown, well-formed IDs (older, newer, or in range) never scan
+    for unknown in ("0000000000000001", compact_id(START_MS + 250), "f" * 16):
+        CountingList.reads = 0
+        assert index.find(unknown) is None
+        assert CountingList.reads < 100
+
+
+def test_legacy_ids_still_scanned():
+    index = build(10)
+    legacy = str(uuid.uuid4())
+    index.add({"event_id": legacy, "event_type": "normal", "tags": []}, index.times[-1])
+    assert index.find(legacy) == 10
+    assert index.find(str(uuid.uuid4())) is None
+
+
+def tagged(n, retention=10000):
+    """n events one second apart; every third is a warning tagged 'yawn'."""
+    index = DriverTimelineIndex(retention)
+    for i in range(n):
+        warning = i % 3 == 0
+        index.add({
+            "event_id": compact_id(START_MS + i * 1000),
+            "event_type": "fatigue_warning" if warning else "normal",
+            "tags": ["fatigue_warning", "yawn"] if warning else [],
+            "fatigue_score": i % 100,
+        }, START_MS / 1000 + i)
+    return index
+
+
+def test_time_range_and_filters():
+    index = tagged(30)
+    t0 = START_MS / 1000
+    events, cursor = index.query(since=t0 + 10, until=t0 + 19)
+    assert [e["fatigue_score"] for e in events] == list(range(10, 20))
+    assert cursor is None
+
+    events, _ = index.query(event_type="fatigue_warning", tags=["yawn"], min_score=10)
+    assert [e["fatigue_score"] for e in events] == [12, 15, 18, 21, 24, 27]
+    assert index.query(tags=["yawn", "head_tilt"]) == ([], None)
+
+
+def test_cursor_paging_and_after():
+    index = tagged(30)
+    page, cursor = index.query(limit=10)
+    assert [e["fatigue_score"] for e in page] == list(range(20, 30))
+    page, cursor = index.query(limit=10, cursor=cursor)
+    assert [e["fatigue_score"] for e in page] == list(range(10, 20))
+
+    events, _ = index.query(after=index.find(page[-1]["event_id"]))
+    assert [e["fatigue_score"] for e in events] == list(range(20, 30))
+
+
+def test_retention_trims_oldest_and_keeps_positions():
+    index = tagged(50, retention=20)
+    first = index.find(compact_id(START_MS + 49 * 1000))
+    for i in range(50, 2000):
+        index.add({
+            "event_id": compact_id(START_MS + i * 1000), "event_type": "normal",
+            "tags": [], "fatigue_score": i % 100,
+        }, START_MS / 1000 + i)
+
+    assert len(index) <= 20 + 1000
+    assert index.find(compact_id(START_MS)) is None
+    assert all(p >= index.base for p in index.by_tag.get("yawn", []))
+    # Positions handed out before the trim still page from the same spot
+    newest = index.find(compact_id(START_MS + 1999 * 1000))
+    assert newest == 1999 and first == 49
+    events, _ = index.query(cursor=newest, limit=2)
+    assert [e["event_id"] for e in events] == [
+        compact_id(START_MS + 1997 * 1000), compact_id(START_MS + 1998 * 1000),
+    ]
+    assert index.query(cursor=first) == ([], None)
+
+    clone = pickle.loads(pickle.dumps(index))
+    assert clone.find(compact_id(START_MS + 1999 * 1000)) == 1999
+    assert clone.query(tags=["yawn"]) == index.query(tags=["yawn"])
@@ -0,0 +1,80 @@
+import os
+import time
+
+import pytest
+
+from snippet_store import CHUNK_SIZE, SnippetStore
+from uploads import UPLOAD_TTL_SECONDS, UploadError, UploadManager
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnippetStore(str(tmp_path), b"k" * 32)
+
+
+def open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def test_resent_bytes_are_skipped(store):
+    data = os.urandom(CHUNK_SIZE + 500)
+    session = UploadManager().create(store, "u", "e1", len(data), "video/mp4")
+    assert session.append(0, data[:1000]) == 1000
+    assert session.append(500, data[500:2000]) == 2000
+    assert session.append(0, data[:100]) == 2000
+    with pytest.raises(UploadError) as e:
+        session.append(3000, data[3000:])
+    assert e.value.status_code == 409
+    with pytest.raises(UploadError) as e:
+        session.append(2000, data[2000:] + b"extra")
+    assert e.value.status_code == 413
+
+    session.append(2000, data[2000:])
+    blob_id, (tmp, _) = session.finish()
+    assert blob_id == store.content_id(data)
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_pending_uploads_hold_no_file_descriptors(store):
+    manager = UploadManager()
+    before = open_fds()
+    sessions = [manager.create(store, "u", f"e{i}", 100, "video/mp4") for i in range(20)]
+    for session in sessions:
+        session.append(0, b"x" * 50)
+    assert open_fds() == before
+
+
+def test_expiry_skips_a_session_in_use(store):
+    manager = UploadManager()
+    busy = manager.create(store, "u", "busy", 100, "video/mp4")
+    idle = manager.create(store, "u", "idle", 100, "video/mp4")
+    manager.get(busy.upload_id, hold=True)
+
+    manager.expire(time.time() + UPLOAD_TTL_SECONDS + 1)
+    assert manager.is_open(busy) and not manager.is_open(idle)
+    assert not os.path.exists(idle.writer.path)
+    assert busy.append(0, b"x" * 100) == 100
+
+    manager.release(busy)
+    manager._last_expire = 0.0
+    manager.expire(time.time() + UPLOAD_TTL_SECONDS + 1)
+    assert not manager.is_open(busy)
+
+
+def test_resumable_upload_endpoints(client):
+    reading = {"user_id": "upload-driver", "mode": "instant", "eye_ratio": 0.2,
+               "blink_count": 3, "head_tilt": 0.0, "yawn_ratio": 0.1}
+    event_id = client.post("/predict", json=reading).json()["event_id"]
+    data = os.urandom(3000)
+
+    created = client.post(f"/timeline/upload-driver/{event_id}/snippet/uploads",
+                          json={"size": len(data), "content_type": "video/mp4"}).json()
+    url = f"/snippet/uploads/{created['upload_id']}"
+    assert client.put(url, params={"offset": 0}, content=data[:1000]).json()["next_offset"] == 1000
+    assert client.put(url, params={"offset": 2000}, content=data[2000:]).status_code == 409
+    assert client.post(f"{url}/complete").status_code == 409
+    assert client.put(url, params={"offset": 800}, content=data[800:]).json()["next_offset"] == 3000
+
+    assert client.post(f"{url}/complete").status_code == 200
+    assert client.put(url, params={"offset": 0}, content=data).status_code == 404
+    assert client.get(f"/timeline/upload-driver/{event_id}/snippet").content == data